@@ -175,7 +175,7 @@ class DecentralizedMaaSModel(Model):
                 "Active Commuters": lambda m: self.count_active_commuters(),
                 "Active Providers": lambda m: self.count_active_providers(),
                 "Total Transactions": lambda m: len(self.marketplace.transaction_history),
-                "Active NFT Listings": lambda m: sum(1 for listing in self.marketplace.listings.values() if listing['status'] == 'active'),
+                "Active NFT Listings": lambda m: len(self.marketplace.active_listings),
                 "Average NFT Price": lambda m: self.calculate_average_nft_price(),
                 "Completed Trips": lambda m: self.count_completed_trips(),
                 "Execution Time": lambda m: self.get_average_execution_time()
@@ -1403,8 +1403,9 @@ class DecentralizedMaaSModel(Model):
     def calculate_average_nft_price(self):
         """Calculate average price of active NFT listings"""
         self.logger.info(f"Current marketplace transactions: {len(self.marketplace.transaction_history)}")
-        active_listings = [listing for listing in self.marketplace.listings.values() 
-                        if listing.get('status') == 'active']
+        # The marketplace's active listing table holds exactly the active listings
+        active_listings = self.marketplace.active_listings
+        active_count = len(active_listings)
         
         # IMPORTANT FIX: Sync transaction count with blockchain before calculating stats
         if self.transaction_count == 0 and hasattr(self.blockchain_interface, 'stats'):
@@ -1418,13 +1419,13 @@ class DecentralizedMaaSModel(Model):
             self.completed_trips_count = self.transaction_count
             self.logger.info(f"Synced completed trips count from transactions: {self.transaction_count}")
         
-        if not active_listings:
+        if not active_count:
             return 0
         
         # Update active listings count for statistics
-        self.active_listings_count = len(active_listings)
+        self.active_listings_count = active_count
             
-        return sum(listing.get('current_price', 0) for listing in active_listings) / len(active_listings)
+        return float(active_listings.current_price[:active_count].sum()) / active_count
     
     def count_active_commuters(self):
         """Count active commuters with ongoing requests"""
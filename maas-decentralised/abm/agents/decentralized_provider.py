@@ -511,6 +511,7 @@ class PublicTransportProvider(DecentralizedProvider):
                 # Store in marketplace database
                 with self.marketplace.marketplace_db_lock:
                     self.marketplace.marketplace_db['offers'][segment_id] = offer
+                    self.marketplace.marketplace_version += 1
 
                 # Track locally
                 self.active_segments[segment_id] = offer
@@ -13,6 +13,128 @@ from collections import defaultdict
 import uuid
 from contextlib import nullcontext
 
+try:
+    from numba import njit  # Optional: JIT-compiles the array kernels below
+except ImportError:
+    njit = None
+
+
+def _jit(func):
+    """Compile func with numba when it is installed; otherwise use the NumPy version as-is"""
+    return njit(cache=True)(func) if njit is not None else func
+
+
+@_jit
+def _price_decay_kernel(initial_price, min_price, listing_time, decay_rate, service_time, current_time):
+    """Time-decayed listing prices over parallel arrays"""
+    time_elapsed = current_time - listing_time
+    time_to_service = service_time - current_time
+    
+    # Price decay accelerates as service time approaches
+    decay_factor = np.exp(-decay_rate * time_elapsed * (1 + 1 / np.maximum(1.0, time_to_service / 3600)))
+    decayed = np.maximum(min_price, initial_price * decay_factor)
+    
+    # Service time passed: set to minimum price
+    return np.where(time_to_service <= 0, min_price, decayed)
+
+
+@_jit
+def _search_mask(origin_x, origin_y, dest_x, dest_y, service_time, price,
+                 origin_center_x, origin_center_y, origin_radius,
+                 dest_center_x, dest_center_y, dest_radius,
+                 min_time, max_time, max_price):
+    """Boolean mask of listings inside both search areas, the time window and the price cap"""
+    origin_dist = np.sqrt((origin_x - origin_center_x) ** 2 + (origin_y - origin_center_y) ** 2)
+    dest_dist = np.sqrt((dest_x - dest_center_x) ** 2 + (dest_y - dest_center_y) ** 2)
+    return ((price <= max_price)
+            & (origin_dist <= origin_radius)
+            & (dest_dist <= dest_radius)
+            & (service_time >= min_time)
+            & (service_time <= max_time))
+
+
+if njit is not None:
+    # Compile (or load from numba's cache) at import so the first tick doesn't pay for it
+    _one = np.ones(1)
+    _price_decay_kernel(_one, _one, _one, _one, _one, 0.0)
+    _search_mask(_one, _one, _one, _one, _one, _one, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 1.0, 1.0)
+    del _one
+
+class ListingTable:
+    """
+    Structure-of-arrays mirror of the active listings' numeric fields.
+    Rows are kept dense (removal swaps in the last row) and token_to_row maps an
+    NFT ID to its row; seq records listing order so results can follow the
+    insertion order of NFTMarketplace.listings.
+    """
+    FIELDS = ('initial_price', 'current_price', 'min_price', 'listing_time', 'decay_rate',
+              'service_time', 'origin_x', 'origin_y', 'dest_x', 'dest_y', 'seq')
+
+    def __init__(self, capacity=64):
+        self.ids = []
+        self.token_to_row = {}
+        for name in self.FIELDS:
+            setattr(self, name, np.empty(capacity))
+        self.dynamic = np.empty(capacity, dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, nft_id):
+        return nft_id in self.token_to_row
+
+    def _grow(self):
+        capacity = 2 * len(self.dynamic)
+        for name in self.FIELDS + ('dynamic',):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def add(self, nft_id, listing, seq):
+        """Add (or replace) the row for an active listing"""
+        if nft_id in self.token_to_row:
+            self.remove(nft_id)
+        if len(self.ids) == len(self.dynamic):
+            self._grow()
+
+        row = len(self.ids)
+        details = listing['details']
+        origin = details.get('origin') or (np.nan, np.nan)
+        destination = details.get('destination') or (np.nan, np.nan)
+        self.ids.append(nft_id)
+        self.token_to_row[nft_id] = row
+        self.initial_price[row] = listing['initial_price']
+        self.current_price[row] = listing['current_price']
+        self.min_price[row] = listing['min_price']
+        self.listing_time[row] = listing['listing_time']
+        self.decay_rate[row] = listing['decay_rate']
+        self.service_time[row] = details['service_time']
+        self.origin_x[row], self.origin_y[row] = origin[0], origin[1]
+        self.dest_x[row], self.dest_y[row] = destination[0], destination[1]
+        self.seq[row] = seq
+        self.dynamic[row] = listing['dynamic_pricing']
+
+    def remove(self, nft_id):
+        """Drop a listing's row once it is no longer active"""
+        row = self.token_to_row.pop(nft_id, None)
+        if row is None:
+            return
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self.ids[row] = moved_id
+            self.token_to_row[moved_id] = row
+            for name in self.FIELDS + ('dynamic',):
+                column = getattr(self, name)
+                column[row] = column[last]
+        self.ids.pop()
+
+    def in_listing_order(self, rows):
+        """Reorder row indices to follow listing order"""
+        return rows[np.argsort(self.seq[rows], kind='stable')]
+
+
 class NFTMarketplace:
     """
     NFT marketplace handling both order book and AMM-based market mechanisms
@@ -42,6 +164,8 @@ class NFTMarketplace:
         
         # Market metadata
         self.listings = {}
+        self._listing_seq = {}  # nft_id -> position of its key in self.listings
+        self.active_listings = ListingTable()  # Array view of the active listings
         self.transaction_history = []
         
         # Market analytics
@@ -67,6 +191,8 @@ class NFTMarketplace:
         with ctx:
             offers = db.setdefault('offers', {})
             offers[offer['offer_id']] = offer
+            if hasattr(self.blockchain_interface, "marketplace_version"):
+                self.blockchain_interface.marketplace_version += 1
         self.logger.info(f"📢 Broadcast offer {offer['offer_id']} ({offer.get('mode')}) at price {offer.get('price')}")
 
     def list_nft(self, owner_id, nft_id, nft_details, listing_params):
@@ -109,6 +235,8 @@ class NFTMarketplace:
         
         # Store listing locally
         self.listings[nft_id] = listing
+        seq = self._listing_seq.setdefault(nft_id, len(self._listing_seq))
+        self.active_listings.add(nft_id, listing, seq)
         
         # Add to order book if using order book model
         if self.market_type in ["order_book", "hybrid"]:
@@ -218,52 +346,43 @@ class NFTMarketplace:
     def update_listings(self):
         """Update pricing for all listings based on time and market conditions."""
         current_time = self.model.schedule.time
-        
-        # Update order book listings
-        for nft_id, listing in list(self.listings.items()):
-            if listing['status'] != 'active':
-                continue
-                
-            old_price = listing['current_price']
-            
-            # Update dynamic pricing if enabled
-            if listing['dynamic_pricing']:
-                # Calculate time-based price decay
-                listing_time = listing['listing_time']
-                time_elapsed = current_time - listing_time
-                service_time = listing['details']['service_time']
-                time_to_service = service_time - current_time
-                
-                # Price decay accelerates as service time approaches
-                if time_to_service <= 0:
-                    # Service time passed, set to minimum price
-                    new_price = listing['min_price']
-                else:
-                    # Use exponential decay based on time elapsed and time to service
-                    decay_factor = math.exp(-listing['decay_rate'] * time_elapsed * (1 + 1/max(1, time_to_service/3600)))
-                    new_price = max(
-                        listing['min_price'],
-                        listing['initial_price'] * decay_factor
-                    )
+        table = self.active_listings
+        count = len(table)
+        
+        # Update dynamic pricing for all listings at once, straight from the arrays
+        dynamic = table.in_listing_order(np.flatnonzero(table.dynamic[:count]))
+        if len(dynamic):
+            old_prices = table.current_price[dynamic]
+            new_prices = _price_decay_kernel(
+                table.initial_price[dynamic], table.min_price[dynamic], table.listing_time[dynamic],
+                table.decay_rate[dynamic], table.service_time[dynamic], float(current_time)
+            )
+            table.current_price[dynamic] = new_prices
+            for row, old_price, new_price in zip(dynamic.tolist(), old_prices.tolist(), new_prices.tolist()):
+                nft_id = table.ids[row]
                 
                 # Update price in listing
-                listing['current_price'] = new_price
+                self.listings[nft_id]['current_price'] = new_price
                 
                 # Update order book if price changed significantly (>1%)
                 if abs(old_price - new_price) / old_price > 0.01:
                     self._update_order_book_price(nft_id, old_price, new_price)
+        
+        # Check if NFTs have expired (service time passed)
+        expired = table.in_listing_order(np.flatnonzero(current_time > table.service_time[:count]))
+        for nft_id in [table.ids[row] for row in expired.tolist()]:
+            listing = self.listings[nft_id]
             
-            # Check if NFT has expired (service time passed)
-            if current_time > listing['details']['service_time']:
-                # Mark as expired
-                listing['status'] = 'expired'
-                
-                # Remove from order book
-                if self.market_type in ["order_book", "hybrid"]:
-                    self._remove_from_order_book(nft_id, listing['current_price'])
+            # Mark as expired
+            listing['status'] = 'expired'
+            table.remove(nft_id)
+            
+            # Remove from order book
+            if self.market_type in ["order_book", "hybrid"]:
+                self._remove_from_order_book(nft_id, listing['current_price'])
 
-                    
-                self.logger.info(f"NFT {nft_id} expired at time {current_time}")
+                
+            self.logger.info(f"NFT {nft_id} expired at time {current_time}")
         
         # Match any outstanding bids
         if self.market_type in ["order_book", "hybrid"]:
@@ -500,39 +619,28 @@ class NFTMarketplace:
         
         max_price = search_params.get('max_price', 999999)
         
-        # Search active listings
-        for nft_id, listing in self.listings.items():
-            if listing['status'] != 'active':
-                continue
-                
-            # Check price constraint
-            if listing['current_price'] > max_price:
-                continue
-                
-            # Get NFT details
-            nft_details = listing['details']
-            
-            # Check origin constraint
-            origin_dist = self._calculate_distance(origin_center, nft_details['origin'])
-            if origin_dist > origin_radius:
-                continue
-                
-            # Check destination constraint
-            dest_dist = self._calculate_distance(dest_center, nft_details['destination'])
-            if dest_dist > dest_radius:
-                continue
-                
-            # Check time window constraint
-            service_time = nft_details['service_time']
-            if service_time < min_time or service_time > max_time:
-                continue
-                
-            # NFT matches all constraints, add to results
+        table = self.active_listings
+        count = len(table)
+        if not count:
+            return results
+        
+        # Filter the active listings' arrays in one pass
+        mask = _search_mask(
+            table.origin_x[:count], table.origin_y[:count], table.dest_x[:count], table.dest_y[:count],
+            table.service_time[:count], table.current_price[:count],
+            float(origin_center[0]), float(origin_center[1]), float(origin_radius),
+            float(dest_center[0]), float(dest_center[1]), float(dest_radius),
+            float(min_time), float(max_time), float(max_price)
+        )
+        
+        for row in table.in_listing_order(np.flatnonzero(mask)).tolist():
+            nft_id = table.ids[row]
+            listing = self.listings[nft_id]
             results.append({
                 'nft_id': nft_id,
                 'price': listing['current_price'],
                 'owner_id': listing['owner_id'],
-                'details': nft_details
+                'details': listing['details']
             })
         
         return results
@@ -566,7 +674,7 @@ class NFTMarketplace:
             Boolean indicating success
         """
         # Check if NFT exists and is active
-        if nft_id not in self.listings or self.listings[nft_id]['status'] != 'active':
+        if nft_id not in self.active_listings:
             self.logger.warning(f"NFT {nft_id} not available for purchase")
             return False
             
@@ -589,6 +697,7 @@ class NFTMarketplace:
         if transaction_success:
             # Update listing status
             listing['status'] = 'sold'
+            self.active_listings.remove(nft_id)
             
             # Remove from order book
             if self.market_type in ["order_book", "hybrid"]:
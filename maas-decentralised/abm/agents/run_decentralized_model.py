@@ -266,6 +266,15 @@ class SimplifiedMaaSModel(Model):
         # Treat completed trips as implicit demand to stabilize match rate
         self.total_requests = max(self.total_requests, db_requests + self.total_completed)
 
+def _booking_profile(booking, key, profiles, id_key):
+    """Profile for a booking: embedded copy if present, else resolved from the summary map by id"""
+    profile = booking.get(key)
+    if profile:
+        return profile
+    entity_id = booking.get(id_key)
+    return profiles.get(str(entity_id)) or profiles.get(entity_id) or {}
+
+
 def run_simulation(steps=100, num_commuters=20, num_providers=10, no_plots=False, network='localhost', rpc_url=None, chain_id=None, export_db=False, enable_proactive_segments=True):
     """
     Run the simplified MaaS simulation
@@ -473,6 +482,8 @@ def run_simulation(steps=100, num_commuters=20, num_providers=10, no_plots=False
 
         # Display detailed booking information
         booking_details = blockchain_stats.get('booking_details', [])
+        provider_profiles = blockchain_stats.get('provider_profiles', {})
+        commuter_profiles = blockchain_stats.get('commuter_profiles', {})
         if booking_details:
             print(f"\n📋 DETAILED BOOKING RECORDS:")
             print(f"   Total bookings completed: {len(booking_details)}")
@@ -485,7 +496,7 @@ def run_simulation(steps=100, num_commuters=20, num_providers=10, no_plots=False
                 print(f"      • Provider ID: {booking.get('provider_id', 'N/A')}")
 
                 # Provider details
-                provider_profile = booking.get('provider_profile', {})
+                provider_profile = _booking_profile(booking, 'provider_profile', provider_profiles, 'provider_id')
                 if provider_profile:
                     print(f"      • Provider Type: {provider_profile.get('mode', 'N/A')}")
                     print(f"      • Provider Name: {provider_profile.get('name', 'N/A')}")
@@ -496,7 +507,7 @@ def run_simulation(steps=100, num_commuters=20, num_providers=10, no_plots=False
                 print(f"      • Destination: {booking.get('destination', 'N/A')}")
 
                 # Commuter details
-                commuter_profile = booking.get('commuter_profile', {})
+                commuter_profile = _booking_profile(booking, 'commuter_profile', commuter_profiles, 'commuter_id')
                 if commuter_profile:
                     print(f"      • Commuter Income Level: {commuter_profile.get('income_level', 'N/A')}")
                     print(f"      • Commuter Preferences: {commuter_profile.get('preferences', 'N/A')}")
@@ -516,7 +527,7 @@ def run_simulation(steps=100, num_commuters=20, num_providers=10, no_plots=False
 
             provider_types = {}
             for booking in booking_details:
-                provider_profile = booking.get('provider_profile', {})
+                provider_profile = _booking_profile(booking, 'provider_profile', provider_profiles, 'provider_id')
                 provider_type = provider_profile.get('mode', 'Unknown')
                 provider_types[provider_type] = provider_types.get(provider_type, 0) + 1
 
@@ -604,11 +615,13 @@ def run_simulation(steps=100, num_commuters=20, num_providers=10, no_plots=False
                     print(f"ℹ️ No commuter PT records found; adding {len(pt_records)} provider PT records to preserve mode coverage.")
                     bookings += pt_records
 
+            provider_profiles = getattr(model.blockchain_interface, 'provider_profiles', {})
             simple_bookings = []
             for b in bookings:
                 # Derive mode with robust fallbacks
                 mode_val = b.get('provider_type') or b.get('mode') \
-                    or b.get('provider_profile', {}).get('mode_type') or 'unknown'
+                    or _booking_profile(b, 'provider_profile', provider_profiles, 'provider_id').get('mode_type') \
+                    or 'unknown'
 
                 # Derive start/duration/end
                 duration_val = b.get('duration')
@@ -980,15 +993,18 @@ def print_financial_analysis_table(blockchain_stats):
 
     # Calculate financial metrics
     booking_details = blockchain_stats.get('booking_details', [])
+    provider_profiles = blockchain_stats.get('provider_profiles', {})
     total_revenue = sum(float(booking.get('price', 0)) for booking in booking_details if booking.get('price'))
     avg_price = total_revenue / len(booking_details) if booking_details else 0
 
     # Provider type breakdown
     provider_types = {}
+    booking_types = []
     for booking in booking_details:
-        provider_profile = booking.get('provider_profile', {})
+        provider_profile = _booking_profile(booking, 'provider_profile', provider_profiles, 'provider_id')
         provider_type = provider_profile.get('mode', 'Unknown')
         provider_types[provider_type] = provider_types.get(provider_type, 0) + 1
+        booking_types.append(provider_profile.get('mode'))
 
     financial_data = [
         ("Total Revenue", f"${total_revenue:.2f}", "100.0%", "📈 Positive"),
@@ -1000,8 +1016,8 @@ def print_financial_analysis_table(blockchain_stats):
     # Add provider type revenue breakdown
     for provider_type, count in provider_types.items():
         percentage = (count / len(booking_details)) * 100 if booking_details else 0
-        type_revenue = sum(float(booking.get('price', 0)) for booking in booking_details
-                          if booking.get('provider_profile', {}).get('mode') == provider_type)
+        type_revenue = sum(float(booking.get('price', 0)) for booking, mode in zip(booking_details, booking_types)
+                          if mode == provider_type)
         financial_data.append((f"{provider_type.title()} Revenue", f"${type_revenue:.2f}",
                              f"{percentage:.1f}%", "📊 Active"))
 
@@ -1049,6 +1065,7 @@ def print_booking_details_table(blockchain_stats):
     print("-" * 120)
 
     booking_details = blockchain_stats.get('booking_details', [])
+    provider_profiles = blockchain_stats.get('provider_profiles', {})
 
     if booking_details:
         # Show first 10 bookings in table format
@@ -1056,7 +1073,7 @@ def print_booking_details_table(blockchain_stats):
             booking_id = str(booking.get('booking_id', 'N/A'))[:18] + "..." if len(str(booking.get('booking_id', 'N/A'))) > 18 else str(booking.get('booking_id', 'N/A'))
             commuter_id = str(booking.get('commuter_id', 'N/A'))
             provider_id = str(booking.get('provider_id', 'N/A'))
-            provider_type = booking.get('provider_profile', {}).get('mode', 'N/A')[:6]
+            provider_type = _booking_profile(booking, 'provider_profile', provider_profiles, 'provider_id').get('mode', 'N/A')[:6]
             price = f"${booking.get('price', 0):.2f}"
 
             origin = booking.get('origin', [])
@@ -1084,6 +1101,7 @@ def print_provider_performance_table(blockchain_stats):
     print("-" * 100)
 
     booking_details = blockchain_stats.get('booking_details', [])
+    provider_profiles = blockchain_stats.get('provider_profiles', {})
 
     if booking_details:
         # Analyze by provider type
@@ -1091,7 +1109,7 @@ def print_provider_performance_table(blockchain_stats):
         total_revenue = sum(float(booking.get('price', 0)) for booking in booking_details)
 
         for booking in booking_details:
-            provider_profile = booking.get('provider_profile', {})
+            provider_profile = _booking_profile(booking, 'provider_profile', provider_profiles, 'provider_id')
             provider_type = provider_profile.get('mode', 'Unknown')
             price = float(booking.get('price', 0))
 
@@ -76,6 +76,7 @@ class SimulationExporter:
             Base.metadata.create_all(self.engine)
             # Ensure schema evolutions (like income_level) are present
             self._ensure_commuter_income_column()
+            self._ensure_sqlite_indexes()
             self.Session = sessionmaker(bind=self.engine)
             self.logger.info(f"Using SQLite database: {connection_string}")
         else:
@@ -179,6 +180,20 @@ class SimulationExporter:
                     self.logger.info("Added income_level column to commuters table")
         except Exception as e:
             self.logger.warning(f"Could not ensure income_level column: {e}")
+
+    def _ensure_sqlite_indexes(self):
+        """Switch to WAL journaling and add indexes missing from tables created before they were declared (SQLite only)."""
+        if not USE_SQLITE:
+            return
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("PRAGMA journal_mode=WAL;"))
+            # create_all only indexes tables it creates; older databases get them here
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(self.engine, checkfirst=True)
+        except Exception as e:
+            self.logger.warning(f"Could not ensure SQLite indexes: {e}")
     
     def _export_run_metadata(self, session, run_id: str, model, config: Dict) -> SimulationRun:
         """Export simulation run metadata"""
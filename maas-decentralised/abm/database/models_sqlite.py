@@ -114,6 +114,9 @@ class Commuter(Base):
     total_spent = Column(Float, default=0.0)
     avg_wait_time = Column(Float)
     income_level = Column(String(20), default="unknown")
+
+    # Index for per-run analysis queries (ordered by spend)
+    __table_args__ = (Index('idx_commuters_run', 'run_id', 'total_spent'),)
     
     run = relationship("SimulationRun", back_populates="commuters")
 
@@ -133,6 +136,9 @@ class Provider(Base):
     avg_price = Column(Float)
     utilization_rate = Column(Float)
 
+    # Index for per-run analysis queries (ordered by revenue)
+    __table_args__ = (Index('idx_providers_run', 'run_id', 'total_revenue'),)
+
     run = relationship("SimulationRun", back_populates="providers")
     segments = relationship("BundleSegment", back_populates="provider")
 
@@ -154,6 +160,9 @@ class TravelRequest(Base):
     matched_at_tick = Column(Integer)
     final_price = Column(Float)
     num_bids_received = Column(Integer, default=0)
+
+    # Index for per-run analysis queries (filtered on price)
+    __table_args__ = (Index('idx_requests_run', 'run_id', 'final_price'),)
     
     run = relationship("SimulationRun", back_populates="requests")
 
@@ -178,6 +187,9 @@ class Bundle(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     created_at_tick = Column(Integer)
 
+    # Index for per-run analysis queries
+    __table_args__ = (Index('idx_bundles_run', 'run_id'),)
+
     run = relationship("SimulationRun", back_populates="bundles")
     segments = relationship("BundleSegment", back_populates="bundle", cascade="all, delete-orphan")
     reservations = relationship("Reservation", back_populates="bundle", cascade="all, delete-orphan")
@@ -558,6 +570,9 @@ class GasMetrics(Base):
 
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    # Index for per-run time-series queries
+    __table_args__ = (Index('idx_gas_run_tick', 'run_id', 'tick'),)
+
     run = relationship("SimulationRun", back_populates="gas_metrics")
 
 
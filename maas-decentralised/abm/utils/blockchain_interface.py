@@ -4,12 +4,14 @@ Provides an optimized bridge between ABM simulation and blockchain contracts
 with support for NFT marketplace operations, caching, and asynchronous transactions.
 """
 
+import functools
 import json
 import hashlib
 import logging
 import time
 import uuid
 from web3 import Web3
+from hexbytes import HexBytes
 """
 Web3 v6 removed the old geth_poa_middleware symbol. To keep compatibility
 without changing behavior, import the POA middleware lazily and support both
@@ -17,15 +19,24 @@ names (v5: geth_poa_middleware, v6: ExtraDataToPOAMiddleware).
 """
 from concurrent.futures import ThreadPoolExecutor
 import os
-from typing import Dict, List, Any, Tuple, Optional, Union, Callable
+from typing import Dict, List, Any, Tuple, Optional, Union, Callable, Iterator
 from dataclasses import dataclass, field
 from collections import deque
 import math
+from eth_abi import encode as abi_encode
 from eth_account import Account
+from eth_utils import function_abi_to_4byte_selector
 from collections import deque, defaultdict
 import threading
 from enum import Enum
 
+try:
+    import orjson  # Optional: faster parsing of config, deployment and ABI files
+except ImportError:
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
 
 class TransactionState(Enum):
     """Transaction state machine for proper state management"""
@@ -56,6 +67,51 @@ class TransactionData:
     rollback_data: Optional[dict] = None  # Data needed for rollback
 
 
+def _abi_type(param):
+    """Canonical ABI type string for an ABI input/output entry, expanding tuple components"""
+    abi_type = param['type']
+    if abi_type.startswith('tuple'):
+        return f"({','.join(_abi_type(c) for c in param['components'])}){abi_type[len('tuple'):]}"
+    return abi_type
+
+
+# Provider-name heuristic for mode attribution when no explicit mode is known
+# (token, mode) pairs in match priority order: the first token found in the name wins
+_MODE_TOKENS = (('bus', 'bus'), ('train', 'train'), ('uber', 'car'),
+                ('taxi', 'car'), ('car', 'car'), ('bike', 'bike'))
+
+
+def _mode_from_name(name):
+    """Mode of the highest-priority token in a lowercased provider name, or None"""
+    for token, mode in _MODE_TOKENS:
+        if token in name:
+            return mode
+    return None
+
+
+# Source overrides that name a transport mode, and booking sources counted as secondary-market sales
+_ALLOWED_SOURCES = frozenset({'bus', 'train', 'car', 'bike'})
+_SECONDARY_SOURCES = frozenset({'nft_market', 'secondary', 'market'})
+
+
+@functools.lru_cache(maxsize=1024)
+def _encode_calldata(selector, input_types, args):
+    """ABI-encode calldata for a precompiled function; memoized for repeated identical calls"""
+    return selector + abi_encode(list(input_types), list(args))
+
+
+class CachedGetDict(dict):
+    """dict whose ``get`` is pre-bound as ``cached_get`` for hot lookup paths"""
+    __slots__ = ('cached_get',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cached_get = super().get
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
 class BlockchainInterface:
     def __init__(self, config_file="blockchain_config.json", using_hardhat=True,
                  max_workers=None, cache_ttl=300, async_mode=False):
@@ -79,6 +135,12 @@ class BlockchainInterface:
         self.w3 = self._connect_to_blockchain(using_hardhat)
         self.contracts = self._load_contracts()
         self.gas_limit = 1000000  # Default gas limit
+
+        # NFT listing: skip straight to the simulated path when no market contract is deployed,
+        # and back off for a while after an on-chain listing failure instead of retrying every call
+        self._market_contract_available = self.contracts.get('market') is not None
+        self._market_contract_retry_at = 0.0
+        self.market_contract_retry_ttl = 60  # seconds
         
         # Account management
         self.accounts = {}
@@ -96,6 +158,8 @@ class BlockchainInterface:
         self.thread_pool = ThreadPoolExecutor(max_workers=max_workers)
         self.async_mode = async_mode
         self.cache_ttl = cache_ttl
+        self._node_status_cache = (None, 0.0)  # (status dict, fetched_at)
+        self._node_status_lock = threading.Lock()
         
         # Enhanced transaction queue and processing with thread safety
         self.tx_queue = deque()
@@ -108,34 +172,40 @@ class BlockchainInterface:
         # Thread-safe offer ID mapping for match recording
         self.offer_id_mapping = {}  # marketplace_offer_id -> blockchain_offer_id
         self.offer_mapping_lock = threading.RLock()  # Protect offer mappings
-        self.provider_request_mapping = {}  # "request_id_provider_id" -> blockchain_offer_id
+        self.provider_request_mapping = {}  # (request_id, provider_id) -> blockchain_offer_id
         self._fallback_offer_counter = 0  # Counter for fallback offer IDs
 
+        # Precompiled (address, selector, input_types, output_types) per (contract_key, function_name)
+        self._function_specs = {}
+
         # Blockchain statistics tracking
         self.blockchain_stats = {
             'total_transactions': 0,
             'successful_transactions': 0,
             'failed_transactions': 0,
             'total_gas_used': 0,
-            'recent_tx_hashes': [],
-            'transaction_times': [],
+            'recent_tx_hashes': deque(maxlen=10),  # Bounded: oldest hashes evicted in O(1)
+            'transaction_times': deque(maxlen=100),  # Recent confirmation times (seconds)
+            'tx_time_sum': 0.0,  # Running totals for avg_tx_time over all confirmations
+            'tx_time_count': 0,
             'commuter_registrations': 0,
             'provider_registrations': 0,
             'travel_requests': 0,
             'service_offers': 0,
             'nft_listings': 0,
             'completed_matches': 0,
+            'secondary_sales_count': 0,  # Bookings with a source in _SECONDARY_SOURCES
             'start_time': time.time()
         }
 
         # Detailed booking tracking
-        self.booking_details = []
+        self._bookings = {}  # match_id -> booking record (insertion ordered, deduplicated)
         self.commuter_profiles = {}
         self.provider_profiles = {}
+        self._provider_modes = {}  # str(provider_id) -> mode derived from the profile's name
         self.request_details = {}
         self.offer_details = {}
         self.match_details = {}
-        self._booking_ids = set()  # Track unique bookings by match_id
         
         # State caching
         self.state_cache = {
@@ -178,9 +248,9 @@ class BlockchainInterface:
         
         # MARKETPLACE DATABASE (off-chain storage) with thread safety
         self.marketplace_db = {
-            'requests': {},      # Full request data
-            'offers': {},        # Full offer data
-            'providers': {},     # Provider profiles
+            'requests': CachedGetDict(),   # Full request data
+            'offers': CachedGetDict(),     # Full offer data
+            'providers': CachedGetDict(),  # Provider profiles
             'commuters': {},     # Commuter profiles
             'matches': {},       # Matching results
             'listings': {},      # Secondary market listings
@@ -188,6 +258,7 @@ class BlockchainInterface:
             'notifications': defaultdict(list)  # Provider notifications
         }
         self.marketplace_db_lock = threading.RLock()  # Protect marketplace database
+        self.marketplace_version = 0  # Bumped on every offer write; keys the router's segment cache
 
         # Transaction rollback tracking
         self.rollback_operations = {}  # tx_hash -> rollback_function
@@ -248,8 +319,8 @@ class BlockchainInterface:
         for path in possible_config_paths:
             if os.path.exists(path):
                 self.logger.info(f"Found config file at {path}")
-                with open(path, 'r') as f:
-                    return json.load(f)
+                with open(path, 'rb') as f:
+                    return _json_loads(f.read())
         
         # Default configuration if no file found
         self.logger.warning(f"Config file {config_file} not found in any location, using defaults")
@@ -305,8 +376,8 @@ class BlockchainInterface:
                 self.logger.error(f"Deployment info file {deployment_info_path} not found")
                 return {}
                 
-            with open(deployment_info_path, 'r') as f:
-                deployment_info = json.load(f)
+            with open(deployment_info_path, 'rb') as f:
+                deployment_info = _json_loads(f.read())
                 
             # Set correct path to artifacts directory
             abi_dir = os.path.join(base_dir, "artifacts", "contracts")
@@ -338,8 +409,8 @@ class BlockchainInterface:
                     
                     try:
                         if os.path.exists(abi_file):
-                            with open(abi_file, 'r') as abi_f:
-                                abi_data = json.load(abi_f)
+                            with open(abi_file, 'rb') as abi_f:
+                                abi_data = _json_loads(abi_f.read())
                                 abi = abi_data["abi"]
                                 contracts[key] = self.w3.eth.contract(address=address, abi=abi)
                         else:
@@ -437,6 +508,38 @@ class BlockchainInterface:
         1. Store full request in marketplace DB
         2. Push only hash to blockchain
         """
+        request_id, content_hash, tx_data, off_chain_operation, rollback_operation = \
+            self._prepare_travel_request(commuter, request)
+
+        # Execute atomically
+        if self.async_mode:
+            # For async mode, queue the transaction with rollback info
+            tx_data.rollback_data = {'operation': rollback_operation}
+            try:
+                off_chain_operation()  # Execute off-chain first
+                self.queue_transaction(tx_data)
+                self.logger.info(f"Request {request_id} created in marketplace, hash {content_hash[:8]}... queued for blockchain")
+                return True, request_id
+            except Exception as e:
+                self.logger.error(f"Error creating marketplace request: {e}")
+                return False, None
+        else:
+            # For sync mode, use atomic transaction
+            success, result = self.atomic_transaction(tx_data, off_chain_operation, rollback_operation)
+            if success:
+                self.logger.info(f"Request {request_id} created in marketplace, hash {content_hash[:8]}... confirmed on blockchain")
+                return True, request_id
+            else:
+                self.logger.error(f"Failed to create request {request_id} atomically")
+                return False, None
+
+    def _prepare_travel_request(self, commuter, request):
+        """
+        Build the marketplace record and hash transaction for a travel request.
+
+        Returns:
+            Tuple of (request_id, content_hash, tx_data, off_chain_operation, rollback_operation)
+        """
         request_id = request.get('request_id', int(uuid.uuid4().int & (2**64 - 1)))
 
         # Prepare full request data
@@ -491,27 +594,7 @@ class BlockchainInterface:
 
             self.logger.info(f"🔄 Rolled back request {request_id} from marketplace DB")
 
-        # Execute atomically
-        if self.async_mode:
-            # For async mode, queue the transaction with rollback info
-            tx_data.rollback_data = {'operation': rollback_operation}
-            try:
-                off_chain_operation()  # Execute off-chain first
-                self.queue_transaction(tx_data)
-                self.logger.info(f"Request {request_id} created in marketplace, hash {content_hash[:8]}... queued for blockchain")
-                return True, request_id
-            except Exception as e:
-                self.logger.error(f"Error creating marketplace request: {e}")
-                return False, None
-        else:
-            # For sync mode, use atomic transaction
-            success, result = self.atomic_transaction(tx_data, off_chain_operation, rollback_operation)
-            if success:
-                self.logger.info(f"Request {request_id} created in marketplace, hash {content_hash[:8]}... confirmed on blockchain")
-                return True, request_id
-            else:
-                self.logger.error(f"Failed to create request {request_id} atomically")
-                return False, None
+        return request_id, content_hash, tx_data, off_chain_operation, rollback_operation
     
     def submit_offer_marketplace(self, provider, request_id, price, details=None):
         """
@@ -567,6 +650,7 @@ class BlockchainInterface:
         def off_chain_operation():
             with self.marketplace_db_lock:
                 self.marketplace_db['offers'][offer_id] = full_offer
+                self.marketplace_version += 1
             # Capture offer details for analytics (mode attribution)
             self.store_offer_details(offer_id, full_offer)
             return offer_id
@@ -576,6 +660,7 @@ class BlockchainInterface:
             with self.marketplace_db_lock:
                 if offer_id in self.marketplace_db['offers']:
                     del self.marketplace_db['offers'][offer_id]
+                    self.marketplace_version += 1
 
             # Remove from offer mapping if exists
             with self.offer_mapping_lock:
@@ -769,9 +854,7 @@ class BlockchainInterface:
                     'offer_id': offer_id
                 }
                 self.store_match_details(match_id, sale_record)
-                if match_id not in self._booking_ids:
-                    self.booking_details.append(sale_record)
-                    self._booking_ids.add(match_id)
+                self._add_booking(match_id, sale_record)
 
             # -----------------------
             # 2) Blockchain transaction (simulated in skip mode)
@@ -952,6 +1035,7 @@ class BlockchainInterface:
     
     def _generate_content_hash(self, data):
         """Generate hash of content for blockchain storage"""
+        # Stays on stdlib json: the hash must match the separators already committed on-chain
         json_str = json.dumps(data, sort_keys=True)
         return hashlib.sha256(json_str.encode()).hexdigest()
 
@@ -960,9 +1044,13 @@ class BlockchainInterface:
         Handle a batch of travel requests safely.
         - Skips duplicates that are already in the marketplace DB
         - Falls back to a minimal commuter stub if the agent isn't available
+        - In sync mode, sends all request hashes in one JSON-RPC batch
         - Returns list of (success, request_id or error) tuples
         """
         results = []
+        batched = []  # (result index, request_id, tx_data, rollback_operation)
+        send_batched = (not self.async_mode and 'facade' in self.contracts
+                        and os.getenv("SKIP_CHAIN_PROCESSING", "").lower() not in ("1", "true", "yes"))
 
         for request in request_batch:
             request_id = request.get('request_id')
@@ -989,6 +1077,15 @@ class BlockchainInterface:
                 if commuter is None:
                     commuter = type("CommuterStub", (), {"unique_id": commuter_id})()
 
+                if send_batched:
+                    # Store off-chain now; the hash goes out with the rest of the batch
+                    _, _, tx_data, off_chain_operation, rollback_operation = \
+                        self._prepare_travel_request(commuter, request)
+                    off_chain_operation()
+                    batched.append((len(results), request_id, tx_data, rollback_operation))
+                    results.append((False, None))
+                    continue
+
                 success, created_id = self.create_travel_request(commuter, request)
                 results.append((success, created_id))
 
@@ -996,8 +1093,180 @@ class BlockchainInterface:
                 self.logger.error(f"Error processing request {request_id}: {e}")
                 results.append((False, str(e)))
 
+        if batched:
+            self._submit_request_batch(batched, results)
+
         return results
+
+    def _submit_request_batch(self, batched, results):
+        """
+        Send request hash transactions together and fill in their results.
+        Transactions the batch could not confirm are retried individually; requests
+        that still fail are rolled back from the marketplace DB.
+        """
+        api_account = self._get_api_account()
+        function_calls = [
+            self._contract_call('facade', 'submitRequestHash',
+                                tx_data.params['commuter_id'], tx_data.params['content_hash'])
+            for _, _, tx_data, _ in batched
+        ]
+        try:
+            outcomes = self._send_transactions_batch(function_calls, api_account)
+        except Exception as e:
+            outcomes = [e] * len(batched)
+
+        for (index, request_id, tx_data, rollback_operation), outcome in zip(batched, outcomes):
+            success = not isinstance(outcome, Exception)
+            if not success:
+                try:
+                    self._execute_blockchain_transaction_with_retry(tx_data)
+                    success = True
+                except Exception as e:
+                    # Idempotent "exists" errors count as success, as in atomic_transaction
+                    success = "exists" in str(e).lower()
+                    if not success:
+                        tx_data.last_error = str(e)
+                        rollback_operation()
+                        self.logger.error(f"❌ Batched request {request_id} failed: {e}")
+
+            results[index] = (True, request_id) if success else (False, None)
+
+    def _send_transactions_batch(self, function_calls, account):
+        """
+        Sign several transactions with consecutive nonces, send them in one JSON-RPC
+        batch and wait for their receipts.
+
+        Returns a list aligned with function_calls holding the receipt, or the
+        Exception for transactions that failed to send or reverted.
+        """
+        make_batch_request = getattr(self.w3.provider, 'make_batch_request', None)
+        gas_price = self.w3.eth.gas_price
+        chain_id = self.w3.eth.chain_id
+
+        # Optimistic nonces: reserve one per transaction and sign them all up front
+        raw_txs = []
+        with self.nonce_lock:
+            for function_call in function_calls:
+                tx_params = {
+                    'from': account.address,
+                    'nonce': self._get_next_nonce(account.address),
+                    'gas': self.gas_limit,
+                    'gasPrice': gas_price,
+                    'chainId': chain_id
+                }
+                if isinstance(function_call, dict):
+                    transaction = {**function_call, **tx_params}
+                else:
+                    transaction = function_call.build_transaction(tx_params)
+                signed_txn = account.sign_transaction(transaction)
+                raw_txs.append(getattr(signed_txn, "raw_transaction", None) or getattr(signed_txn, "rawTransaction", None))
+
+        sent_at = time.time()
+        tx_hashes = []
+        if make_batch_request is not None:
+            # One HTTP round trip for the whole batch
+            try:
+                responses = make_batch_request(
+                    [('eth_sendRawTransaction', [Web3.to_hex(raw_tx)]) for raw_tx in raw_txs]
+                )
+            except Exception as e:
+                responses = [e] * len(raw_txs)
+            if not isinstance(responses, list) or len(responses) != len(raw_txs):
+                # A malformed reply cannot be matched to transactions; treat every one as unsent
+                responses = [Exception(f"Malformed batch response: {responses!r}")] * len(raw_txs)
+            for response in responses:
+                if isinstance(response, dict) and response.get('result') is not None:
+                    tx_hashes.append(HexBytes(response['result']))
+                else:
+                    error = response.get('error') if isinstance(response, dict) else response
+                    tx_hashes.append(Exception(f"Batched send failed: {error}"))
+        else:
+            for raw_tx in raw_txs:
+                try:
+                    tx_hashes.append(self.w3.eth.send_raw_transaction(raw_tx))
+                except Exception as e:
+                    tx_hashes.append(e)
+
+        if any(isinstance(tx_hash, Exception) for tx_hash in tx_hashes):
+            # Unsent transactions leave nonce gaps; realign with the node
+            self._reset_nonce_tracker(account.address)
+
+        sent = [tx_hash for tx_hash in tx_hashes if not isinstance(tx_hash, Exception)]
+        receipts = self._wait_for_receipts(sent, timeout=30)
+
+        outcomes = []
+        for tx_hash in tx_hashes:
+            receipt = tx_hash if isinstance(tx_hash, Exception) else receipts[tx_hash]
+            if isinstance(receipt, Exception):
+                outcomes.append(receipt)
+            elif receipt['status'] == 1:
+                self._record_tx_time(receipt.get('confirmed_at', time.time()) - sent_at)
+                self.blockchain_stats['recent_tx_hashes'].append(tx_hash)
+                outcomes.append(receipt)
+            else:
+                outcomes.append(Exception(f"Transaction failed: {tx_hash.hex()}"))
+
+        self.logger.info(f"📦 Sent {len(raw_txs)} transactions in one batch "
+                         f"({sum(not isinstance(o, Exception) for o in outcomes)} confirmed)")
+        return outcomes
     
+    def _wait_for_receipts(self, tx_hashes, timeout=30, poll_latency=0.1):
+        """
+        Wait for several transaction receipts at once.
+        Each poll asks for every outstanding receipt in one JSON-RPC batch, so N
+        waits cost one round trip per poll instead of N. Falls back to sequential
+        wait_for_transaction_receipt when the provider cannot batch.
+
+        Returns {tx_hash: receipt or Exception}.
+        """
+        make_batch_request = getattr(self.w3.provider, 'make_batch_request', None)
+        if make_batch_request is None:
+            receipts = {}
+            for tx_hash in tx_hashes:
+                try:
+                    receipts[tx_hash] = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+                except Exception as e:
+                    receipts[tx_hash] = e
+            return receipts
+
+        receipts = {}
+        outstanding = list(tx_hashes)
+        deadline = time.time() + timeout
+        while outstanding:
+            try:
+                responses = make_batch_request(
+                    [('eth_getTransactionReceipt', [Web3.to_hex(tx_hash)]) for tx_hash in outstanding]
+                )
+            except Exception as e:
+                responses = [e] * len(outstanding)
+            if not isinstance(responses, list) or len(responses) != len(outstanding):
+                # Unmatched replies leave every hash outstanding for the next poll
+                responses = [None] * len(outstanding)
+
+            now = time.time()
+            still_outstanding = []
+            for tx_hash, response in zip(outstanding, responses):
+                result = response.get('result') if isinstance(response, dict) else None
+                if result is not None:
+                    status = result.get('status')
+                    receipts[tx_hash] = {
+                        **result,
+                        'status': int(status, 16) if isinstance(status, str) else status,
+                        'confirmed_at': now
+                    }
+                else:
+                    still_outstanding.append(tx_hash)
+            outstanding = still_outstanding
+
+            if outstanding and now >= deadline:
+                for tx_hash in outstanding:
+                    receipts[tx_hash] = TimeoutError(f"No receipt for {tx_hash.hex()} after {timeout}s")
+                break
+            if outstanding:
+                time.sleep(poll_latency)
+
+        return receipts
+
     def _get_provider_mode(self, provider):
         """Get provider mode"""
         if hasattr(provider, 'mode_type'):
@@ -1103,9 +1372,12 @@ class BlockchainInterface:
                 'reliability': getattr(provider_agent, 'reliability', 70),
                 'registered_at': time.time()
             }
-            self.marketplace_db['providers'][provider_agent.unique_id] = profile
+            # Provider keys are always str(provider_id)
+            pid_str = str(provider_agent.unique_id)
+            self._provider_modes[pid_str] = self._derive_provider_mode(profile)
+            self.marketplace_db['providers'][pid_str] = profile
             # Also store for analytics/mode attribution
-            self.provider_profiles[provider_agent.unique_id] = profile
+            self.provider_profiles[pid_str] = profile
 
             # Register on blockchain
             mode_mapping = {'car': 1, 'bike': 2, 'bus': 3, 'train': 4}
@@ -1371,6 +1643,52 @@ class BlockchainInterface:
 
         return account
 
+    def _get_function_spec(self, contract_key, function_name):
+        """
+        Get the precompiled selector and ABI types for a contract function.
+        Resolved once per (contract, function); None if the function cannot be precompiled.
+        """
+        key = (contract_key, function_name)
+        if key in self._function_specs:
+            return self._function_specs[key]
+
+        spec = None
+        contract = self.contracts.get(contract_key)
+        try:
+            if contract is not None:
+                fn_abis = [entry for entry in contract.abi
+                           if entry.get('type') == 'function' and entry.get('name') == function_name]
+                # Overloaded functions are left to web3's own resolution
+                if len(fn_abis) == 1:
+                    fn_abi = fn_abis[0]
+                    spec = (
+                        contract.address,
+                        function_abi_to_4byte_selector(fn_abi),
+                        tuple(_abi_type(param) for param in fn_abi.get('inputs', [])),
+                        tuple(_abi_type(param) for param in fn_abi.get('outputs', []))
+                    )
+        except Exception as e:
+            self.logger.debug(f"Could not precompile {contract_key}.{function_name}: {e}")
+
+        self._function_specs[key] = spec
+        return spec
+
+    def _contract_call(self, contract_key, function_name, *args):
+        """
+        Build a contract call for _send_transaction.
+        Returns a prebuilt {'to', 'data'} dict from the precompiled selector when possible,
+        otherwise the regular web3 ContractFunction.
+        """
+        spec = self._get_function_spec(contract_key, function_name)
+        if spec is not None:
+            address, selector, input_types, _ = spec
+            try:
+                return {'to': address, 'data': _encode_calldata(selector, input_types, args)}
+            except Exception as e:
+                self.logger.debug(f"Precompiled encoding failed for {function_name}, using ABI lookup: {e}")
+
+        return getattr(self.contracts[contract_key].functions, function_name)(*args)
+
     def _execute_request_transaction(self, tx_data, api_account):
         """Execute a request creation transaction"""
         facade_contract = self.contracts['facade']
@@ -1396,6 +1714,8 @@ class BlockchainInterface:
 
         # Send transaction and get receipt
         tx_hash = self._send_transaction(function_call, api_account)
+        # The request's on-chain offer list just grew
+        self._invalidate_cached_state('offers', tx_data.params['request_id'])
 
         # Get the blockchain offer ID from the transaction receipt
         try:
@@ -1413,7 +1733,7 @@ class BlockchainInterface:
                     self.offer_id_mapping[marketplace_offer_id] = blockchain_offer_id
 
                     # Also store reverse mapping for easier lookup
-                    key = f"{tx_data.params['request_id']}_{tx_data.params['provider_id']}"
+                    key = (int(tx_data.params['request_id']), int(tx_data.params['provider_id']))
                     self.provider_request_mapping[key] = blockchain_offer_id
 
                 self.logger.info(f"✅ Mapped marketplace offer {marketplace_offer_id} to blockchain offer {blockchain_offer_id}")
@@ -1424,12 +1744,11 @@ class BlockchainInterface:
             self.logger.warning(f"Could not extract blockchain offer ID: {e}")
             # Try to create a fallback mapping using the transaction data
             try:
-                key = f"{tx_data.params['request_id']}_{tx_data.params['provider_id']}"
+                key = (int(tx_data.params['request_id']), int(tx_data.params['provider_id']))
                 # Use a simple counter as fallback blockchain offer ID
-                if not hasattr(self, '_fallback_offer_counter'):
-                    self._fallback_offer_counter = 0
-                self._fallback_offer_counter += 1
-                self.provider_request_mapping[key] = self._fallback_offer_counter
+                with self.offer_mapping_lock:
+                    self._fallback_offer_counter += 1
+                    self.provider_request_mapping[key] = self._fallback_offer_counter
                 self.logger.info(f"Created fallback mapping for {key} -> {self._fallback_offer_counter}")
             except Exception as fallback_error:
                 self.logger.error(f"Failed to create fallback mapping: {fallback_error}")
@@ -1438,28 +1757,22 @@ class BlockchainInterface:
 
     def _execute_match_transaction(self, tx_data, api_account):
         """Execute a match recording transaction"""
-        facade_contract = self.contracts['facade']
-
         # Get the correct blockchain offer ID
         marketplace_offer_id = tx_data.params['winning_offer_id']
         request_id = tx_data.params['request_id']
         provider_id = tx_data.params['provider_id']
 
-        blockchain_offer_id = None
-
         # Try multiple methods to find the blockchain offer ID (thread-safe)
-        # Method 1: Direct mapping from marketplace offer ID
         with self.offer_mapping_lock:
-            if hasattr(self, 'offer_id_mapping') and marketplace_offer_id in self.offer_id_mapping:
-                blockchain_offer_id = self.offer_id_mapping[marketplace_offer_id]
+            # Method 1: Direct mapping from marketplace offer ID
+            blockchain_offer_id = self.offer_id_mapping.get(marketplace_offer_id)
+            if blockchain_offer_id is not None:
                 self.logger.info(f"Found blockchain offer ID {blockchain_offer_id} via direct mapping")
-
-            # Method 2: Provider-request mapping
-            elif hasattr(self, 'provider_request_mapping'):
-                key = f"{request_id}_{provider_id}"
-            if key in self.provider_request_mapping:
-                blockchain_offer_id = self.provider_request_mapping[key]
-                self.logger.info(f"Found blockchain offer ID {blockchain_offer_id} via provider-request mapping")
+            else:
+                # Method 2: Provider-request mapping
+                blockchain_offer_id = self.provider_request_mapping.get((int(request_id), int(provider_id)))
+                if blockchain_offer_id is not None:
+                    self.logger.info(f"Found blockchain offer ID {blockchain_offer_id} via provider-request mapping")
 
         # Method 3: Query blockchain directly
         if blockchain_offer_id is None:
@@ -1475,7 +1788,8 @@ class BlockchainInterface:
             return "0x0000000000000000000000000000000000000000000000000000000000000000"
 
         # Build transaction
-        function_call = facade_contract.functions.recordMatch(
+        function_call = self._contract_call(
+            'facade', 'recordMatch',
             request_id,
             blockchain_offer_id,  # Use blockchain offer ID
             provider_id,
@@ -1487,18 +1801,20 @@ class BlockchainInterface:
     def _find_blockchain_offer_id(self, request_id, provider_id):
         """Find the blockchain offer ID for a given request and provider"""
         try:
-            auction_contract = self.contracts['auction']
-
-            # Get all offers for this request
-            offers = auction_contract.functions.getOffers(request_id).call()
-            self.logger.debug(f"Found {len(offers)} offers for request {request_id}")
-
-            # Find the offer from this provider
-            for i, offer in enumerate(offers):
-                # offer structure: [providerId, price, timestamp, isActive]
-                if len(offer) > 0 and offer[0] == provider_id:  # offer[0] is providerId
-                    self.logger.debug(f"Found matching offer at index {i} for provider {provider_id}")
-                    return i
+            # Get all offers for this request (served from state_cache when warm). A cached list
+            # may predate this provider's offer, so a miss drops it and reads the chain once more
+            for attempt in range(2):
+                if attempt:
+                    self._invalidate_cached_state('offers', request_id)
+                offers = self._cached_state('offers', request_id, lambda: self._load_offers(request_id))
+                self.logger.debug(f"Found {len(offers)} offers for request {request_id}")
+
+                # Find the offer from this provider
+                for i, offer in enumerate(offers):
+                    # offer structure: [providerId, price, timestamp, isActive]
+                    if len(offer) > 0 and offer[0] == provider_id:  # offer[0] is providerId
+                        self.logger.debug(f"Found matching offer at index {i} for provider {provider_id}")
+                        return i
 
             self.logger.warning(f"No offer found for provider {provider_id} in request {request_id}")
             return None
@@ -1506,6 +1822,36 @@ class BlockchainInterface:
             self.logger.error(f"Error finding blockchain offer ID: {e}")
             return None
 
+    def _load_offers(self, request_id):
+        """Read a request's offers from the auction contract"""
+        spec = self._get_function_spec('auction', 'getOffers')
+        if spec is not None:
+            address, selector, input_types, output_types = spec
+            raw = self.w3.eth.call({'to': address, 'data': _encode_calldata(selector, input_types, (request_id,))})
+            return self.w3.codec.decode(list(output_types), raw)[0]
+        return self.contracts['auction'].functions.getOffers(request_id).call()
+
+    def _cached_state(self, kind, key, loader):
+        """
+        Read-through lookup in state_cache.
+        Entries are {'data': value, 'timestamp': ...}; a fresh entry is returned without
+        touching the chain, otherwise loader() is called once and its result cached.
+        """
+        cache = self.state_cache[kind]
+        entry = cache.get(key)
+        if entry is not None and time.time() - entry.get('timestamp', 0) < self.cache_ttl:
+            self.stats['cache_hits'] += 1
+            return entry['data']
+
+        self.stats['cache_misses'] += 1
+        data = loader()
+        cache[key] = {'data': data, 'timestamp': time.time()}
+        return data
+
+    def _invalidate_cached_state(self, kind, key):
+        """Drop a state_cache entry after our own write changed the on-chain value"""
+        self.state_cache[kind].pop(key, None)
+
     def reset_offer_mappings(self):
         """Reset offer ID mappings for a new simulation (thread-safe)"""
         with self.offer_mapping_lock:
@@ -1516,10 +1862,9 @@ class BlockchainInterface:
 
     def _execute_completion_transaction(self, tx_data, api_account):
         """Execute a completion confirmation transaction"""
-        facade_contract = self.contracts['facade']
-
         # Build transaction
-        function_call = facade_contract.functions.confirmCompletion(
+        function_call = self._contract_call(
+            'facade', 'confirmCompletion',
             tx_data.params['request_id']
         )
 
@@ -1527,18 +1872,18 @@ class BlockchainInterface:
 
     def _execute_registration_transaction(self, tx_data, api_account):
         """Execute a user/provider registration transaction"""
-        facade_contract = self.contracts['facade']
-
         if tx_data.params.get('is_provider', False):
             # Provider registration
-            function_call = facade_contract.functions.registerAsProvider(
+            function_call = self._contract_call(
+                'facade', 'registerAsProvider',
                 tx_data.params['provider_id'],
                 tx_data.params['address'],
                 tx_data.params['mode']
             )
         else:
             # Commuter registration
-            function_call = facade_contract.functions.registerAsCommuter(
+            function_call = self._contract_call(
+                'facade', 'registerAsCommuter',
                 tx_data.params['commuter_id'],
                 tx_data.params['address']
             )
@@ -1550,29 +1895,26 @@ class BlockchainInterface:
         Execute or simulate an NFT listing transaction on-chain.
         Falls back to a simulated receipt when contract interaction is unavailable.
         """
-        market_contract = self.contracts.get('market')
-
-        if market_contract:
+        if self._market_contract_available and time.time() >= self._market_contract_retry_at:
+            params = tx_data.params
+            initial_price_param = params.get('initialPrice')
+            final_price_param = params.get('finalPrice')
             try:
-                initial_price_param = tx_data.params.get('initialPrice')
-                final_price_param = tx_data.params.get('finalPrice')
-                decay_duration_param = tx_data.params.get('decayDuration', 0)
-
-                function_call = market_contract.functions.listNFTWithDynamicPricing(
-                    int(tx_data.params.get('tokenId')),
+                function_call = self.contracts['market'].functions.listNFTWithDynamicPricing(
+                    int(params.get('tokenId')),
                     int(initial_price_param) if initial_price_param is not None else 0,
                     int(final_price_param) if final_price_param is not None else 0,
-                    int(decay_duration_param)
+                    int(params.get('decayDuration', 0))
                 )
                 return self._send_transaction(function_call, api_account)
             except Exception as e:
-                self.logger.warning(f"On-chain NFT listing failed, simulating listing transaction: {e}")
+                self._market_contract_retry_at = time.time() + self.market_contract_retry_ttl
+                self.logger.warning(f"On-chain NFT listing failed, simulating listing transactions for the next "
+                                    f"{self.market_contract_retry_ttl}s: {e}")
 
         # Simulated transaction receipt for environments without an active contract
-        simulated_tx_hash = f"sim_{uuid.uuid4().hex[:12]}"
+        simulated_tx_hash = f"sim_{os.urandom(6).hex()}"
         self.blockchain_stats['recent_tx_hashes'].append(simulated_tx_hash)
-        if len(self.blockchain_stats['recent_tx_hashes']) > 20:
-            self.blockchain_stats['recent_tx_hashes'] = self.blockchain_stats['recent_tx_hashes'][-20:]
 
         return {
             'status': 'simulated',
@@ -1609,31 +1951,67 @@ class BlockchainInterface:
                     self.logger.error(f"Failed to reset nonce for {address}: {e}")
                 return
 
-            for tracked_address in list(self.nonce_tracker.keys()):
+            tracked_addresses = list(self.nonce_tracker.keys())
+            batched_nonces = self._batch_transaction_counts(tracked_addresses)
+            for tracked_address in tracked_addresses:
                 try:
-                    fresh_nonce = self.w3.eth.get_transaction_count(tracked_address)
+                    fresh_nonce = batched_nonces.get(tracked_address)
+                    if fresh_nonce is None:
+                        fresh_nonce = self.w3.eth.get_transaction_count(tracked_address)
                     self.nonce_tracker[tracked_address] = fresh_nonce
                     self.tx_nonce_map[tracked_address] = fresh_nonce
                 except Exception as e:
                     self.logger.error(f"Failed to reset nonce for {tracked_address}: {e}")
 
+    def _batch_transaction_counts(self, addresses):
+        """
+        Fetch transaction counts for several addresses in a single JSON-RPC batch.
+        Returns {address: nonce} for the addresses the batch resolved; empty if the
+        provider does not support batching.
+        """
+        make_batch_request = getattr(self.w3.provider, 'make_batch_request', None)
+        if not addresses or make_batch_request is None:
+            return {}
+
+        try:
+            responses = make_batch_request(
+                [('eth_getTransactionCount', [addr, 'latest']) for addr in addresses]
+            )
+        except Exception as e:
+            self.logger.debug(f"Batched nonce lookup unavailable, falling back to per-address calls: {e}")
+            return {}
+
+        nonces = {}
+        for addr, response in zip(addresses, responses):
+            result = response.get('result') if isinstance(response, dict) else None
+            if result is not None:
+                nonces[addr] = int(result, 16) if isinstance(result, str) else int(result)
+        return nonces
+
     def _send_transaction(self, function_call, account):
         """Send a transaction to the blockchain and wait for confirmation"""
         try:
             # Add small delay to encourage proper blockchain communication
             time.sleep(0.05)  # 50ms delay between transactions
 
+            sent_at = time.time()
+
             # Atomically: get nonce -> build -> sign -> send
             with self.nonce_lock:
                 nonce = self._get_next_nonce(account.address)
 
-                transaction = function_call.build_transaction({
+                tx_params = {
                     'from': account.address,
                     'nonce': nonce,
                     'gas': self.gas_limit,
                     'gasPrice': self.w3.eth.gas_price,
                     'chainId': self.w3.eth.chain_id
-                })
+                }
+                if isinstance(function_call, dict):
+                    # Prebuilt call from a precompiled selector: no ABI lookup needed
+                    transaction = {**function_call, **tx_params}
+                else:
+                    transaction = function_call.build_transaction(tx_params)
 
                 signed_txn = account.sign_transaction(transaction)
 
@@ -1645,12 +2023,11 @@ class BlockchainInterface:
             receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=30)
 
             if receipt.status == 1:
+                self._record_tx_time(time.time() - sent_at)
                 self.logger.info(f"✅ Transaction confirmed: {tx_hash.hex()} (nonce: {nonce})")
 
-                # Track successful transaction hash
-                self.blockchain_stats['recent_tx_hashes'].append(tx_hash.hex())
-                if len(self.blockchain_stats['recent_tx_hashes']) > 20:  # Keep only last 20
-                    self.blockchain_stats['recent_tx_hashes'] = self.blockchain_stats['recent_tx_hashes'][-20:]
+                # Track successful transaction hash (stringified lazily in get_blockchain_summary)
+                self.blockchain_stats['recent_tx_hashes'].append(tx_hash)
 
                 return receipt
             else:
@@ -1669,6 +2046,13 @@ class BlockchainInterface:
             self.logger.error(f"Transaction sending failed: {str(e)}")
             raise
 
+    def _record_tx_time(self, duration):
+        """Record a confirmation time, keeping running totals so the summary average is O(1)"""
+        stats = self.blockchain_stats
+        stats['transaction_times'].append(duration)
+        stats['tx_time_sum'] += duration
+        stats['tx_time_count'] += 1
+
     def register_commuter_on_blockchain(self, commuter_id, address):
         """Register a commuter on the blockchain"""
         tx_data = TransactionData(
@@ -1713,6 +2097,7 @@ class BlockchainInterface:
     def store_provider_profile(self, provider_id, profile_data):
         """Store detailed provider profile for booking analysis"""
         pid_str = str(provider_id)
+        self._provider_modes[pid_str] = self._derive_provider_mode(profile_data)
         self.provider_profiles[pid_str] = profile_data
         # Keep marketplace_db in sync as a fallback
         with self.marketplace_db_lock:
@@ -1720,6 +2105,12 @@ class BlockchainInterface:
                 self.marketplace_db['providers'] = {}
             self.marketplace_db['providers'][pid_str] = profile_data
 
+    @staticmethod
+    def _derive_provider_mode(profile):
+        """Infer a provider's mode from its company/provider name once, at profile write time"""
+        name = str(profile.get('company_name') or profile.get('provider_name') or '').lower()
+        return _mode_from_name(name) or 'unknown'
+
     def store_request_details(self, request_id, request_data):
         """Store detailed request information for booking analysis"""
         self.request_details[request_id] = request_data
@@ -1743,14 +2134,9 @@ class BlockchainInterface:
         pid_str = str(provider_id) if provider_id is not None else None
         provider_profile = self.provider_profiles.get(pid_str, {})
         if not provider_profile:
-            # Try alternate type and marketplace_db
+            # Fall back to marketplace_db
             with self.marketplace_db_lock:
                 provider_profile = self.marketplace_db.get('providers', {}).get(pid_str, {})
-            if not provider_profile:
-                try:
-                    provider_profile = self.provider_profiles.get(int(provider_id)) or self.provider_profiles.get(str(provider_id), {})
-                except Exception:
-                    provider_profile = {}
         source = 'bundle' if match_data.get('bundle') else match_data.get('source', 'direct')
         mode = (
             match_data.get('mode')
@@ -1760,15 +2146,7 @@ class BlockchainInterface:
         )
         # Heuristic fallback based on provider name if still unknown
         if mode == 'unknown' and provider_profile:
-            name = str(provider_profile.get('provider_name', '')).lower()
-            if 'bus' in name:
-                mode = 'bus'
-            elif 'train' in name:
-                mode = 'train'
-            elif 'uber' in name or 'taxi' in name or 'car' in name:
-                mode = 'car'
-            elif 'bike' in name:
-                mode = 'bike'
+            mode = _mode_from_name(str(provider_profile.get('provider_name', '')).lower()) or mode
 
         # Create comprehensive booking record
         booking_record = {
@@ -1784,14 +2162,22 @@ class BlockchainInterface:
             'origin': match_data.get('origin'),
             'destination': match_data.get('destination'),
             'route_details': match_data.get('route_details'),
-            'commuter_profile': self.commuter_profiles.get(match_data.get('commuter_id'), {}),
-            'provider_profile': self.provider_profiles.get(match_data.get('provider_id'), {}),
             'request_details': self.request_details.get(match_data.get('request_id'), {}),
             'offer_details': offer_details
         }
-        if match_id not in self._booking_ids:
-            self.booking_details.append(booking_record)
-            self._booking_ids.add(match_id)
+        self._add_booking(match_id, booking_record)
+
+    @property
+    def booking_details(self):
+        """Booking records in insertion order (list view of the match_id-keyed store)"""
+        return list(self._bookings.values())
+
+    def _add_booking(self, match_id, booking_record):
+        """Store a booking record once per match_id and keep the secondary-sales counter in step"""
+        if self._bookings.setdefault(match_id, booking_record) is not booking_record:
+            return
+        if booking_record.get('source') in _SECONDARY_SOURCES:
+            self.blockchain_stats['secondary_sales_count'] += 1
 
     # ================ QUERY FUNCTIONS ================
     
@@ -1814,7 +2200,7 @@ class BlockchainInterface:
     
     def get_provider_notifications(self, provider_id):
         """Get notifications for a provider"""
-        return self.marketplace_db['notifications'].get(provider_id, [])
+        return self.marketplace_db['notifications'].get(str(provider_id), [])
     
     def get_request_offers(self, request_id):
         """Get all offers for a request"""
@@ -1918,56 +2304,84 @@ class BlockchainInterface:
         """
         Aggregate primary offers and secondary listings for routing.
         """
-        segments = []
+        return list(self.iter_active_segments())
+
+    def iter_active_segments(self, od: Optional[Tuple] = None) -> Iterator[Dict]:
+        """
+        Lazily yield primary offers and secondary listings in segment form.
+
+        Records are snapshotted under the marketplace lock and converted outside it,
+        so callers can stop early without holding the lock.
+
+        Args:
+            od: Optional (origin, destination) pair; records for other legs are
+                skipped before any segment dict is built for them
+
+        Yields:
+            Segment dictionaries
+        """
+        if od is not None:
+            od = (tuple(od[0]), tuple(od[1]))
+
         with self.marketplace_db_lock:
-            offers = self.marketplace_db.get('offers', {})
-            listings = self.marketplace_db.get('listings', {})
+            offers = list(self.marketplace_db.get('offers', {}).values())
+            listings = list(self.marketplace_db.get('listings', {}).values())
 
-            for offer in offers.values():
-                if offer.get('status') not in ['available', 'submitted']:
-                    continue
-                origin = offer.get('origin')
-                destination = offer.get('destination')
-                depart_time = offer.get('depart_time', offer.get('start_time', 0))
-                arrive_time = offer.get('arrive_time', depart_time + offer.get('estimated_time', 0))
-                segments.append({
-                    'segment_id': f"offer_{offer.get('offer_id')}",
-                    'type': offer.get('type', 'offer'),
-                    'offer_id': offer.get('offer_id'),
-                    'provider_id': offer.get('provider_id'),
-                    'mode': offer.get('mode', 'unknown'),
-                    'origin': origin,
-                    'destination': destination,
-                    'depart_time': depart_time,
-                    'arrive_time': arrive_time,
-                    'price': offer.get('price', 0),
-                    'capacity': offer.get('capacity', 1),
-                    'status': offer.get('status', 'available')
-                })
-
-            for listing in listings.values():
-                if listing.get('status') != 'active':
-                    continue
-                details = listing.get('details', {})
-                origin = details.get('origin')
-                destination = details.get('destination')
-                service_time = details.get('service_time', 0)
-                duration = details.get('duration', 0)
-                segments.append({
-                    'segment_id': f"listing_{listing.get('listing_id', listing.get('nft_id'))}",
-                    'type': 'listing',
-                    'nft_id': listing.get('nft_id'),
-                    'provider_id': listing.get('seller_id'),
-                    'mode': details.get('mode', 'unknown'),
-                    'origin': origin,
-                    'destination': destination,
-                    'depart_time': service_time,
-                    'arrive_time': service_time + duration,
-                    'price': listing.get('current_price', listing.get('price', 0)),
-                    'capacity': 1,
-                    'status': listing.get('status', 'active')
-                })
-        return segments
+        for offer in offers:
+            if offer.get('status') not in ('available', 'submitted'):
+                continue
+            origin = offer.get('origin')
+            destination = offer.get('destination')
+            if od is not None and not self._matches_od(origin, destination, od):
+                continue
+            depart_time = offer.get('depart_time', offer.get('start_time', 0))
+            arrive_time = offer.get('arrive_time', depart_time + offer.get('estimated_time', 0))
+            yield {
+                'segment_id': f"offer_{offer.get('offer_id')}",
+                'type': offer.get('type', 'offer'),
+                'offer_id': offer.get('offer_id'),
+                'provider_id': offer.get('provider_id'),
+                'mode': offer.get('mode', 'unknown'),
+                'origin': origin,
+                'destination': destination,
+                'depart_time': depart_time,
+                'arrive_time': arrive_time,
+                'price': offer.get('price', 0),
+                'capacity': offer.get('capacity', 1),
+                'status': offer.get('status', 'available')
+            }
+
+        for listing in listings:
+            if listing.get('status') != 'active':
+                continue
+            details = listing.get('details', {})
+            origin = details.get('origin')
+            destination = details.get('destination')
+            if od is not None and not self._matches_od(origin, destination, od):
+                continue
+            service_time = details.get('service_time', 0)
+            duration = details.get('duration', 0)
+            yield {
+                'segment_id': f"listing_{listing.get('listing_id', listing.get('nft_id'))}",
+                'type': 'listing',
+                'nft_id': listing.get('nft_id'),
+                'provider_id': listing.get('seller_id'),
+                'mode': details.get('mode', 'unknown'),
+                'origin': origin,
+                'destination': destination,
+                'depart_time': service_time,
+                'arrive_time': service_time + duration,
+                'price': listing.get('current_price', listing.get('price', 0)),
+                'capacity': 1,
+                'status': listing.get('status', 'active')
+            }
+
+    @staticmethod
+    def _matches_od(origin, destination, od) -> bool:
+        """Check a record's origin/destination against a normalized (origin, destination) pair"""
+        if not isinstance(origin, (list, tuple)) or not isinstance(destination, (list, tuple)):
+            return False
+        return tuple(origin) == od[0] and tuple(destination) == od[1]
 
     def broadcast_offer(self, offer):
         """
@@ -1983,6 +2397,7 @@ class BlockchainInterface:
             with self.marketplace_db_lock:
                 offers = self.marketplace_db.setdefault('offers', {})
                 offers[offer_id] = offer
+                self.marketplace_version += 1
                 # Log occasionally to avoid spam
                 if len(offers) % 10 == 0:
                     self.logger.info(f"Broadcasted offer {offer_id} ({offer.get('mode')}). Total offers: {len(offers)}")
@@ -1998,7 +2413,8 @@ class BlockchainInterface:
         start_time: int,
         max_transfers: int = 3,
         time_tolerance: int = 5,
-        segments_override: List[Dict] = None
+        segments_override: List[Dict] = None,
+        max_bundles: int = 10
     ) -> List[Dict]:
         """
         Build multi-modal bundle options using decentralized routing
@@ -2012,6 +2428,8 @@ class BlockchainInterface:
             start_time: Desired departure tick
             max_transfers: Maximum number of segments in bundle
             time_tolerance: Acceptable time deviation (ticks)
+            segments_override: Segments to route over instead of the active marketplace set
+            max_bundles: Number of best bundles to return
 
         Returns:
             List of bundle options sorted by utility
@@ -2025,7 +2443,8 @@ class BlockchainInterface:
             active_segments,
             start_time,
             max_transfers,
-            time_tolerance
+            time_tolerance,
+            max_bundles
         )
 
     def mint_and_buy(self, offer_id: str, buyer_id, start_time: Optional[int] = None,
@@ -2038,22 +2457,26 @@ class BlockchainInterface:
             if not offer:
                 return False, None
             if offer.get('sold_count', 0) >= offer.get('capacity', 1):
-                offer['status'] = 'sold_out'
+                if offer.get('status') != 'sold_out':
+                    offer['status'] = 'sold_out'
+                    self.marketplace_version += 1
                 return False, None
 
             offer['sold_count'] = offer.get('sold_count', 0) + 1
             if offer['sold_count'] >= offer.get('capacity', 1):
                 offer['status'] = 'sold_out'
+                self.marketplace_version += 1
 
             # Derive timing for this minted ticket
-            depart_val = start_time if start_time is not None else offer.get('depart_time', offer.get('start_time', 0))
+            offer_depart = offer.get('depart_time', offer.get('start_time', 0))
+            depart_val = start_time if start_time is not None else offer_depart
             duration_val = duration if duration is not None else (
-                offer.get('estimated_time') or (offer.get('arrive_time', 0) - offer.get('depart_time', offer.get('start_time', 0)))
+                offer.get('estimated_time') or (offer.get('arrive_time', 0) - offer_depart)
             )
             if duration_val is None:
                 duration_val = 0
 
-            new_nft_id = f"nft_{offer_id}_{uuid.uuid4().hex[:6]}"
+            new_nft_id = f"nft_{offer_id}_{os.urandom(3).hex()}"
             nft_details = {
                 'nft_id': new_nft_id,
                 'owner_id': buyer_id,
@@ -2098,39 +2521,37 @@ class BlockchainInterface:
         """
         try:
             # 1) Simulated tx hash
-            tx_hash = f"tx_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+            timestamp = time.time()
+            tx_hash = f"tx_{int(timestamp)}_{os.urandom(4).hex()}"
 
             # 2) Update basic stats
             self.blockchain_stats['total_transactions'] += 1
             self.blockchain_stats['successful_transactions'] += 1
             self.blockchain_stats['recent_tx_hashes'].append(tx_hash)
 
-            timestamp = time.time()
             match_id = f"jit_{int(timestamp)}_{offer_id}"
 
-            # 3) Fetch offer and profiles
-            offer = {}
+            # 3) Snapshot offer fields and resolve the provider profile under the lock
             provider_profile = {}
-            commuter_profile = self.commuter_profiles.get(buyer_id, {})
 
             with self.marketplace_db_lock:
-                offer = self.marketplace_db.get('offers', {}).get(offer_id, {}) or {}
+                offer = self.marketplace_db['offers'].cached_get(offer_id) or {}
+                provider_id = offer.get('provider_id', 'unknown')
+                offer_depart = offer.get('depart_time')
+                offer_start = offer.get('start_time')
+                offer_arrive = offer.get('arrive_time')
+                offer_est = offer.get('estimated_time', 0)
+                offer_origin = offer.get('origin', [0, 0])
+                offer_destination = offer.get('destination', [0, 0])
+                offer_mode = offer.get('mode')
                 if offer:
-                    provider_id = offer.get('provider_id')
                     p_id_str = str(provider_id) if provider_id is not None else None
+                    providers_map = self.marketplace_db.get('providers')
                     provider_profile = (
-                        self.marketplace_db.get('providers', {}).get(p_id_str, {}) or
-                        self.provider_profiles.get(p_id_str, {})
+                        (providers_map.get(p_id_str) if providers_map else None)
+                        or self.provider_profiles.get(p_id_str)
+                        or {}
                     )
-                    # Try cross-type lookup (int<->str) if still empty
-                    if not provider_profile and provider_id is not None:
-                        try:
-                            provider_profile = (
-                                self.provider_profiles.get(int(provider_id)) or
-                                self.provider_profiles.get(str(provider_id), {})
-                            )
-                        except Exception:
-                            provider_profile = {}
 
             # 4) Build booking record with full context
             current_tick = explicit_tick
@@ -2138,48 +2559,34 @@ class BlockchainInterface:
                 current_tick = self.model.current_step
 
             # Derive timing
-            start_time = start_time or offer.get('depart_time') or offer.get('start_time') or current_tick
+            start_time = start_time or offer_depart or offer_start or current_tick
             if duration is None:
-                arrive_time = offer.get('arrive_time')
-                est_time = offer.get('estimated_time', 0)
-                if arrive_time is not None and offer.get('depart_time') is not None:
-                    duration = max(0, arrive_time - offer.get('depart_time'))
-                else:
-                    duration = est_time
+                duration = (max(0, offer_arrive - offer_depart)
+                            if offer_arrive is not None and offer_depart is not None else offer_est)
             if duration is None:
                 duration = 0
 
-            # Determine mode/provider_type robustly
-            allowed_sources = ['bus', 'train', 'car', 'bike']
-            mode = None
-            # 1) explicit override
-            if mode_override:
-                mode = mode_override
-            # 2) source override if it is a known mode
-            if mode is None and source_override in allowed_sources:
-                mode = source_override
-            # 3) offer/profile
-            if mode is None:
-                mode = offer.get('mode') or provider_profile.get('mode_type') or provider_profile.get('mode') or 'unknown'
-            # 4) heuristic on provider name
+            # Determine mode/provider_type: explicit override, mode-named source, offer, then profile
+            mode = (
+                mode_override
+                or (source_override if source_override in _ALLOWED_SOURCES else None)
+                or offer_mode
+                or provider_profile.get('mode_type')
+                or provider_profile.get('mode')
+                or 'unknown'
+            )
+            # Fall back to the provider-name heuristic derived when the profile was stored
             if mode == 'unknown' and provider_profile:
-                name = str(provider_profile.get('company_name') or provider_profile.get('provider_name') or '').lower()
-                if 'bus' in name:
-                    mode = 'bus'
-                elif 'train' in name:
-                    mode = 'train'
-                elif 'uber' in name or 'taxi' in name or 'car' in name:
-                    mode = 'car'
-                elif 'bike' in name:
-                    mode = 'bike'
+                mode = self._provider_modes.get(str(provider_id)) or self._derive_provider_mode(provider_profile)
+            source = source_override or ('jit_mint' if tx_type == 'mint' else 'nft_market_secondary')
 
             booking_record = {
                 'booking_id': match_id,
                 'match_id': match_id,
                 'commuter_id': buyer_id,
-                'provider_id': offer.get('provider_id', 'unknown'),
+                'provider_id': provider_id,
                 'provider_type': mode,
-                'source': source_override if source_override else ('jit_mint' if tx_type == 'mint' else 'nft_market_secondary'),
+                'source': source,
                 'request_id': f"req_{offer_id}",
                 'offer_id': offer_id,
                 'price': price,
@@ -2190,29 +2597,23 @@ class BlockchainInterface:
                 'duration': duration,
                 'status': 'completed',
                 # Fix route display [] -> [] by populating origin/destination
-                'origin': offer.get('origin', [0, 0]),
-                'destination': offer.get('destination', [0, 0]),
-                # Attach profiles for downstream summaries
-                'provider_profile': provider_profile,
-                'commuter_profile': commuter_profile,
+                'origin': offer_origin,
+                'destination': offer_destination,
                 'route_details': {
                     'distance': 0,
-                    'duration': offer.get('estimated_time', 0) or (offer.get('arrive_time', 0) - offer.get('depart_time', 0)),
-                    'route': [offer.get('origin'), offer.get('destination')]
+                    'duration': offer_est or ((offer_arrive or 0) - (offer_depart or 0)),
+                    'route': [offer_origin, offer_destination]
                 }
             }
 
-            if match_id not in self._booking_ids:
-                self.booking_details.append(booking_record)
-                self._booking_ids.add(match_id)
+            self._add_booking(match_id, booking_record)
 
-            self.logger.info(f"✅ Recorded {tx_type} transaction {tx_hash} for offer {offer_id}")
+            self.logger.info("✅ Recorded %s transaction %s for offer %s", tx_type, tx_hash, offer_id)
             return tx_hash
 
         except Exception as e:
             self.logger.error(f"Error recording transaction: {e}")
-            import traceback
-            traceback.print_exc()
+            self.logger.debug("Traceback for failed transaction record", exc_info=True)
             return None
 
     def mint_direct_segment_for(self, request: Dict) -> bool:
@@ -2231,21 +2632,24 @@ class BlockchainInterface:
             # Broadcast request to all providers via marketplace
             request_id = request.get('request_id')
 
+            # One notification shared by every provider; it is never mutated after being queued
+            notification = {
+                'type': 'unmatched_request',
+                'request_id': request_id,
+                'origin': request.get('origin'),
+                'destination': request.get('destination'),
+                'start_time': request.get('start_time'),
+                'max_price': request.get('max_price')
+            }
+
             # Notify all providers about this unmatched request
             with self.marketplace_db_lock:
                 providers = self.marketplace_db.get('providers', {})
-                for provider_id in providers.keys():
-                    notification = {
-                        'type': 'unmatched_request',
-                        'request_id': request_id,
-                        'origin': request.get('origin'),
-                        'destination': request.get('destination'),
-                        'start_time': request.get('start_time'),
-                        'max_price': request.get('max_price')
-                    }
-                    self.marketplace_db['notifications'][provider_id].append(notification)
+                notifications = self.marketplace_db['notifications']
+                for provider_id in providers:
+                    notifications[provider_id].append(notification)
 
-            self.logger.info(f"Broadcasted unmatched request {request_id} to providers")
+            self.logger.info("Broadcasted unmatched request %s to providers", request_id)
             return True
 
         except Exception as e:
@@ -2274,36 +2678,55 @@ class BlockchainInterface:
         try:
             reservation_id = f"res_{uuid.uuid4().hex[:12]}"
 
+            # Parse offer IDs outside the lock
+            segments = bundle.get('segments', [])
+            offer_segments = []  # (offer_id, segment_id), reused when marking segments reserved
+            for segment in segments:
+                seg_get = segment.get
+                segment_type = seg_get('type')
+
+                # Check NFT availability
+                if segment_type == 'nft':
+                    # Would check NFT ownership on blockchain
+                    pass
+
+                # Check offer availability
+                elif segment_type == 'offer':
+                    segment_id = seg_get('segment_id')
+                    offer_segments.append((int(segment_id.replace('offer_', '')), segment_id))
+
+            # Snapshot offer statuses under the lock, validate outside it
             with self.marketplace_db_lock:
-                # Check if all segments are still available
-                segments = bundle.get('segments', [])
-                for segment in segments:
-                    segment_id = segment.get('segment_id')
-
-                    # Check NFT availability
-                    if segment.get('type') == 'nft':
-                        # Would check NFT ownership on blockchain
-                        pass
-
-                    # Check offer availability
-                    elif segment.get('type') == 'offer':
-                        offer_id = segment_id.replace('offer_', '')
-                        offer = self.marketplace_db['offers'].get(int(offer_id))
-                        if not offer or offer.get('status') != 'submitted':
-                            self.logger.warning(f"Segment {segment_id} no longer available")
-                            return False, None
-
-                # All segments available - create reservation
-                reservation = {
-                    'reservation_id': reservation_id,
-                    'bundle_id': bundle.get('bundle_id'),
-                    'commuter_id': commuter_id,
-                    'request_id': request_id,
-                    'segments': segments,
-                    'total_price': bundle.get('total_price'),
-                    'created_at': time.time(),
-                    'status': 'confirmed'
-                }
+                offers_get = self.marketplace_db['offers'].cached_get
+                offers_view = {oid: (offers_get(oid) or {}).get('status') for oid, _ in offer_segments}
+
+            for offer_id, segment_id in offer_segments:
+                if offers_view[offer_id] != 'submitted':
+                    self.logger.warning("Segment %s no longer available", segment_id)
+                    return False, None
+
+            # All segments available - create reservation
+            reservation = {
+                'reservation_id': reservation_id,
+                'bundle_id': bundle.get('bundle_id'),
+                'commuter_id': commuter_id,
+                'request_id': request_id,
+                'segments': segments,
+                'total_price': bundle.get('total_price'),
+                'created_at': time.time(),
+                'status': 'confirmed'
+            }
+
+            with self.marketplace_db_lock:
+                offers = self.marketplace_db['offers']
+                offers_get = offers.cached_get
+
+                # Re-check under the lock in case another thread reserved a segment meanwhile
+                for offer_id, segment_id in offer_segments:
+                    offer = offers_get(offer_id)
+                    if not offer or offer.get('status') != 'submitted':
+                        self.logger.warning("Segment %s reserved concurrently", segment_id)
+                        return False, None
 
                 # Store reservation
                 if 'reservations' not in self.marketplace_db:
@@ -2311,11 +2734,9 @@ class BlockchainInterface:
                 self.marketplace_db['reservations'][reservation_id] = reservation
 
                 # Mark segments as reserved
-                for segment in segments:
-                    if segment.get('type') == 'offer':
-                        offer_id = segment.get('segment_id').replace('offer_', '')
-                        if int(offer_id) in self.marketplace_db['offers']:
-                            self.marketplace_db['offers'][int(offer_id)]['status'] = 'reserved'
+                for offer_id, _ in offer_segments:
+                    offers[offer_id]['status'] = 'reserved'
+                self.marketplace_version += 1
 
                 # Update request status
                 if request_id in self.marketplace_db['requests']:
@@ -2332,11 +2753,12 @@ class BlockchainInterface:
                     'timestamp': time.time()
                 }
 
-            self.logger.info(f"Reserved bundle {bundle.get('bundle_id')} as {reservation_id}")
+            self.logger.info("Reserved bundle %s as %s", bundle.get('bundle_id'), reservation_id)
             return True, reservation_id
 
         except Exception as e:
             self.logger.error(f"Error reserving bundle: {e}")
+            self.logger.debug("Traceback for failed bundle reservation", exc_info=True)
             return False, None
 
     def _update_transaction_stats(self, tx, success=True):
@@ -2363,15 +2785,21 @@ class BlockchainInterface:
                 self.blockchain_stats.setdefault('nft_sales', 0)
                 self.blockchain_stats['nft_sales'] += 1
 
-    def get_blockchain_summary(self):
-        """Generate comprehensive blockchain storage summary"""
+    def get_blockchain_summary(self, connected=None):
+        """
+        Generate comprehensive blockchain storage summary.
+        Pass connected to reuse a connectivity check the caller already made.
+        """
+        if connected is None:
+            connected = self.node_status()['connected']
         try:
             # Calculate success rate
             total_tx = self.blockchain_stats['total_transactions']
             success_rate = (self.blockchain_stats['successful_transactions'] / total_tx * 100) if total_tx > 0 else 0
 
             # Calculate average transaction time
-            avg_tx_time = sum(self.blockchain_stats['transaction_times']) / len(self.blockchain_stats['transaction_times']) if self.blockchain_stats['transaction_times'] else 0
+            tx_time_count = self.blockchain_stats['tx_time_count']
+            avg_tx_time = self.blockchain_stats['tx_time_sum'] / tx_time_count if tx_time_count else 0
 
             # Calculate peak TPS (simplified)
             runtime = time.time() - self.blockchain_stats['start_time']
@@ -2387,16 +2815,13 @@ class BlockchainInterface:
             marketplace_db = getattr(self, "marketplace_db", {})
             listings = marketplace_db.get('listings', {}) if isinstance(marketplace_db, dict) else {}
             offchain_listing_count = len([l for l in listings.values() if l.get('status') in ('active', 'sold')])
-            offchain_secondary_sales = sum(
-                1 for b in self.booking_details
-                if b.get('source') in ['nft_market', 'secondary', 'market']
-            )
+            offchain_secondary_sales = self.blockchain_stats['secondary_sales_count']
 
             # Prefer on-chain counters but fill gaps from off-chain data
             self.blockchain_stats['nft_listings'] = max(self.blockchain_stats.get('nft_listings', 0), offchain_listing_count)
             self.blockchain_stats['completed_matches'] = max(
                 self.blockchain_stats.get('completed_matches', 0),
-                len(self.booking_details)
+                len(self._bookings)
             )
 
             return {
@@ -2414,21 +2839,75 @@ class BlockchainInterface:
                 'nft_listings': self.blockchain_stats.get('nft_listings', 0),
                 'nft_sales': self.blockchain_stats.get('nft_sales', 0),
                 'secondary_sales': offchain_secondary_sales,
-                'blockchain_connected': self.w3.is_connected(),
+                'blockchain_connected': connected,
                 'avg_tx_time': avg_tx_time,
                 'peak_tps': peak_tps,
                 'congestion_level': 'Low' if success_rate > 80 else 'Medium' if success_rate > 60 else 'High',
-                'recent_tx_hashes': self.blockchain_stats['recent_tx_hashes'][-10:],  # Last 10 transactions
+                'recent_tx_hashes': [  # Last 10 transactions
+                    h.hex() if hasattr(h, 'hex') else h
+                    for h in self.blockchain_stats['recent_tx_hashes']
+                ],
                 'booking_details': self.booking_details,
                 'commuter_profiles': self.commuter_profiles,
                 'provider_profiles': self.provider_profiles
             }
         except Exception as e:
             self.logger.error(f"Error generating blockchain summary: {e}")
+            self.logger.debug("Traceback for failed summary", exc_info=True)
             return {
                 'total_transactions': self.blockchain_stats.get('total_transactions', 0),
                 'successful_transactions': self.blockchain_stats.get('successful_transactions', 0),
                 'failed_transactions': self.blockchain_stats.get('failed_transactions', 0),
                 'success_rate': 0,
-                'blockchain_connected': self.w3.is_connected()
+                'blockchain_connected': connected
             }
+
+    # Node status cache lifetime in seconds; shorter than a block, so reads never lag more than one block
+    NODE_STATUS_TTL = 2.0
+
+    def node_status(self):
+        """
+        Node connectivity, latest block and network version.
+        Fetched as one JSON-RPC batch and reused for NODE_STATUS_TTL seconds, so
+        repeated status reads (dashboard polling, summaries) don't each hit the node.
+        """
+        with self._node_status_lock:
+            status, fetched_at = self._node_status_cache
+            if status is not None and time.monotonic() - fetched_at < self.NODE_STATUS_TTL:
+                return status
+
+            status = self._fetch_node_status()
+            self._node_status_cache = (status, time.monotonic())
+            return status
+
+    def _fetch_node_status(self):
+        """Query the node's status in one JSON-RPC batch; a failed batch reports it as disconnected"""
+        node_calls = [('web3_clientVersion', []), ('eth_blockNumber', []), ('net_version', [])]
+        make_batch_request = getattr(self.w3.provider, 'make_batch_request', None)
+        results = [None] * len(node_calls)
+        try:
+            if make_batch_request is not None:
+                responses = make_batch_request(node_calls)
+                # A reply that is not one response per call (e.g. an error object) means disconnected
+                if isinstance(responses, list) and len(responses) == len(node_calls):
+                    results = [r.get('result') if isinstance(r, dict) else None for r in responses]
+            else:
+                results = [self.w3.provider.make_request(method, params).get('result')
+                           for method, params in node_calls]
+        except Exception as e:
+            self.logger.debug(f"Node status batch failed: {e}")
+
+        client_version, block_number, net_version = results
+        return {
+            'connected': client_version is not None,
+            'block_number': int(block_number, 16) if isinstance(block_number, str) else block_number,
+            'net_version': net_version
+        }
+
+    def batch_summary(self):
+        """get_blockchain_summary plus the node's latest block and network version (see node_status)"""
+        status = self.node_status()
+        summary = self.get_blockchain_summary(connected=status['connected'])
+        summary['block_number'] = status['block_number']
+        summary['net_version'] = status['net_version']
+        return summary
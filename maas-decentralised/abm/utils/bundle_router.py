@@ -4,12 +4,50 @@ Implements peer-to-peer bundle discovery and distributed route assembly
 """
 
 import logging
-from typing import List, Dict, Tuple, Optional, Set
+import re
+from typing import List, Dict, Tuple, Optional, Set, NamedTuple
 from collections import defaultdict
 import math
+import heapq
+from bisect import bisect_left, bisect_right
+import itertools
 import hashlib
+import numpy as np
 import json
 
+# Offer statuses the router may book: regular offers and proactive segments
+_VALID_STATUS = frozenset(('submitted', 'available'))
+_COORD_TYPES = (list, tuple)
+# Numbers in a string coordinate such as "[10, 20]" or "10.5,20"
+_COORD_RE = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+class SegmentEdge(NamedTuple):
+    """
+    Segment-graph edge with the fields the path search reads on every expansion
+
+    The segment dict itself is kept as-is for bundles and callers; the scalar fields are
+    read from it once when the edge is added, with the defaults the search always used.
+    """
+    destination: Tuple[int, int]
+    segment: Dict
+    depart: int        # depart_time (default 0)
+    arrive: int        # arrive_time (default depart) - arrival used for timing
+    wait_from: int     # arrive_time (default 0) - arrival used for transfer wait cost
+    duration: int      # duration (default 0) - time cost
+    walk_time: int     # duration (default 1) - walk edge traversal time
+    price: float
+    is_walk: bool
+    available: bool
+
+    @classmethod
+    def from_segment(cls, destination: Tuple[int, int], segment: Dict) -> 'SegmentEdge':
+        get = segment.get
+        depart = get('depart_time', 0)
+        return cls(destination, segment, depart, get('arrive_time', depart), get('arrive_time', 0),
+                   get('duration', 0), get('duration', 1), get('price', 0),
+                   get('mode') == 'walk', get('status') == 'available')
+
 
 class DecentralizedBundleRouter:
     """
@@ -26,14 +64,45 @@ class DecentralizedBundleRouter:
     - Participate in auctions for contested segments
     """
     
+    # Grid cell size for the spatial node index (matches the 4-unit close-enough threshold)
+    GRID_CELL = 4
+
+    # Cap on the multi-modal bundle discount (also bounds path costs during search)
+    MAX_BUNDLE_DISCOUNT = 0.15
+
     def __init__(self, blockchain_interface, logger=None):
         self.blockchain = blockchain_interface
         self.logger = logger or logging.getLogger(__name__)
         
         # Local cache of segment graph (built from blockchain events)
-        self.segment_graph = defaultdict(list)  # origin -> [(destination, segment_data)]
+        self.segment_graph = defaultdict(list)  # origin -> [SegmentEdge(destination, segment_data, ...)]
         self.segment_index = {}  # segment_id -> segment_data
+
+        # Incremental graph maintenance between build_bundles calls
+        self._segment_sigs: Optional[Dict[str, Tuple]] = None  # segment_id -> signature (None forces a full rebuild)
+        self._segment_origin: Dict[str, Tuple[int, int]] = {}  # segment_id -> origin node in segment_graph
+        self._walk_base_len: Dict[Tuple[int, int], int] = {}  # node -> edge count before walk edges were appended
+        # node -> sorted depart times of its timed (non-walk) edges, which lead its edge list in that order
+        self._node_departs: Dict[Tuple[int, int], List[int]] = {}
+
+        # Canonical tuple per coordinate: graph keys and edge endpoints share one object, so
+        # node comparisons in the search are identity checks
+        self._node_intern: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+        # Spatial grid over segment-graph nodes, rebuilt lazily after the node set changes
+        self._grid_buckets: Optional[Dict[Tuple[int, int], List[Tuple[int, int]]]] = None  # cell -> nodes
+        self._node_order: Dict[Tuple[int, int], int] = {}  # node -> position in segment_graph iteration order
+        self._node_list: List[Tuple[int, int]] = []  # nodes in segment_graph iteration order
+        self._nodes_xy = np.empty((0, 2), dtype=np.int64)  # SoA coordinates, row i == _node_list[i]
+
+        # Least search cost per unit distance over segment edges (None = recompute after a graph change)
+        self._segment_cost_rate: Optional[float] = None
+        # node -> nodes with an available segment edge into it (None = rebuild after a graph change)
+        self._reverse_adj: Optional[Dict[Tuple[int, int], Set[Tuple[int, int]]]] = None
         
+        # (marketplace_version, time_window, segments) from the last get_active_segments call
+        self._segments_cache = None
+
         # Auction tracking for contested segments
         self.active_auctions = {}  # segment_id -> auction_data
         
@@ -44,6 +113,9 @@ class DecentralizedBundleRouter:
         Instead of querying a central database, this reads NFT mint events
         and offer submissions directly from the blockchain.
         
+        Results are reused while the marketplace version (bumped on every
+        offer write) and the time window are unchanged.
+
         Args:
             time_window: (start_tick, end_tick) for filtering segments
             
@@ -51,10 +123,15 @@ class DecentralizedBundleRouter:
             List of active segment dictionaries
         """
         try:
+            with self.blockchain.marketplace_db_lock:
+                version = getattr(self.blockchain, 'marketplace_version', None)
+            cached = self._segments_cache
+            if version is not None and cached is not None and cached[0] == version and cached[1] == time_window:
+                return list(cached[2])
+
             # Query blockchain marketplace for active NFTs/offers
             # This is decentralized - reading from blockchain state
-            active_segments = []
-            
+
             # Get all active NFT listings from blockchain
             nfts = self.blockchain.search_nfts(
                 origin_area=None,  # Get all
@@ -63,86 +140,121 @@ class DecentralizedBundleRouter:
                 max_price=None
             )
             
-            # Get all active offers from marketplace
-            # Include both regular offers ('submitted') and proactive segments ('available')
+            # Snapshot offers under the lock; filter after releasing it. A write racing the
+            # filter bumps marketplace_version, so the next call rebuilds.
             with self.blockchain.marketplace_db_lock:
-                offers = [
-                    offer for offer in self.blockchain.marketplace_db.get('offers', {}).values()
-                    if offer.get('status') in ['submitted', 'available']
-                ]
-            
-            # Convert NFTs to segment format
-            for nft in nfts:
-                segment = {
-                    'segment_id': f"nft_{nft.get('token_id', '')}",
-                    'type': 'nft',
-                    'provider_id': nft.get('provider_id'),
-                    'mode': nft.get('mode', 'unknown'),
-                    'origin': nft.get('origin', []),
-                    'destination': nft.get('destination', []),
-                    'depart_time': nft.get('start_time', 0),
-                    'arrive_time': nft.get('start_time', 0) + nft.get('estimated_time', 0),
-                    'price': nft.get('price', 0),
-                    'capacity': nft.get('capacity', 1),
-                    'status': 'available',
-                    'nft_token_id': nft.get('token_id')
-                }
-                active_segments.append(segment)
-            
-            # Convert offers to segment format
-            for offer in offers:
-                # Handle both regular offers (start_time) and proactive segments (depart_time)
-                origin = offer.get('origin')
-                destination = offer.get('destination')
-                if not origin or not destination:
-                    continue
-                if not isinstance(origin, (list, tuple)) or not isinstance(destination, (list, tuple)):
-                    continue
-                depart_time = offer.get('depart_time', offer.get('start_time', 0))
-                arrive_time = offer.get('arrive_time', depart_time + offer.get('estimated_time', 0))
-
-                segment = {
-                    'segment_id': f"offer_{offer.get('offer_id', '')}",
-                    'type': offer.get('type', 'offer'),  # Preserve 'segment' type for proactive segments
-                    'provider_id': offer.get('provider_id'),
-                    'mode': offer.get('mode', 'unknown'),
-                    'origin': origin,
-                    'destination': destination,
-                    'depart_time': depart_time,
-                    'arrive_time': arrive_time,
-                    'price': offer.get('price', 0),
-                    'capacity': offer.get('capacity', 1),
-                    'status': 'available',
-                    'offer_signature': offer.get('signature')
-                }
-                active_segments.append(segment)
+                version = getattr(self.blockchain, 'marketplace_version', None)
+                offers_snapshot = list(self.blockchain.marketplace_db.get('offers', {}).values())
+
+            # Keep bookable statuses ('submitted' offers, 'available' proactive segments) with
+            # routable endpoints, in one pass
+            g = dict.get
+            offers = [
+                offer for offer in offers_snapshot
+                if g(offer, 'status') in _VALID_STATUS
+                and isinstance(g(offer, 'origin'), _COORD_TYPES) and offer['origin']
+                and isinstance(g(offer, 'destination'), _COORD_TYPES) and offer['destination']
+            ]
+
+            active_segments = list(itertools.chain(
+                map(self._nft_to_segment, nfts),
+                map(self._offer_to_segment, offers)
+            ))
             
             self.logger.info(f"Retrieved {len(active_segments)} active segments from blockchain")
+            if version is not None:
+                self._segments_cache = (version, time_window, active_segments)
+                return list(active_segments)
             return active_segments
             
         except Exception as e:
             self.logger.error(f"Error getting active segments: {e}")
             return []
     
+    @staticmethod
+    def _nft_to_segment(nft: Dict) -> Dict:
+        """Convert an NFT listing to segment format"""
+        g = nft.get
+        start_time = g('start_time', 0)
+        return {
+            'segment_id': f"nft_{g('token_id', '')}",
+            'type': 'nft',
+            'provider_id': g('provider_id'),
+            'mode': g('mode', 'unknown'),
+            'origin': g('origin', []),
+            'destination': g('destination', []),
+            'depart_time': start_time,
+            'arrive_time': start_time + g('estimated_time', 0),
+            'price': g('price', 0),
+            'capacity': g('capacity', 1),
+            'status': 'available',
+            'nft_token_id': g('token_id')
+        }
+
+    @staticmethod
+    def _offer_to_segment(offer: Dict) -> Dict:
+        """Convert a marketplace offer to segment format"""
+        g = offer.get
+        # Handle both regular offers (start_time) and proactive segments (depart_time)
+        depart_time = g('depart_time', g('start_time', 0))
+        return {
+            'segment_id': f"offer_{g('offer_id', '')}",
+            'type': g('type', 'offer'),  # Preserve 'segment' type for proactive segments
+            'provider_id': g('provider_id'),
+            'mode': g('mode', 'unknown'),
+            'origin': offer['origin'],
+            'destination': offer['destination'],
+            'depart_time': depart_time,
+            'arrive_time': g('arrive_time', depart_time + g('estimated_time', 0)),
+            'price': g('price', 0),
+            'capacity': g('capacity', 1),
+            'status': 'available',
+            'offer_signature': g('signature')
+        }
+
     def build_segment_graph(self, segments: List[Dict]):
         """
         Build a directed graph of segments for route finding with robust coordinate parsing.
-        Graph structure: origin_location -> [(destination_location, segment_data)]
+        Graph structure: origin_location -> [SegmentEdge(destination_location, segment_data, ...)]
+
+        The graph persists between calls: an identical segment set is reused as-is, and a
+        small change is patched in place rather than rebuilding every node.
         """
+        self._remove_walk_edges()
+
+        signature = self._segment_signature
+        sig_map = {segment.get('segment_id', 'unknown'): (signature(segment), segment) for segment in segments}
+        old_sigs = self._segment_sigs
+        if (old_sigs is not None and len(sig_map) == len(segments) == len(old_sigs)
+                and all(old_sigs.get(sid) == sig for sid, (sig, _) in sig_map.items())):
+            self.logger.debug(f"Segment graph unchanged ({len(self.segment_index)} edges), reusing")
+            return
+
+        if len(sig_map) != len(segments) or not self._apply_segment_diff(sig_map):
+            self._rebuild_segment_graph(segments, sig_map)
+
+    def _rebuild_segment_graph(self, segments: List[Dict], sig_map: Dict[str, Tuple[Tuple, Dict]]):
+        """Rebuild the segment graph and index from scratch"""
         self.segment_graph.clear()
         self.segment_index.clear()
+        self._segment_origin.clear()
+        self._node_departs.clear()
+        self._grid_buckets = None
+        self._segment_cost_rate = None
+        self._reverse_adj = None
+        self._node_intern.clear()
 
         skipped = 0
         success_count = 0
 
         # Debug: show sample raw origin type to diagnose format issues
-        if segments:
+        if segments and self.logger.isEnabledFor(logging.DEBUG):
             first_seg = segments[0]
-            self.logger.info(f"DEBUG: Sample Raw Segment Origin: {first_seg.get('origin')} (Type: {type(first_seg.get('origin'))})")
+            self.logger.debug(f"Sample Raw Segment Origin: {first_seg.get('origin')} (Type: {type(first_seg.get('origin'))})")
 
         for segment in segments:
-            origin = self._parse_coordinate(segment.get('origin'))
-            destination = self._parse_coordinate(segment.get('destination'))
+            origin = self._node_key(segment.get('origin'))
+            destination = self._node_key(segment.get('destination'))
 
             if not origin or not destination:
                 skipped += 1
@@ -150,15 +262,110 @@ class DecentralizedBundleRouter:
 
             try:
                 segment_id = segment.get('segment_id', 'unknown')
-                self.segment_graph[origin].append((destination, segment))
+                self.segment_graph[origin].append(SegmentEdge.from_segment(destination, segment))
                 self.segment_index[segment_id] = segment
+                self._segment_origin[segment_id] = origin
                 success_count += 1
             except Exception as e:
                 self.logger.warning(f"Skipping segment due to unexpected error: {e}")
                 skipped += 1
                 continue
 
+        for node in self.segment_graph:
+            self._sort_node_edges(node)
+
+        # Duplicate segment IDs can't be diffed by ID; force a rebuild next time
+        self._segment_sigs = {sid: sig for sid, (sig, _) in sig_map.items()} if len(sig_map) == len(segments) else None
+
         self.logger.info(f"Built segment graph: {len(self.segment_graph)} nodes, {success_count} edges loaded. (Skipped {skipped} invalid/malformed)")
+
+    def _apply_segment_diff(self, sig_map: Dict[str, Tuple[Tuple, Dict]]) -> bool:
+        """
+        Patch the graph with added/withdrawn/changed segments
+
+        Returns False (leaving the graph untouched) when a full rebuild is required or cheaper.
+        """
+        old_sigs = self._segment_sigs
+        if old_sigs is None:
+            return False
+
+        removed = [sid for sid, sig in old_sigs.items() if sid not in sig_map or sig_map[sid][0] != sig]
+        added = [sid for sid, (sig, _) in sig_map.items() if old_sigs.get(sid) != sig]
+        if len(removed) + len(added) > len(sig_map):
+            return False
+
+        self._grid_buckets = None
+        self._segment_cost_rate = None
+        self._reverse_adj = None
+
+        # Withdraw edges, grouped by origin node so each edge list is filtered once
+        stale_by_origin = defaultdict(set)
+        for sid in removed:
+            segment = self.segment_index.pop(sid, None)
+            origin = self._segment_origin.pop(sid, None)
+            if segment is not None and origin is not None:
+                stale_by_origin[origin].add(id(segment))
+            del old_sigs[sid]
+        for origin, stale_ids in stale_by_origin.items():
+            edges = [edge for edge in self.segment_graph.get(origin, []) if id(edge.segment) not in stale_ids]
+            if edges:
+                self.segment_graph[origin] = edges
+            else:
+                self.segment_graph.pop(origin, None)
+                self._node_departs.pop(origin, None)
+        touched = {origin for origin in stale_by_origin if origin in self.segment_graph}
+
+        skipped = 0
+        for sid in added:
+            sig, segment = sig_map[sid]
+            old_sigs[sid] = sig
+            origin = self._node_key(segment.get('origin'))
+            destination = self._node_key(segment.get('destination'))
+            if not origin or not destination:
+                skipped += 1
+                continue
+            self.segment_graph[origin].append(SegmentEdge.from_segment(destination, segment))
+            self.segment_index[sid] = segment
+            self._segment_origin[sid] = origin
+            touched.add(origin)
+
+        for node in touched:
+            self._sort_node_edges(node)
+
+        self.logger.info(f"Patched segment graph: -{len(removed)} +{len(added) - skipped} edges, "
+                         f"{len(self.segment_graph)} nodes (Skipped {skipped} invalid/malformed)")
+        return True
+
+    def _sort_node_edges(self, node: Tuple[int, int]):
+        """
+        Order a node's edges timed-first by depart time and record the depart times
+
+        Walk edges leave whenever the traveller arrives, so they follow the timed edges
+        unsorted and are always scanned; timed edges are window-sliced with bisect.
+        """
+        edges = self.segment_graph[node]
+        edges.sort(key=lambda edge: (edge.is_walk, 0 if edge.is_walk else edge.depart))
+        self._node_departs[node] = [edge.depart for edge in edges if not edge.is_walk]
+
+    @staticmethod
+    def _segment_signature(segment: Dict) -> Tuple:
+        """
+        Mutable fields that affect routing; a segment whose signature changes is re-added to the graph.
+        Origin/destination are fixed for a given segment_id, so they are not compared.
+        """
+        get = segment.get
+        return (get('status'), get('depart_time'), get('arrive_time'), get('price'), get('mode'))
+
+    def _remove_walk_edges(self):
+        """Strip the virtual walk edges added by the previous _inject_walk_edges call"""
+        for node, base_len in self._walk_base_len.items():
+            edges = self.segment_graph.get(node)
+            if edges is None:
+                continue
+            del edges[base_len:]
+            if not edges:
+                del self.segment_graph[node]
+        self._walk_base_len.clear()
     
     def build_bundles(
         self,
@@ -167,7 +374,8 @@ class DecentralizedBundleRouter:
         active_segments: List[Dict],
         start_time: int,
         max_transfers: int = 3,
-        time_tolerance: int = 5
+        time_tolerance: int = 5,
+        max_bundles: int = 10
     ) -> List[Dict]:
         """
         DECENTRALIZED: Build bundle options using distributed graph traversal
@@ -182,9 +390,10 @@ class DecentralizedBundleRouter:
             start_time: Desired departure tick
             max_transfers: Maximum number of segments in bundle
             time_tolerance: Acceptable time deviation (ticks)
+            max_bundles: Number of best bundles to return
             
         Returns:
-            List of bundle options, each containing:
+            List of the best bundle options, each containing:
                 - bundle_id: Unique identifier
                 - segments: List of segment dictionaries
                 - total_price: Sum of segment prices
@@ -198,34 +407,39 @@ class DecentralizedBundleRouter:
         # Inject virtual walk edges for first/last mile to connect origins/destinations to network
         origin_tuple = (round(origin[0]), round(origin[1]))
         destination_tuple = (round(destination[0]), round(destination[1]))
+        # Reuse the graph's node objects so identity checks in the search hold
+        origin_tuple = self._node_intern.get(origin_tuple, origin_tuple)
+        destination_tuple = self._node_intern.get(destination_tuple, destination_tuple)
         self._inject_walk_edges(origin_tuple, destination_tuple, start_time)
 
-        # Find all possible paths using depth-first search
-        self.logger.info(f"🔍 Searching for paths from {origin_tuple} to {destination_tuple}")
-        self.logger.info(f"   Graph has {len(self.segment_graph)} origin nodes")
-        self.logger.info(f"   Start time: {start_time}, Max transfers: {max_transfers}, Time tolerance: {time_tolerance}")
+        # Find the best paths using best-first search
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug(f"🔍 Searching for paths from {origin_tuple} to {destination_tuple}")
+            self.logger.debug(f"   Graph has {len(self.segment_graph)} origin nodes")
+            self.logger.debug(f"   Start time: {start_time}, Max transfers: {max_transfers}, Time tolerance: {time_tolerance}")
 
-        # Log sample graph nodes
-        if self.segment_graph:
-            sample_nodes = list(self.segment_graph.items())[:5]
-            self.logger.info(f"   Sample graph nodes:")
-            for node_origin, edges in sample_nodes:
-                self.logger.info(f"     {node_origin} -> {len(edges)} edges to {[dest for dest, _ in edges]}")
+            # Log sample graph nodes
+            if self.segment_graph:
+                self.logger.debug(f"   Sample graph nodes:")
+                for node_origin, edges in itertools.islice(self.segment_graph.items(), 5):
+                    self.logger.debug(f"     {node_origin} -> {len(edges)} edges to {[edge.destination for edge in edges]}")
 
-        # Check if origin is in graph or nearby
-        nearby_origins = [node for node in self.segment_graph.keys()
-                         if self._is_close_enough(origin_tuple, node, threshold=4.0)]
-        self.logger.info(f"   Found {len(nearby_origins)} nodes near origin: {nearby_origins[:5]}")
+            # Check if origin is in graph or nearby
+            nearby_origins = self._nearby_nodes(origin_tuple, 4.0)
+            self.logger.debug(f"   Found {len(nearby_origins)} nodes near origin: {nearby_origins[:5]}")
 
-        all_paths = self._find_all_paths(
+        all_paths = self._find_top_k_paths(
             origin_tuple,
             destination_tuple,
             start_time,
             max_transfers,
-            time_tolerance
+            time_tolerance,
+            max_bundles
         )
 
-        self.logger.info(f"   Found {len(all_paths)} valid paths")
+        if debug:
+            self.logger.debug(f"   Found {len(all_paths)} valid paths")
         
         # Convert paths to bundle format
         bundles = []
@@ -234,45 +448,36 @@ class DecentralizedBundleRouter:
             if bundle:
                 bundles.append(bundle)
         
-        # Sort by utility score (highest first)
-        bundles.sort(key=lambda b: b.get('utility_score', 0), reverse=True)
+        # Keep the best max_bundles by utility score (highest first)
+        bundles = heapq.nlargest(max_bundles, bundles, key=lambda b: b.get('utility_score', 0))
         
         self.logger.info(f"Built {len(bundles)} bundle options for {origin} -> {destination}")
         return bundles
     
-    def _find_all_paths(
+    def _find_top_k_paths(
         self,
         current: Tuple[float, float],
         destination: Tuple[float, float],
-        current_time: int,
+        start_time: int,
         max_depth: int,
         time_tolerance: int,
-        current_path: List[Dict] = None,
-        visited: Set[Tuple] = None
+        k: int = 10
     ) -> List[List[Dict]]:
         """
-        Recursive depth-first search to find all valid paths
-        
-        This is the core decentralized routing algorithm - no central coordinator needed
+        Best-first search for the k highest-utility paths
+
+        This is the core decentralized routing algorithm - no central coordinator needed.
+        Partial paths are expanded in order of a lower bound on their final bundle cost
+        (the negated utility_score of _create_bundle_from_path), so completed paths pop
+        cheapest-first and the search stops after k of them. The bound is admissible:
+        every extension adds non-negative price, time and wait, the multi-modal
+        discount never exceeds MAX_BUNDLE_DISCOUNT, and the straight-line distance still
+        to cover costs at least the cheapest edge's cost per unit distance.
         """
-        if current_path is None:
-            current_path = []
-        if visited is None:
-            visited = set()
-        
-        # Base case: reached destination
+        # Base case: already at destination (an empty path is not a bundle)
         # Use larger threshold to account for grid-aligned segments (3-unit grid)
-        if self._is_close_enough(current, destination, threshold=4.0):
-            return [current_path] if current_path else []
-        
-        # Base case: max depth reached
-        if len(current_path) >= max_depth:
+        if k <= 0 or max_depth <= 0 or self._is_close_enough(current, destination, threshold=4.0):
             return []
-        
-        # Mark current location as visited
-        visited.add(current)
-        
-        all_paths = []
 
         # Explore all outgoing segments from current location AND nearby locations
         # This allows matching even when origin/destination don't exactly align with grid
@@ -281,98 +486,331 @@ class DecentralizedBundleRouter:
         # Check exact location first
         nearby_segments.extend(self.segment_graph.get(current, []))
 
-        # For first segment only, also check nearby grid points
-        if len(current_path) == 0:
-            # Check nearby grid points (within 4 units) for starting segments (3-unit grid)
-            for node_loc in self.segment_graph.keys():
-                if node_loc != current and self._is_close_enough(current, node_loc, threshold=4.0):
-                    nearby_segments.extend(self.segment_graph.get(node_loc, []))
+        # For first segment, also check nearby grid points (within 4 units) (3-unit grid)
+        for node_loc in self._nearby_nodes(current, 4.0):
+            if node_loc != current:
+                nearby_segments.extend(self.segment_graph.get(node_loc, []))
 
-        # Track rejections for debugging (only for first call)
+        # Track rejections for debugging
         rejections = {'visited': 0, 'time_early': 0, 'time_late': 0, 'status': 0, 'explored': 0}
 
-        # Explore all found segments
-        for next_location, segment in nearby_segments:
-            # Skip if already visited (avoid cycles)
-            if next_location in visited:
+        # Heap entries: (cost, tiebreak, path_state); equal costs pop in insertion order.
+        # Path state: (node, node_time, depth, price, time_cost, prev_arrive, segments, visited),
+        # with segments/visited as shared (item, parent) chains.
+        heap = []
+        tiebreak = itertools.count()
+        # Dominance labels per (node, node_time, prev_arrive, depth) -> [(price, time_cost, visited_nodes)]
+        pareto = {}
+        # Negated costs of the k cheapest completed paths queued so far (max-heap)
+        completed = []
+        cost_rate = self._min_cost_per_distance()
+        min_hops = self._hops_to_destination(destination, max_depth)
+        search = (heap, tiebreak, pareto, completed, k, destination, max_depth, cost_rate, min_hops)
+        root = (current, start_time, 0, 0.0, 0.0, start_time, None, (current, None))
+
+        for edge in nearby_segments:
+            # Skip if returning to the start (avoid cycles)
+            if edge.destination is current:
                 rejections['visited'] += 1
                 continue
 
             # Check time compatibility
-            # For first segment: must depart at or after start time
-            # For subsequent segments: must depart after previous arrival (with tolerance for waiting)
+            # First segment: must depart at or after start time (allow early departure within tolerance)
             # Walk segments: allow immediate departure; set arrival based on duration
-            if segment.get('mode') == 'walk':
-                walk_duration = segment.get('duration', 1)
-                segment_depart = current_time
-                segment_arrive = current_time + walk_duration
+            if edge.is_walk:
+                segment_depart = start_time
+                segment_arrive = start_time + edge.walk_time
             else:
-                segment_depart = segment.get('depart_time', 0)
-                segment_arrive = segment.get('arrive_time', segment_depart)
+                segment_depart = edge.depart
+                segment_arrive = edge.arrive
 
-            if len(current_path) == 0:
-                # First segment: can depart at or after start time (allow early departure within tolerance)
-                if segment_depart < current_time - time_tolerance:
-                    rejections['time_early'] += 1
-                    continue
-                # Don't depart too far in the future
-                if segment_depart > current_time + time_tolerance * 2:
-                    rejections['time_late'] += 1
-                    continue
-            else:
-                # Subsequent segments: must depart after we arrive from previous segment
-                # Allow waiting between segments (up to time_tolerance * 5)
-                if segment_depart < current_time:
-                    rejections['time_early'] += 1
-                    continue
-                if segment_depart > current_time + time_tolerance * 5:  # Allow longer wait for transfers
-                    rejections['time_late'] += 1
-                    continue
+            if segment_depart < start_time - time_tolerance:
+                rejections['time_early'] += 1
+                continue
+            # Don't depart too far in the future
+            if segment_depart > start_time + time_tolerance * 2:
+                rejections['time_late'] += 1
+                continue
 
             # Check if segment is still available
-            if segment.get('status') != 'available':
+            if not edge.available:
                 rejections['status'] += 1
                 continue
 
             rejections['explored'] += 1
+            self._push_path(search, root, edge, segment_arrive)
+
+        # Log rejections for first-level search
+        if nearby_segments and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"   First-level search: {len(nearby_segments)} segments found, "
+                            f"{rejections['explored']} explored, "
+                            f"{rejections['visited']} visited, "
+                            f"{rejections['time_early']} too early, "
+                            f"{rejections['time_late']} too late, "
+                            f"{rejections['status']} wrong status")
+
+        graph = self.segment_graph
+        node_departs = self._node_departs
+        window = time_tolerance * 5
+        paths = []
+        while heap and len(paths) < k:
+            _, _, state = heapq.heappop(heap)
+            node, node_time, _, _, _, _, segments, visited = state
+            if node is None:
+                # Completed path: unwind the segment chain
+                path = []
+                while segments is not None:
+                    path.append(segments[0])
+                    segments = segments[1]
+                path.reverse()
+                paths.append(path)
+                continue
 
-            # Recursively explore from next location
-            # Next time is when we ARRIVE at the next location (not current_time + duration)
-            next_time = segment_arrive
-            
-            paths_from_here = self._find_all_paths(
-                next_location,
-                destination,
-                next_time,
-                max_depth,
-                time_tolerance,
-                current_path + [segment],
-                visited.copy()
-            )
+            edges = graph.get(node)
+            if not edges:
+                continue
+            # Must depart after we arrive from previous segment
+            # Allow waiting between segments (up to time_tolerance * 5): timed edges are sorted
+            # by depart time, so the window is a slice; walk edges after them depart on arrival
+            departs = node_departs.get(node, ())
+            lo = bisect_left(departs, node_time)
+            hi = bisect_right(departs, node_time + window, lo)
+            for edge in itertools.chain(edges[lo:hi], edges[len(departs):]):
+                # Check if segment is still available
+                if not edge.available:
+                    continue
 
-            all_paths.extend(paths_from_here)
+                if edge.is_walk:
+                    segment_arrive = node_time + edge.walk_time
+                else:
+                    segment_arrive = edge.arrive
+
+                # Skip if already visited (avoid cycles)
+                next_location = edge.destination
+                link = visited
+                while link is not None and link[0] is not next_location:
+                    link = link[1]
+                if link is not None:
+                    continue
 
-        # Log rejections for first-level search only
-        if len(current_path) == 0 and len(nearby_segments) > 0:
-            self.logger.info(f"   First-level search: {len(nearby_segments)} segments found, "
-                           f"{rejections['explored']} explored, "
-                           f"{rejections['visited']} visited, "
-                           f"{rejections['time_early']} too early, "
-                           f"{rejections['time_late']} too late, "
-                           f"{rejections['status']} wrong status")
+                self._push_path(search, state, edge, segment_arrive)
+
+        return paths
+
+    def _push_path(self, search, state, edge, next_time):
+        """
+        Extend a path state by one segment and queue it
+
+        Costs mirror _create_bundle_from_path. A path reaching the destination is queued with
+        its exact cost (and node None); otherwise with a lower bound that assumes the maximum
+        discount and adds the remaining distance at the cheapest cost per unit distance.
+        Paths that cannot reach the destination within max_depth segments are dropped, as is
+        any path whose cost or bound is no better than k completed paths already queued: those
+        pop first.
+
+        A partial path is also dropped when k others already reached the same node at the same
+        time and depth, after the same previous arrival, with no more price or time cost and a
+        subset of its visited nodes: each of those has a no-worse completion for every
+        completion of this one, so it cannot make the top k.
+        """
+        heap, tiebreak, pareto, completed, k, destination, max_depth, cost_rate, min_hops = search
+        _, _, depth, price, time_cost, prev_arrive, segments, visited = state
+        next_location = edge.destination
+        weighted = edge.duration * 2.5 if edge.is_walk else edge.duration
+        time_cost += 0.5 * (weighted + 2.0 * max(0, edge.depart - prev_arrive))
+        price += edge.price
+        depth += 1
+        segments = (edge.segment, segments)
+
+        if self._is_close_enough(next_location, destination, threshold=4.0):
+            discount_rate = min(self.MAX_BUNDLE_DISCOUNT, (depth - 1) * 0.05)
+            cost = price * (1 - discount_rate) + time_cost
+            if len(completed) < k:
+                heapq.heappush(completed, -cost)
+            elif cost < -completed[0]:
+                heapq.heapreplace(completed, -cost)
+            else:
+                return
+            heapq.heappush(heap, (cost, next(tiebreak), (None, None, depth, price, time_cost, None, segments, None)))
+        elif depth < max_depth:
+            hops = min_hops.get(next_location)
+            if hops is None or depth + hops > max_depth:
+                return
+
+            # Any completion must still get within the 4.0 arrival threshold of the destination
+            remaining = self._distance(next_location, destination) - 4.0
+            cost = price * (1 - self.MAX_BUNDLE_DISCOUNT) + time_cost
+            if remaining > 0:
+                cost += cost_rate * remaining
+            if len(completed) >= k and cost >= -completed[0]:
+                return
+
+            visited = (next_location, visited)
+            arrive = edge.wait_from
+
+            label = [price, time_cost, visited, None]
+            labels = pareto.get((next_location, next_time, arrive, depth))
+            if labels is None:
+                pareto[(next_location, next_time, arrive, depth)] = [label]
+            else:
+                # Visited-node sets are only built once k labels are cheaper on both costs
+                cheaper = [other for other in labels if other[0] <= price and other[1] <= time_cost]
+                if len(cheaper) >= k:
+                    nodes = label[3] = self._chain_nodes(visited)
+                    dominated_by = 0
+                    for other in cheaper:
+                        if other[3] is None:
+                            other[3] = self._chain_nodes(other[2])
+                        if other[3] <= nodes:
+                            dominated_by += 1
+                            if dominated_by >= k:
+                                return
+                # Bounded label lists keep the check cheap; dropping labels only prunes less
+                if len(labels) < 2 * k:
+                    labels.append(label)
+
+            heapq.heappush(heap, (cost, next(tiebreak), (
+                next_location, next_time, depth, price, time_cost, arrive, segments, visited
+            )))
+
+    def _hops_to_destination(self, destination: Tuple[int, int], max_depth: int) -> Dict[Tuple[int, int], int]:
+        """
+        Fewest segments from each node to an arrival at the destination, up to max_depth - 1
+
+        Reverse breadth-first search over available edges that ignores timing, so it is a lower
+        bound for any feasible completion. Nodes missing from the result cannot arrive within
+        max_depth - 1 segments. The segment-edge reverse adjacency is cached per graph change.
+        """
+        graph = self.segment_graph
+        walk_base_len = self._walk_base_len
+        reverse = self._reverse_adj
+        if reverse is None:
+            reverse = defaultdict(set)
+            for node, edges in graph.items():
+                for edge in edges[:walk_base_len.get(node, len(edges))]:
+                    if edge.available:
+                        reverse[edge.destination].add(node)
+            self._reverse_adj = reverse
+        walk_reverse = defaultdict(set)
+        for node, base_len in walk_base_len.items():
+            for edge in graph.get(node, ())[base_len:]:
+                walk_reverse[edge.destination].add(node)
+
+        hops = {}
+        frontier = [node for node in itertools.chain(reverse, walk_reverse)
+                    if self._is_close_enough(node, destination, threshold=4.0)]
+        for level in range(1, max_depth):
+            next_frontier = []
+            for node in frontier:
+                for pred in itertools.chain(reverse.get(node, ()), walk_reverse.get(node, ())):
+                    if pred not in hops:
+                        hops[pred] = level
+                        next_frontier.append(pred)
+            frontier = next_frontier
+        return hops
+
+    def _min_cost_per_distance(self) -> float:
+        """
+        Least search cost any edge adds per unit of straight-line distance it covers
+
+        An edge adds at least its maximally discounted price plus its weighted duration, so
+        a path still this far from the destination costs at least rate * distance more.
+        Segment edges are scanned once per graph change; this call's walk edges every time.
+        """
+        walk_base_len = self._walk_base_len
+        rate = self._segment_cost_rate
+        if rate is None:
+            rate = math.inf
+            for node, edges in self.segment_graph.items():
+                for edge in edges[:walk_base_len.get(node, len(edges))]:
+                    rate = min(rate, self._edge_cost_rate(node, edge))
+            self._segment_cost_rate = rate
+        for node, base_len in walk_base_len.items():
+            for edge in self.segment_graph.get(node, ())[base_len:]:
+                rate = min(rate, self._edge_cost_rate(node, edge))
+        return rate if rate != math.inf else 0.0
+
+    def _edge_cost_rate(self, node: Tuple[int, int], edge: SegmentEdge) -> float:
+        """Lower-bound search cost of an edge per unit distance (inf for zero-length edges)"""
+        length = self._distance(node, edge.destination)
+        if length <= 0:
+            return math.inf
+        weighted = edge.duration * 2.5 if edge.is_walk else edge.duration
+        return max(0.0, edge.price * (1 - self.MAX_BUNDLE_DISCOUNT) + 0.5 * weighted) / length
+
+    @staticmethod
+    def _chain_nodes(link: Optional[Tuple]) -> frozenset:
+        """Nodes in a (node, parent) visited chain"""
+        nodes = []
+        while link is not None:
+            nodes.append(link[0])
+            link = link[1]
+        return frozenset(nodes)
 
-        return all_paths
-    
     def _is_close_enough(self, loc1: Tuple[float, float], loc2: Tuple[float, float], threshold: float = 0.5) -> bool:
         """Check if two locations are within threshold distance"""
-        distance = math.sqrt((loc1[0] - loc2[0])**2 + (loc1[1] - loc2[1])**2)
-        return distance <= threshold
+        dx = loc1[0] - loc2[0]
+        dy = loc1[1] - loc2[1]
+        return dx * dx + dy * dy <= threshold * threshold
+
+    def _nearby_nodes(self, point: Tuple[float, float], radius: float) -> List[Tuple[int, int]]:
+        """
+        Segment-graph nodes within radius of point, in graph iteration order
+
+        Small radii scan only the grid cells they overlap; wide radii (which would touch most
+        cells) filter all nodes in one vectorized pass. Walk-only nodes added by
+        _inject_walk_edges are not indexed.
+        """
+        if self._grid_buckets is None:
+            self._build_grid_index()
+
+        cell = self.GRID_CELL
+        px, py = point
+        if radius > cell:
+            xy = self._nodes_xy
+            d2 = (xy[:, 0] - px) ** 2 + (xy[:, 1] - py) ** 2
+            node_list = self._node_list
+            return [node_list[i] for i in np.flatnonzero(d2 <= radius * radius)]
+
+        cx, cy = int(px // cell), int(py // cell)
+        reach = int(math.ceil(radius / cell))
+        radius_sq = radius * radius
+        buckets = self._grid_buckets
+
+        nearby = []
+        for gx in range(cx - reach, cx + reach + 1):
+            for gy in range(cy - reach, cy + reach + 1):
+                for node in buckets.get((gx, gy), ()):
+                    dx = node[0] - px
+                    dy = node[1] - py
+                    if dx * dx + dy * dy <= radius_sq:
+                        nearby.append(node)
+        nearby.sort(key=self._node_order.__getitem__)
+        return nearby
+
+    def _build_grid_index(self):
+        """Bucket the current segment-graph nodes into GRID_CELL-sized cells"""
+        cell = self.GRID_CELL
+        buckets = defaultdict(list)
+        order = {}
+        node_list = list(self.segment_graph.keys())
+        for i, node in enumerate(node_list):
+            buckets[(int(node[0] // cell), int(node[1] // cell))].append(node)
+            order[node] = i
+        self._grid_buckets = buckets
+        self._node_order = order
+        self._node_list = node_list
+        self._nodes_xy = np.array(node_list, dtype=np.int64).reshape(-1, 2)
 
     def _inject_walk_edges(self, origin: Tuple[float, float], destination: Tuple[float, float], start_time: int, radius: float = 10.0):
         """
         Add virtual walk segments to connect origin/destination to nearby network nodes.
         """
-        nodes = list(self.segment_graph.keys())
+        # Candidate nodes near either endpoint, visited in graph order
+        candidates = set(self._nearby_nodes(origin, radius))
+        candidates.update(self._nearby_nodes(destination, radius))
+        nodes = sorted(candidates, key=self._node_order.__getitem__)
+        walk_base_len = self._walk_base_len
         for node in nodes:
             # First mile: origin -> node
             dist_o = self._distance(origin, node)
@@ -392,7 +830,9 @@ class DecentralizedBundleRouter:
                     'capacity': 9999,
                     'status': 'available'
                 }
-                self.segment_graph[origin].append((node, walk_seg))
+                if origin not in walk_base_len:
+                    walk_base_len[origin] = len(self.segment_graph.get(origin, ()))
+                self.segment_graph[origin].append(SegmentEdge.from_segment(node, walk_seg))
 
             # Last mile: node -> destination
             dist_d = self._distance(node, destination)
@@ -412,7 +852,9 @@ class DecentralizedBundleRouter:
                     'capacity': 9999,
                     'status': 'available'
                 }
-                self.segment_graph[node].append((destination, walk_seg))
+                if node not in walk_base_len:
+                    walk_base_len[node] = len(self.segment_graph[node])
+                self.segment_graph[node].append(SegmentEdge.from_segment(destination, walk_seg))
 
     def _distance(self, a: Tuple[float, float], b: Tuple[float, float]) -> float:
         return math.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2)
@@ -424,33 +866,35 @@ class DecentralizedBundleRouter:
         if not segments:
             return None
         
-        # Calculate bundle metrics with walk/wait disutility
-        total_price = sum(seg.get('price', 0) for seg in segments)
-        total_duration = segments[-1].get('arrive_time', 0) - segments[0].get('depart_time', 0)
+        # Calculate bundle metrics with walk/wait disutility in one pass
         num_transfers = len(segments) - 1
+        first_depart = segments[0].get('depart_time', 0)
 
+        total_price = 0
         walk_time = 0
         wait_time = 0
         in_vehicle_time = 0
+        modes = []
 
         # First wait: ready at start_time
-        first_depart = segments[0].get('depart_time', 0)
-        wait_time += max(0, first_depart - start_time)
-
-        for i, seg in enumerate(segments):
-            duration = seg.get('duration', 0)
-            if seg.get('mode') == 'walk':
+        prev_arrive = start_time
+        for seg in segments:
+            get = seg.get
+            duration = get('duration', 0)
+            mode = get('mode')
+            if mode == 'walk':
                 walk_time += duration
             else:
                 in_vehicle_time += duration
+            wait_time += max(0, get('depart_time', 0) - prev_arrive)
+            total_price += get('price', 0)
+            modes.append(mode)
+            prev_arrive = get('arrive_time', 0)
 
-            if i > 0:
-                prev_arrive = segments[i - 1].get('arrive_time', 0)
-                curr_depart = seg.get('depart_time', 0)
-                wait_time += max(0, curr_depart - prev_arrive)
+        total_duration = prev_arrive - first_depart
 
         # Apply multi-modal discount (5% per additional segment, max 15%)
-        discount_rate = min(0.15, num_transfers * 0.05)
+        discount_rate = min(self.MAX_BUNDLE_DISCOUNT, num_transfers * 0.05)
         discounted_price = total_price * (1 - discount_rate)
 
         # Calculate utility score (lower is better: price + time penalty)
@@ -471,9 +915,9 @@ class DecentralizedBundleRouter:
             'num_transfers': num_transfers,
             'num_segments': len(segments),
             'utility_score': utility_score,
-            'expected_depart_time': segments[0].get('depart_time', 0),
-            'expected_arrive_time': segments[-1].get('arrive_time', 0),
-            'modes': [seg.get('mode') for seg in segments],
+            'expected_depart_time': first_depart,
+            'expected_arrive_time': prev_arrive,
+            'modes': modes,
             'walk_time': walk_time,
             'wait_time': wait_time,
             'in_vehicle_time': in_vehicle_time
@@ -481,9 +925,16 @@ class DecentralizedBundleRouter:
     
     def _generate_bundle_id(self, segments: List[Dict]) -> str:
         """Generate unique bundle ID from segment composition"""
-        segment_ids = [seg.get('segment_id', '') for seg in segments]
-        bundle_str = '_'.join(sorted(segment_ids))
-        return hashlib.md5(bundle_str.encode()).hexdigest()[:16]
+        # Not security-sensitive: BLAKE2 with an 8-byte digest keeps the 16-hex-char ID and is cheaper than MD5
+        bundle_str = '\0'.join(sorted(seg.get('segment_id', '') for seg in segments))
+        return hashlib.blake2b(bundle_str.encode(), digest_size=8).hexdigest()
+
+    def _node_key(self, coord) -> Optional[Tuple[int, int]]:
+        """Parse a coordinate into its interned node tuple"""
+        parsed = self._parse_coordinate(coord)
+        if parsed is None:
+            return None
+        return self._node_intern.setdefault(parsed, parsed)
 
     def _parse_coordinate(self, coord) -> Optional[Tuple[int, int]]:
         """
@@ -496,15 +947,17 @@ class DecentralizedBundleRouter:
         try:
             # Already list/tuple
             if isinstance(coord, (list, tuple)):
+                if len(coord) == 2 and type(coord[0]) is int and type(coord[1]) is int:
+                    # Grid coordinates are plain ints already; nothing to round
+                    return coord if type(coord) is tuple else (coord[0], coord[1])
                 if len(coord) >= 2:
                     return (round(float(coord[0])), round(float(coord[1])))
 
             # String representation: "[10, 20]" or "10,20" etc.
             if isinstance(coord, str):
-                clean = coord.replace('[', '').replace(']', '').replace('(', '').replace(')', '')
-                parts = [float(x.strip()) for x in clean.split(',') if x.strip() != '']
-                if len(parts) >= 2:
-                    return (round(parts[0]), round(parts[1]))
+                nums = _COORD_RE.findall(coord)
+                if len(nums) >= 2:
+                    return (round(float(nums[0])), round(float(nums[1])))
         except (ValueError, TypeError, AttributeError):
             return None
 
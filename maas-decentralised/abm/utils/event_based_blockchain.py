@@ -6,14 +6,62 @@ Handles asynchronous transaction processing using blockchain events
 
 import time
 import json
+import heapq
+import asyncio
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict, deque
 from dataclasses import dataclass
+from functools import lru_cache
+from operator import itemgetter
 from typing import Dict, List, Optional, Callable, Any
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from hexbytes import HexBytes
 from web3 import Web3
+from web3.datastructures import AttributeDict
 from web3.middleware import geth_poa_middleware
 from eth_account import Account
+from eth_utils import event_abi_to_log_topic
+
+try:
+    import websockets  # Installed with web3; only needed for the ws_rpc_url push stream
+except ImportError:
+    websockets = None
+
+try:
+    import orjson  # Optional: faster JSON for RPC payloads, config and ABI files
+except ImportError:
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _orjson_default(value):
+    """Serialize the web3 types orjson does not handle natively"""
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    if isinstance(value, AttributeDict):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+@lru_cache(maxsize=None)
+def _load_abi(abi_path: str) -> list:
+    """Parsed ABI of a compiled contract artifact, read once per process (do not mutate)"""
+    with open(abi_path, 'rb') as f:
+        return _json_loads(f.read())['abi']
+
+
+@lru_cache(maxsize=None)
+def _event_topic(abi_path: str, event_name: str) -> bytes:
+    """topic0 (signature hash) of an event in a contract artifact"""
+    for entry in _load_abi(abi_path):
+        if entry.get('type') == 'event' and entry.get('name') == event_name:
+            return event_abi_to_log_topic(entry)
+    raise ValueError(f"Event {event_name} not found in {abi_path}")
 
 @dataclass
 class PendingTransaction:
@@ -30,10 +78,37 @@ class EventSubscription:
     """Represents an event subscription"""
     contract_name: str
     event_name: str
-    filter_obj: Any
+    event: Any          # Contract event class, used to decode matching logs
+    address: str        # Emitting contract address
+    topic: bytes        # topic0 (event signature hash)
     callback: Callable
     from_block: str = 'latest'
 
+class ShardedIdSet:
+    """
+    Set of integer IDs split across independent dicts
+
+    Written by the event monitor and read from caller threads: a growing shard only
+    rehashes its own 1/SHARDS of the IDs, so a resize holds the GIL far shorter.
+    """
+    SHARDS = 16  # Power of two, so the shard is id & (SHARDS - 1)
+    
+    def __init__(self):
+        self._shards: List[Dict[int, None]] = [{} for _ in range(self.SHARDS)]
+    
+    def add(self, item_id: int):
+        self._shards[item_id & (self.SHARDS - 1)][item_id] = None
+    
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._shards[item_id & (self.SHARDS - 1)]
+    
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+    
+    def __iter__(self):
+        for shard in self._shards:
+            yield from shard
+
 class EventBasedBlockchain:
     """
     Event-based blockchain interface suitable for mainnet deployment
@@ -46,15 +121,27 @@ class EventBasedBlockchain:
     - No blocking waits
     """
     
+    # Event polling interval bounds (seconds) and idle polls before backing off
+    POLL_MIN_INTERVAL = 0.2
+    POLL_MAX_INTERVAL = 10.0
+    IDLE_POLLS_BEFORE_BACKOFF = 3
+    
+    TX_GAS_LIMIT = 500000  # Fixed gas limit for contract calls
+    FEE_CACHE_TTL = 12.0  # Seconds a fee estimate is reused when no new block has been seen
+    BATCH_WINDOW = 0.05  # Seconds queued registrations wait to share one multicall transaction
+    BATCH_MAX = 100  # Registrations per multicall transaction
+    
     def __init__(self, config_file="blockchain_config.json"):
         self.logger = logging.getLogger(self.__class__.__name__)
         
         # Load configuration
-        with open(config_file, 'r') as f:
-            self.config = json.load(f)
+        with open(config_file, 'rb') as f:
+            self.config = _json_loads(f.read())
         
-        # Initialize Web3
-        self.w3 = Web3(Web3.HTTPProvider(self.config['rpc_url']))
+        # Initialize Web3 over one keep-alive session, shared by the event monitor and submitters
+        self.session = self._create_rpc_session()
+        self.w3 = Web3(Web3.HTTPProvider(self.config['rpc_url'], session=self.session))
+        self._install_fast_json(self.w3.provider)
         if not self.w3.is_connected():
             raise ConnectionError("Cannot connect to blockchain")
         
@@ -62,28 +149,62 @@ class EventBasedBlockchain:
         if self.config.get('use_poa', False):
             self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
         
+        # Chain ID never changes for a connection; read it once
+        self.chain_id = self.w3.eth.chain_id
+        
         # Load contracts
+        self._abi_paths: Dict[str, str] = {}  # contract name -> artifact path
         self.contracts = self._load_contracts()
+        self._fns = self._resolve_facade_functions()
         
         # Transaction management
-        self.pending_transactions: Dict[str, PendingTransaction] = {}
-        self.nonce_manager = defaultdict(int)
+        self.pending_transactions: Dict[bytes, PendingTransaction] = {}  # Keyed by raw 32-byte tx hash
+        # (submit timestamp, tx_hash) in submission order; confirmed hashes are skipped on expiry
+        self._pending_order: deque = deque()
+        self.nonce_manager = defaultdict(int)  # address -> next nonce; the local source of truth
         self.nonce_lock = threading.Lock()
+        self._resync_nonce(self._get_api_account().address)
+        # Broadcasts run on one worker, in nonce order, so callers only pay for nonce
+        # reservation and signing; the node rejects a nonce that arrives ahead of its predecessor
+        self._submit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tx-submit')
+        # Held from nonce reservation until the broadcast is queued, so queue order is nonce order
+        self._submit_order_lock = threading.Lock()
+        self._last_queued_nonce: Dict[str, int] = {}  # address -> highest nonce queued for broadcast
+        # (commuter_id, address, callback) waiting for the next multiRegisterCommuter call
+        self._pending_batch: deque = deque()
+        self._batch_lock = threading.Lock()
         
         # Event management
         self.event_subscriptions: List[EventSubscription] = []
         self.event_callbacks: Dict[str, List[Callable]] = defaultdict(list)
+        # (contract address, topic0) -> subscription; one get_logs call per poll covers them all
+        self._topic_to_sub: Dict[tuple, EventSubscription] = {}
+        self._last_block = self.w3.eth.block_number  # Subscriptions see events after this block
+        self._last_block_time = time.time()  # When _last_block was reached
+        # (blockNumber, logIndex) of logs in block _last_block + 1 already dispatched from the stream
+        self._cursor_block_logs: set = set()
+        self._block_interval_ema: Optional[float] = None  # Observed seconds per block
+        self._idle_polls = 0
+        # (fee fields, block number, fetched at) - re-estimated once a newer block is seen
+        self._fee_cache: Optional[tuple] = None
         
         # State tracking
-        self.confirmed_registrations = set()
-        self.confirmed_requests = set()
-        self.confirmed_offers = set()
-        self.confirmed_matches = set()
+        self.confirmed_commuters = ShardedIdSet()  # Commuter IDs with confirmed registration
+        self.confirmed_providers = ShardedIdSet()  # Provider IDs with confirmed registration
+        self.confirmed_requests = ShardedIdSet()
+        self.confirmed_offers = ShardedIdSet()
+        self.confirmed_matches = ShardedIdSet()  # Request IDs with a recorded match
         
         # Background processing
         self.running = True
-        self.event_thread = None
-        self.cleanup_thread = None
+        self.monitor_thread = None
+        self._stop_event = threading.Event()  # Wakes the monitor thread on shutdown
+        # Timer queue of (deadline, order, task); each task returns seconds until its next run
+        self._schedule: List[tuple] = []
+        self._poll_interval = 1.0
+        self._ws_url: Optional[str] = None
+        self._ws_retry_at = 0.0
+        self._ws_reconnect_delay = 1
         
         # Statistics
         self.stats = {
@@ -95,13 +216,49 @@ class EventBasedBlockchain:
         
         self._start_event_monitoring()
     
+    @staticmethod
+    def _create_rpc_session() -> requests.Session:
+        """HTTP session with pooled keep-alive connections, so RPC calls skip the TCP/TLS handshake"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            # Connection-level retries only: POSTs are not re-sent after the node has read them
+            max_retries=Retry(total=3, backoff_factor=0.2)
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        return session
+    
+    @staticmethod
+    def _install_fast_json(provider):
+        """Encode requests and decode responses with orjson when it is installed"""
+        if orjson is None:
+            return
+        
+        encode_fallback = provider.encode_rpc_request
+        counter = provider.request_counter
+        
+        def encode_rpc_request(method, params):
+            try:
+                return orjson.dumps(
+                    {'jsonrpc': '2.0', 'method': method, 'params': params or [], 'id': next(counter)},
+                    default=_orjson_default
+                )
+            except TypeError:  # e.g. integers beyond 64 bits
+                return encode_fallback(method, params)
+        
+        provider.encode_rpc_request = encode_rpc_request
+        provider.decode_rpc_response = orjson.loads
+    
     def _load_contracts(self) -> Dict[str, Any]:
         """Load smart contract interfaces"""
         contracts = {}
         
         # Load deployment info
-        with open(self.config.get('deployment_info', 'deployed/simplified.json'), 'r') as f:
-            deployed = json.load(f)
+        with open(self.config.get('deployment_info', 'deployed/simplified.json'), 'rb') as f:
+            deployed = _json_loads(f.read())
         
         # Load contract ABIs and create contract instances
         contract_names = ['registry', 'request', 'auction', 'facade']
@@ -110,205 +267,375 @@ class EventBasedBlockchain:
             if name in deployed:
                 try:
                     abi_path = f"artifacts/contracts/MaaS{name.capitalize()}.sol/MaaS{name.capitalize()}.json"
-                    with open(abi_path, 'r') as f:
-                        contract_data = json.load(f)
-                    
                     contracts[name] = self.w3.eth.contract(
                         address=deployed[name],
-                        abi=contract_data['abi']
+                        abi=_load_abi(abi_path)
                     )
-                    self.logger.info(f"Loaded {name} contract at {deployed[name]}")
+                    self._abi_paths[name] = abi_path
+                    self.logger.info("Loaded %s contract at %s", name, deployed[name])
                 except Exception as e:
-                    self.logger.warning(f"Could not load {name} contract: {e}")
+                    self.logger.warning("Could not load %s contract: %s", name, e)
         
         return contracts
     
+    def _resolve_facade_functions(self) -> Dict[str, Any]:
+        """Facade function factories looked up once, so submissions skip web3's ABI attribute lookup"""
+        facade = self.contracts.get('facade')
+        if facade is None:
+            return {}
+        names = ('registerCommuter', 'multiRegisterCommuter', 'createRequestWithHash',
+                 'submitOfferHash', 'recordMatchResult')
+        # Deployed facades may predate some entrypoints; those calls fail when used, not here
+        return {name: getattr(facade.functions, name) for name in names if hasattr(facade.functions, name)}
+    
+    def _facade_function(self, name: str):
+        """Cached facade function factory"""
+        if not self._fns:
+            raise ValueError("Facade contract not available")
+        if name not in self._fns:
+            raise ValueError(f"Facade contract has no {name} function")
+        return self._fns[name]
+    
     def _start_event_monitoring(self):
-        """Start background event monitoring"""
-        self.event_thread = threading.Thread(target=self._event_monitor_loop, daemon=True)
-        self.event_thread.start()
-        
-        self.cleanup_thread = threading.Thread(target=self._cleanup_loop, daemon=True)
-        self.cleanup_thread.start()
+        """Start background event monitoring and pending-transaction cleanup on one thread"""
+        ws_url = self.config.get('ws_rpc_url')
+        if ws_url and websockets is None:
+            self.logger.warning("ws_rpc_url configured but the websockets package is missing; polling over HTTP")
+            ws_url = None
+        self._ws_url = ws_url
+        
+        now = time.time()
+        self._schedule = [
+            (now, 0, self._event_task),
+            (now, 1, self._cleanup_task),
+            (now, 2, self._batch_task)
+        ]
+        self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        self.monitor_thread.start()
         
         # Subscribe to key events
         self._subscribe_to_events()
     
     def _subscribe_to_events(self):
         """Subscribe to important blockchain events"""
-        
-        # Registry events
-        if 'registry' in self.contracts:
-            self.subscribe_to_event(
-                'registry', 'CommuterRegistered',
-                self._handle_commuter_registered
-            )
-            self.subscribe_to_event(
-                'registry', 'ProviderRegistered', 
-                self._handle_provider_registered
-            )
-        
-        # Request events
-        if 'request' in self.contracts:
-            self.subscribe_to_event(
-                'request', 'RequestCreated',
-                self._handle_request_created
-            )
-        
-        # Auction events
-        if 'auction' in self.contracts:
-            self.subscribe_to_event(
-                'auction', 'OfferSubmitted',
-                self._handle_offer_submitted
-            )
-            self.subscribe_to_event(
-                'auction', 'MatchRecorded',
-                self._handle_match_recorded
-            )
+        # (contract, event, confirmed ID set, ID arg, logged args, log message)
+        confirmations = [
+            ('registry', 'CommuterRegistered', self.confirmed_commuters, 'commuterId',
+             ('commuterId', 'account'), "✅ Commuter %s registration confirmed at %s"),
+            ('registry', 'ProviderRegistered', self.confirmed_providers, 'providerId',
+             ('providerId', 'account', 'mode'), "✅ Provider %s registration confirmed at %s (mode: %s)"),
+            ('request', 'RequestCreated', self.confirmed_requests, 'requestId',
+             ('requestId', 'commuterId'), "✅ Request %s created by commuter %s"),
+            ('auction', 'OfferSubmitted', self.confirmed_offers, 'offerId',
+             ('offerId', 'providerId', 'requestId'), "✅ Offer %s submitted by provider %s for request %s"),
+            ('auction', 'MatchRecorded', self.confirmed_matches, 'requestId',
+             ('requestId', 'offerId', 'providerId'), "✅ Match recorded: request %s, offer %s, provider %s"),
+        ]
+        for contract_name, event_name, confirmed, id_arg, log_args, message in confirmations:
+            if contract_name in self.contracts:
+                self.subscribe_to_event(
+                    contract_name, event_name,
+                    self._confirmation_handler(confirmed, id_arg, log_args, message)
+                )
     
     def subscribe_to_event(self, contract_name: str, event_name: str, callback: Callable):
         """Subscribe to a specific contract event"""
         if contract_name not in self.contracts:
-            self.logger.warning(f"Contract {contract_name} not available for event subscription")
+            self.logger.warning("Contract %s not available for event subscription", contract_name)
             return
         
         try:
             contract = self.contracts[contract_name]
             event = getattr(contract.events, event_name)
-            event_filter = event.createFilter(fromBlock='latest')
             
             subscription = EventSubscription(
                 contract_name=contract_name,
                 event_name=event_name,
-                filter_obj=event_filter,
+                event=event,
+                address=contract.address,
+                topic=_event_topic(self._abi_paths[contract_name], event_name),
                 callback=callback
             )
             
             self.event_subscriptions.append(subscription)
-            self.logger.info(f"Subscribed to {contract_name}.{event_name}")
+            self._topic_to_sub[(subscription.address, subscription.topic)] = subscription
+            self.logger.info("Subscribed to %s.%s", contract_name, event_name)
             
         except Exception as e:
-            self.logger.error(f"Failed to subscribe to {contract_name}.{event_name}: {e}")
+            self.logger.error("Failed to subscribe to %s.%s: %s", contract_name, event_name, e)
     
-    def _event_monitor_loop(self):
-        """Background loop to monitor blockchain events"""
+    def _monitor_loop(self):
+        """Background loop running scheduled tasks until shutdown"""
         self.logger.info("Event monitoring started")
         
         while self.running:
+            self._run_due_tasks()
+            if self._stop_event.wait(max(0.0, self._schedule[0][0] - time.time())):
+                break
+    
+    def _run_due_tasks(self):
+        """Run every scheduled task whose deadline has passed and re-enqueue it"""
+        schedule = self._schedule
+        while schedule and schedule[0][0] <= time.time():
+            _, order, task = heapq.heappop(schedule)
+            delay = task()
+            heapq.heappush(schedule, (time.time() + delay, order, task))
+    
+    def _event_task(self) -> float:
+        """
+        Monitor blockchain events; returns the delay before the next poll
+
+        With a ws_rpc_url configured, logs are pushed over an eth_subscribe stream (which
+        keeps running the other scheduled tasks while it waits). While the stream is down,
+        HTTP polling takes over and reconnects back off exponentially.
+        """
+        if self._ws_url and time.time() >= self._ws_retry_at:
             try:
-                for subscription in self.event_subscriptions:
-                    try:
-                        # Get new events
-                        new_events = subscription.filter_obj.get_new_entries()
-                        
-                        for event in new_events:
-                            self.stats['events_processed'] += 1
-                            
-                            # Call the callback
-                            try:
-                                subscription.callback(event)
-                            except Exception as e:
-                                self.logger.error(f"Error in event callback: {e}")
-                    
-                    except Exception as e:
-                        self.logger.warning(f"Error checking events for {subscription.event_name}: {e}")
-                
-                time.sleep(1)  # Check events every second
-                
+                asyncio.run(self._stream_events(self._ws_url))
+                self._ws_reconnect_delay = 1
             except Exception as e:
-                self.logger.error(f"Error in event monitoring loop: {e}")
-                time.sleep(5)  # Wait longer on error
+                self.logger.warning("Event stream dropped (%s); polling over HTTP, reconnecting in %ss",
+                                    e, self._ws_reconnect_delay)
+            self._ws_retry_at = time.time() + self._ws_reconnect_delay
+            self._ws_reconnect_delay = min(self._ws_reconnect_delay * 2, 60)
+            self._poll_interval = 1.0
+        
+        try:
+            found = self._poll_events()
+            self._poll_interval = self._next_poll_interval(self._poll_interval, found)
+            return self._poll_interval
+        except Exception as e:
+            self.logger.error("Error in event monitoring loop: %s", e)
+            return 5.0  # Wait longer on error
     
-    def _cleanup_loop(self):
-        """Background loop to clean up old pending transactions"""
-        while self.running:
-            try:
-                current_time = time.time()
-                timeout = 300  # 5 minutes timeout
-                
-                expired_txs = []
-                for tx_hash, tx_data in self.pending_transactions.items():
-                    if current_time - tx_data.timestamp > timeout:
-                        expired_txs.append(tx_hash)
+    async def _stream_events(self, ws_url: str):
+        """Dispatch logs pushed by the node until shutdown or a connection error"""
+        async with websockets.connect(ws_url) as ws:
+            subscriptions = None
+            request_id = 0
+            subscribe_request = None
+            stream_id = None  # Node-assigned id of the live subscription
+            while self.running:
+                if subscriptions is None or subscriptions.keys() != self._topic_to_sub.keys():
+                    # (Re)subscribe with the current address/topic set, then catch up over
+                    # HTTP on anything emitted before the stream was live
+                    subscriptions = dict(self._topic_to_sub)
+                    if subscriptions:
+                        request_id += 1
+                        subscribe_request = request_id
+                        await ws.send(json.dumps({
+                            'jsonrpc': '2.0', 'id': request_id, 'method': 'eth_subscribe',
+                            'params': ['logs', self._log_filter(subscriptions)]
+                        }))
+                        self._poll_events()
                 
-                for tx_hash in expired_txs:
-                    tx_data = self.pending_transactions.pop(tx_hash)
-                    self.stats['transactions_failed'] += 1
-                    self.logger.warning(f"Transaction {tx_hash} timed out after {timeout}s")
+                try:
+                    # Wake for the next scheduled task (e.g. a batch window) or after 1s
+                    wait = min(1.0, max(0.0, self._schedule[0][0] - time.time())) if self._schedule else 1.0
+                    message = _json_loads(await asyncio.wait_for(ws.recv(), timeout=wait))
+                except asyncio.TimeoutError:
+                    self._run_due_tasks()
+                    continue
                 
-                time.sleep(60)  # Clean up every minute
+                if message.get('method') != 'eth_subscription':
+                    if 'error' in message:
+                        raise ConnectionError(f"eth_subscribe failed: {message['error']}")
+                    if message.get('id') == subscribe_request:
+                        # Replace the previous subscription so its logs are not delivered twice
+                        if stream_id is not None:
+                            request_id += 1
+                            await ws.send(json.dumps({
+                                'jsonrpc': '2.0', 'id': request_id, 'method': 'eth_unsubscribe',
+                                'params': [stream_id]
+                            }))
+                        stream_id = message['result']
+                    continue
                 
-            except Exception as e:
-                self.logger.error(f"Error in cleanup loop: {e}")
-                time.sleep(60)
+                if message['params'].get('subscription') != stream_id:
+                    continue
+                raw = message['params']['result']
+                if raw.get('removed'):
+                    continue
+                log = self._format_ws_log(raw)
+                # Blocks up to _last_block were already delivered by HTTP polling
+                if log['blockNumber'] <= self._last_block:
+                    continue
+                # Keep the cursor one block behind: a fallback poll re-reads the current block,
+                # and _dispatch_log skips the logs from it that were already delivered here
+                if log['blockNumber'] - 1 != self._last_block:
+                    self._cursor_block_logs.clear()
+                    self._last_block = log['blockNumber'] - 1
+                    self._last_block_time = time.time()
+                self._dispatch_log(log, subscriptions)
+                self._cursor_block_logs.add((log['blockNumber'], log['logIndex']))
     
-    # Event handlers
-    def _handle_commuter_registered(self, event):
-        """Handle CommuterRegistered event"""
-        commuter_id = event['args']['commuterId']
-        address = event['args']['account']
-        
-        self.confirmed_registrations.add(f"commuter_{commuter_id}")
-        self.logger.info(f"✅ Commuter {commuter_id} registration confirmed at {address}")
-        
-        # Remove from pending if exists
-        self._mark_transaction_confirmed(event['transactionHash'].hex())
+    @staticmethod
+    def _log_filter(subscriptions: Dict[tuple, EventSubscription]) -> Dict[str, Any]:
+        """Address/topic0 filter covering every subscription"""
+        return {
+            'address': list({address for address, _ in subscriptions}),
+            'topics': [list({Web3.to_hex(topic) for _, topic in subscriptions})]
+        }
     
-    def _handle_provider_registered(self, event):
-        """Handle ProviderRegistered event"""
-        provider_id = event['args']['providerId']
-        address = event['args']['account']
-        mode = event['args']['mode']
-        
-        self.confirmed_registrations.add(f"provider_{provider_id}")
-        self.logger.info(f"✅ Provider {provider_id} registration confirmed at {address} (mode: {mode})")
-        
-        self._mark_transaction_confirmed(event['transactionHash'].hex())
+    @staticmethod
+    def _format_ws_log(raw: Dict[str, Any]) -> AttributeDict:
+        """Convert a raw JSON-RPC log to the shape get_logs returns"""
+        return AttributeDict({
+            'address': Web3.to_checksum_address(raw['address']),
+            'topics': [HexBytes(topic) for topic in raw['topics']],
+            'data': HexBytes(raw['data']),
+            'blockNumber': int(raw['blockNumber'], 16),
+            'blockHash': HexBytes(raw['blockHash']),
+            'transactionHash': HexBytes(raw['transactionHash']),
+            'transactionIndex': int(raw['transactionIndex'], 16),
+            'logIndex': int(raw['logIndex'], 16),
+            'removed': False
+        })
     
-    def _handle_request_created(self, event):
-        """Handle RequestCreated event"""
-        request_id = event['args']['requestId']
-        commuter_id = event['args']['commuterId']
-        
-        self.confirmed_requests.add(request_id)
-        self.logger.info(f"✅ Request {request_id} created by commuter {commuter_id}")
-        
-        self._mark_transaction_confirmed(event['transactionHash'].hex())
+    def _next_poll_interval(self, interval: float, found_logs: int) -> float:
+        """
+        Sleep before the next poll: half the observed block time, halved again while logs
+        keep arriving and doubled after IDLE_POLLS_BEFORE_BACKOFF empty polls
+        """
+        ema = self._block_interval_ema
+        base = max(self.POLL_MIN_INTERVAL, 0.5 * ema) if ema else 1.0
+        if found_logs:
+            self._idle_polls = 0
+            return max(self.POLL_MIN_INTERVAL, min(interval, base) / 2)
+        
+        self._idle_polls += 1
+        interval = max(interval, base)
+        if self._idle_polls >= self.IDLE_POLLS_BEFORE_BACKOFF:
+            self._idle_polls = 0
+            interval *= 2
+        return min(self.POLL_MAX_INTERVAL, interval)
     
-    def _handle_offer_submitted(self, event):
-        """Handle OfferSubmitted event"""
-        request_id = event['args']['requestId']
-        offer_id = event['args']['offerId']
-        provider_id = event['args']['providerId']
-        
-        self.confirmed_offers.add(offer_id)
-        self.logger.info(f"✅ Offer {offer_id} submitted by provider {provider_id} for request {request_id}")
-        
-        self._mark_transaction_confirmed(event['transactionHash'].hex())
+    def _poll_events(self) -> int:
+        """
+        Fetch logs for all subscriptions since the last polled block and dispatch them
+
+        Returns the number of logs fetched (0 when there was no new block).
+        """
+        subscriptions = dict(self._topic_to_sub)
+        if not subscriptions:
+            return 0
+
+        head = self.w3.eth.block_number
+        if head <= self._last_block:
+            return 0
+
+        # One eth_getLogs over every subscribed contract and event signature
+        logs = self.w3.eth.get_logs({
+            'fromBlock': self._last_block + 1,
+            'toBlock': head,
+            **self._log_filter(subscriptions)
+        })
+
+        # Block time estimate for the poll interval
+        now = time.time()
+        sample = (now - self._last_block_time) / (head - self._last_block)
+        ema = self._block_interval_ema
+        self._block_interval_ema = sample if ema is None else 0.8 * ema + 0.2 * sample
+        self._last_block = head
+        self._last_block_time = now
+
+        for log in logs:
+            self._dispatch_log(log, subscriptions)
+        self._cursor_block_logs.clear()
+        return len(logs)
     
-    def _handle_match_recorded(self, event):
-        """Handle MatchRecorded event"""
-        request_id = event['args']['requestId']
-        offer_id = event['args']['offerId']
-        provider_id = event['args']['providerId']
-        
-        self.confirmed_matches.add(request_id)
-        self.logger.info(f"✅ Match recorded: request {request_id}, offer {offer_id}, provider {provider_id}")
-        
-        self._mark_transaction_confirmed(event['transactionHash'].hex())
+    def _dispatch_log(self, log, subscriptions: Dict[tuple, EventSubscription]):
+        """Decode a log with its subscription's event ABI and run the callback"""
+        if (log['blockNumber'], log['logIndex']) in self._cursor_block_logs:
+            return  # Already delivered over the websocket
+        topics = log.get('topics')
+        subscription = subscriptions.get((log['address'], bytes(topics[0]))) if topics else None
+        if subscription is None:
+            return
+
+        try:
+            event = subscription.event().process_log(log)
+        except Exception as e:
+            self.logger.warning("Error decoding %s log: %s", subscription.event_name, e)
+            return
+
+        self.stats['events_processed'] += 1
+
+        # Call the callback
+        try:
+            subscription.callback(event)
+        except Exception as e:
+            self.logger.error("Error in event callback: %s", e)
+    
+    def _cleanup_task(self) -> float:
+        """Expire old pending transactions and reconcile nonces; returns the delay before the next run"""
+        try:
+            current_time = time.time()
+            timeout = 300  # 5 minutes timeout
+            
+            # Submission order is timestamp order: expired entries sit at the front
+            pending_order = self._pending_order
+            while pending_order and current_time - pending_order[0][0] > timeout:
+                _, tx_key = pending_order.popleft()
+                tx_data = self.pending_transactions.pop(tx_key, None)
+                if tx_data is None:
+                    continue  # Already confirmed or failed
+                self.stats['transactions_failed'] += 1
+                self.logger.warning("Transaction %s timed out after %ss", tx_data.tx_hash, timeout)
+            
+            self._reconcile_nonces()
+            return 30.0  # Clean up and reconcile nonces every 30 seconds
+            
+        except Exception as e:
+            self.logger.error("Error in cleanup loop: %s", e)
+            return 60.0
+    
+    def _batch_task(self) -> float:
+        """Send queued commuter registrations; returns the delay before the next batch window"""
+        try:
+            while self._pending_batch:
+                self._flush_commuter_batch()
+        except Exception as e:
+            self.logger.error("Error flushing registration batch: %s", e)
+        return self.BATCH_WINDOW
     
-    def _mark_transaction_confirmed(self, tx_hash: str):
-        """Mark a transaction as confirmed and remove from pending"""
-        if tx_hash in self.pending_transactions:
-            tx_data = self.pending_transactions.pop(tx_hash)
+    # Event handlers
+    def _confirmation_handler(self, confirmed: ShardedIdSet, id_arg: str, log_args: tuple,
+                              message: str) -> Callable:
+        """
+        Build the handler for a confirmation event
+
+        Arg getters, the target set and the logger are bound once here, so each event
+        costs a few C-level lookups; the message is only formatted when INFO is enabled.
+        """
+        get_id = itemgetter(id_arg)
+        get_log_args = itemgetter(*log_args)
+        add = confirmed.add
+        logger = self.logger
+        mark_confirmed = self._mark_transaction_confirmed
+        
+        def handle(event):
+            args = event['args']
+            add(get_id(args))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(message, *get_log_args(args))
+            # Remove from pending if exists
+            mark_confirmed(event['transactionHash'])
+        
+        return handle
+    
+    def _mark_transaction_confirmed(self, tx_hash: bytes):
+        """Mark a transaction as confirmed and remove from pending (tx_hash is the raw HexBytes)"""
+        tx_data = self.pending_transactions.pop(tx_hash, None)
+        if tx_data is not None:
             self.stats['transactions_confirmed'] += 1
             
             # Call callback if provided
             if tx_data.callback:
                 try:
-                    tx_data.callback(tx_hash, tx_data)
+                    tx_data.callback(tx_data.tx_hash, tx_data)
                 except Exception as e:
-                    self.logger.error(f"Error in transaction callback: {e}")
+                    self.logger.error("Error in transaction callback: %s", e)
     
     # Public interface methods
     def submit_transaction_async(self, function_call, tx_type: str, params: Dict[str, Any], 
@@ -316,53 +643,147 @@ class EventBasedBlockchain:
         """
         Submit transaction asynchronously without waiting for confirmation
         Returns transaction hash immediately
+
+        The transaction is signed on the caller's thread, so its hash is known up front;
+        the broadcast happens on a worker thread. A failed broadcast is logged, counted
+        and dropped from pending_transactions.
         """
         try:
             # Get API account
             api_account = self._get_api_account()
             
-            # Get nonce
-            with self.nonce_lock:
-                nonce = self.w3.eth.get_transaction_count(api_account.address)
-                self.nonce_manager[api_account.address] = max(
-                    self.nonce_manager[api_account.address], nonce
-                )
-                current_nonce = self.nonce_manager[api_account.address]
-                self.nonce_manager[api_account.address] += 1
-            
-            # Build transaction
-            transaction = function_call.build_transaction({
-                'from': api_account.address,
-                'nonce': current_nonce,
-                'gas': 500000,
-                'gasPrice': self.w3.eth.gas_price,
-                'chainId': self.w3.eth.chain_id
-            })
-            
-            # Sign and send
-            signed_txn = api_account.sign_transaction(transaction)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-            tx_hash_hex = tx_hash.hex()
+            address = api_account.address
             
-            # Track as pending
-            self.pending_transactions[tx_hash_hex] = PendingTransaction(
-                tx_hash=tx_hash_hex,
-                tx_type=tx_type,
-                params=params,
-                timestamp=time.time(),
-                callback=callback
-            )
-            
-            self.stats['transactions_sent'] += 1
-            self.logger.info(f"📤 Submitted {tx_type} transaction: {tx_hash_hex}")
+            with self._submit_order_lock:
+                # Nonce comes from the local counter; the node is only consulted to resync
+                current_nonce = self._next_nonce(address)
+                try:
+                    signed_txn = self._build_and_sign(function_call, api_account, current_nonce)
+                except Exception:
+                    self._release_nonce(address, current_nonce)
+                    raise
+                tx_key = bytes(signed_txn.hash)
+                tx_hash_hex = signed_txn.hash.hex()
+                
+                # Track as pending before broadcasting so a fast confirmation event finds it
+                submitted_at = time.time()
+                self.pending_transactions[tx_key] = PendingTransaction(
+                    tx_hash=tx_hash_hex,
+                    tx_type=tx_type,
+                    params=params,
+                    timestamp=submitted_at,
+                    callback=callback
+                )
+                self._pending_order.append((submitted_at, tx_key))
+                self._last_queued_nonce[address] = current_nonce
+                self._submit_executor.submit(self._broadcast, signed_txn, tx_key, tx_type, address, current_nonce)
             
             return tx_hash_hex
             
         except Exception as e:
             self.stats['transactions_failed'] += 1
-            self.logger.error(f"Failed to submit {tx_type} transaction: {e}")
+            self.logger.error("Failed to submit %s transaction: %s", tx_type, e)
             raise
     
+    def _build_and_sign(self, function_call, api_account, nonce: int):
+        """
+        Build and sign a contract call with the given nonce
+
+        Gas and chain ID are fixed and fees are cached, so the transaction is assembled
+        directly around the ABI-encoded calldata rather than through build_transaction's
+        default filling.
+        """
+        transaction = {
+            'to': function_call.address,
+            'data': function_call._encode_transaction_data(),
+            'value': 0,
+            'nonce': nonce,
+            'gas': self.TX_GAS_LIMIT,
+            'chainId': self.chain_id,
+            **self._fee_fields()
+        }
+        return api_account.sign_transaction(transaction)
+    
+    def _fee_fields(self) -> Dict[str, int]:
+        """
+        Fee fields for a transaction from a cached EIP-1559 estimate
+
+        max fee = 2 x next base fee + median tip, re-read when the event monitor has
+        seen a newer block or after FEE_CACHE_TTL. Chains without fee history fall
+        back to a legacy gasPrice.
+        """
+        cached = self._fee_cache
+        now = time.time()
+        if cached is not None and cached[1] >= self._last_block and now - cached[2] < self.FEE_CACHE_TTL:
+            return cached[0]
+        
+        try:
+            history = self.w3.eth.fee_history(1, 'latest', [50])
+            base_fee = history['baseFeePerGas'][-1]  # Base fee of the next block
+            tip = history['reward'][0][0]
+            fields = {
+                'type': 2,
+                'maxFeePerGas': base_fee * 2 + tip,
+                'maxPriorityFeePerGas': tip
+            }
+        except Exception as e:
+            self.logger.debug("Fee history unavailable (%s), using legacy gas price", e)
+            fields = {'gasPrice': self.w3.eth.gas_price}
+        self._fee_cache = (fields, self._last_block, now)
+        return fields
+    
+    def _broadcast(self, signed_txn, tx_key: bytes, tx_type: str, address: str, nonce: int):
+        """Send a signed transaction (runs on the single submit worker, in nonce order)"""
+        try:
+            self.w3.eth.send_raw_transaction(signed_txn.rawTransaction)
+        except Exception as e:
+            # The node already holding this exact transaction is a successful broadcast
+            if 'already known' not in str(e).lower():
+                self.pending_transactions.pop(tx_key, None)
+                self.stats['transactions_failed'] += 1
+                self.logger.error("Failed to submit %s transaction %s: %s", tx_type, signed_txn.hash.hex(), e)
+                # The nonce is either unused now or was already taken; realign with the node,
+                # but only once no later nonce from this account is still waiting to be sent,
+                # otherwise the counter would drop below nonces that are already signed
+                with self._submit_order_lock:
+                    if self._last_queued_nonce.get(address) == nonce:
+                        try:
+                            self._resync_nonce(address)
+                        except Exception as sync_error:
+                            self.logger.warning("Nonce resync failed: %s", sync_error)
+                return
+        
+        self.stats['transactions_sent'] += 1
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("📤 Submitted %s transaction: %s", tx_type, signed_txn.hash.hex())
+    
+    def _next_nonce(self, address: str) -> int:
+        """Reserve the next local nonce for an account"""
+        with self.nonce_lock:
+            nonce = self.nonce_manager[address]
+            self.nonce_manager[address] = nonce + 1
+        return nonce
+    
+    def _release_nonce(self, address: str, nonce: int):
+        """Hand back a nonce whose transaction was never broadcast, unless a later one was taken"""
+        with self.nonce_lock:
+            if self.nonce_manager[address] == nonce + 1:
+                self.nonce_manager[address] = nonce
+    
+    def _resync_nonce(self, address: str):
+        """Reset the local nonce counter to the node's pending transaction count"""
+        chain_nonce = self.w3.eth.get_transaction_count(address, 'pending')
+        with self.nonce_lock:
+            self.nonce_manager[address] = chain_nonce
+    
+    def _reconcile_nonces(self):
+        """Raise local nonce counters that fell behind the node (e.g. the key was used elsewhere)"""
+        for address in list(self.nonce_manager):
+            chain_nonce = self.w3.eth.get_transaction_count(address, 'pending')
+            with self.nonce_lock:
+                if chain_nonce > self.nonce_manager[address]:
+                    self.nonce_manager[address] = chain_nonce
+    
     def _get_api_account(self):
         """Get the API account for signing transactions"""
         # Use the first account from the blockchain config
@@ -376,22 +797,55 @@ class EventBasedBlockchain:
     # Convenience methods for common operations
     def register_commuter_async(self, commuter_id: int, address: str, callback: Optional[Callable] = None) -> str:
         """Register commuter asynchronously"""
-        if 'facade' not in self.contracts:
-            raise ValueError("Facade contract not available")
-        
-        function_call = self.contracts['facade'].functions.registerCommuter(commuter_id, address)
+        function_call = self._facade_function('registerCommuter')(commuter_id, address)
         return self.submit_transaction_async(
             function_call, 'commuter_registration', 
             {'commuter_id': commuter_id, 'address': address}, 
             callback
         )
     
+    def register_commuter_batched(self, commuter_id: int, address: str, callback: Optional[Callable] = None):
+        """
+        Queue a commuter registration for the next multiRegisterCommuter transaction
+
+        Queued registrations are sent together after BATCH_WINDOW, or straight away once
+        BATCH_MAX are waiting, so many registrations share one nonce, signature and RPC
+        round trip. The callback runs when the batch transaction is confirmed.
+        """
+        with self._batch_lock:
+            self._pending_batch.append((commuter_id, address, callback))
+            full = len(self._pending_batch) >= self.BATCH_MAX
+        if full:
+            self._flush_commuter_batch()
+    
+    def _flush_commuter_batch(self) -> Optional[str]:
+        """Submit up to BATCH_MAX queued registrations as one transaction"""
+        with self._batch_lock:
+            batch = [self._pending_batch.popleft() for _ in range(min(len(self._pending_batch), self.BATCH_MAX))]
+        if not batch:
+            return None
+        
+        commuter_ids = [commuter_id for commuter_id, _, _ in batch]
+        addresses = [address for _, address, _ in batch]
+        callbacks = [callback for _, _, callback in batch if callback]
+        
+        def on_confirmed(tx_hash, tx_data):
+            for callback in callbacks:
+                try:
+                    callback(tx_hash, tx_data)
+                except Exception as e:
+                    self.logger.error("Error in transaction callback: %s", e)
+        
+        function_call = self._facade_function('multiRegisterCommuter')(commuter_ids, addresses)
+        return self.submit_transaction_async(
+            function_call, 'commuter_registration_batch',
+            {'commuter_ids': commuter_ids, 'addresses': addresses},
+            on_confirmed if callbacks else None
+        )
+    
     def create_request_async(self, commuter_id: int, content_hash: str, callback: Optional[Callable] = None) -> str:
         """Create travel request asynchronously"""
-        if 'facade' not in self.contracts:
-            raise ValueError("Facade contract not available")
-        
-        function_call = self.contracts['facade'].functions.createRequestWithHash(commuter_id, content_hash)
+        function_call = self._facade_function('createRequestWithHash')(commuter_id, content_hash)
         return self.submit_transaction_async(
             function_call, 'request_creation',
             {'commuter_id': commuter_id, 'content_hash': content_hash},
@@ -401,10 +855,7 @@ class EventBasedBlockchain:
     def submit_offer_async(self, request_id: int, provider_id: int, content_hash: str, 
                           callback: Optional[Callable] = None) -> str:
         """Submit offer asynchronously"""
-        if 'facade' not in self.contracts:
-            raise ValueError("Facade contract not available")
-        
-        function_call = self.contracts['facade'].functions.submitOfferHash(request_id, provider_id, content_hash)
+        function_call = self._facade_function('submitOfferHash')(request_id, provider_id, content_hash)
         return self.submit_transaction_async(
             function_call, 'offer_submission',
             {'request_id': request_id, 'provider_id': provider_id, 'content_hash': content_hash},
@@ -414,7 +865,11 @@ class EventBasedBlockchain:
     # State query methods (these are safe to call anytime)
     def is_commuter_registered(self, commuter_id: int) -> bool:
         """Check if commuter is registered (from events)"""
-        return f"commuter_{commuter_id}" in self.confirmed_registrations
+        return commuter_id in self.confirmed_commuters
+    
+    def is_provider_registered(self, provider_id: int) -> bool:
+        """Check if provider is registered (from events)"""
+        return provider_id in self.confirmed_providers
     
     def is_request_confirmed(self, request_id: int) -> bool:
         """Check if request is confirmed on blockchain"""
@@ -425,7 +880,7 @@ class EventBasedBlockchain:
         return {
             **self.stats,
             'pending_transactions': len(self.pending_transactions),
-            'confirmed_registrations': len(self.confirmed_registrations),
+            'confirmed_registrations': len(self.confirmed_commuters) + len(self.confirmed_providers),
             'confirmed_requests': len(self.confirmed_requests),
             'confirmed_offers': len(self.confirmed_offers),
             'confirmed_matches': len(self.confirmed_matches)
@@ -434,10 +889,7 @@ class EventBasedBlockchain:
     def record_match_async(self, request_id: int, offer_id: int, provider_id: int,
                           price_wei: int, callback: Optional[Callable] = None) -> str:
         """Record match result asynchronously"""
-        if 'facade' not in self.contracts:
-            raise ValueError("Facade contract not available")
-
-        function_call = self.contracts['facade'].functions.recordMatchResult(
+        function_call = self._facade_function('recordMatchResult')(
             request_id, offer_id, provider_id, price_wei
         )
         return self.submit_transaction_async(
@@ -454,17 +906,17 @@ class EventBasedBlockchain:
         start_time = time.time()
         initial_pending = len(self.pending_transactions)
 
-        self.logger.info(f"Waiting for {initial_pending} pending transactions...")
+        self.logger.info("Waiting for %s pending transactions...", initial_pending)
 
         while time.time() - start_time < timeout and self.pending_transactions:
             time.sleep(1)
             remaining = len(self.pending_transactions)
             if remaining != initial_pending:
-                self.logger.info(f"Progress: {initial_pending - remaining}/{initial_pending} confirmed")
+                self.logger.info("Progress: %s/%s confirmed", initial_pending - remaining, initial_pending)
 
         final_stats = self.get_statistics()
         if self.pending_transactions:
-            self.logger.warning(f"{len(self.pending_transactions)} transactions still pending after {timeout}s")
+            self.logger.warning("%s transactions still pending after %ss", len(self.pending_transactions), timeout)
         else:
             self.logger.info("All transactions confirmed!")
 
@@ -473,7 +925,13 @@ class EventBasedBlockchain:
     def shutdown(self):
         """Gracefully shutdown the event monitoring"""
         self.running = False
-        if self.event_thread:
-            self.event_thread.join(timeout=5)
-        if self.cleanup_thread:
-            self.cleanup_thread.join(timeout=5)
+        self._stop_event.set()
+        if self.monitor_thread:
+            self.monitor_thread.join(timeout=5)
+        try:
+            while self._pending_batch:
+                self._flush_commuter_batch()
+        except Exception as e:
+            self.logger.error("Error flushing registration batch: %s", e)
+        self._submit_executor.shutdown(wait=True)
+        self.session.close()
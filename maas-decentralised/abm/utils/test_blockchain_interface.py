@@ -1,15 +1,64 @@
 import unittest
 from unittest.mock import MagicMock, patch
+from types import SimpleNamespace
 import json
+import os
+import sys
 import time
 from blockchain_interface import BlockchainInterface, TransactionData
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+from abm.agents.nft_marketplace import NFTMarketplace
+
+def make_w3_stub():
+    """Plain-object Web3 stand-in with only the attributes the interface touches"""
+    return SimpleNamespace(
+        is_connected=lambda: True,
+        provider=SimpleNamespace(),
+        toWei=lambda value, unit: int(float(value) * 10**18),
+        eth=SimpleNamespace(
+            account=SimpleNamespace(
+                create=lambda: None,
+                sign_transaction=lambda tx, private_key=None: SimpleNamespace(rawTransaction=b'signed_tx')
+            ),
+            accounts=['0xadmin'],
+            gas_price=1,
+            chain_id=31337,
+            get_transaction_count=lambda address, block_identifier=None: 0,
+            send_transaction=lambda tx: b'fund_tx',
+            send_raw_transaction=lambda raw_tx: b'tx_hash',
+            wait_for_transaction_receipt=lambda tx_hash, timeout=None: {'status': 1},
+            get_transaction_receipt=lambda tx_hash: {'status': 1}
+        )
+    )
+
+class FakeFn:
+    """Hand-written contract function: records its arguments and returns a fixed .call() result"""
+    __slots__ = ('ret', 'calls')
+    
+    def __init__(self, ret=None):
+        self.ret = ret
+        self.calls = []
+    
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        return self
+    
+    def call(self, *args, **kwargs):
+        return self.ret
+
+class FakeContract:
+    """Read-only contract stand-in whose functions are FakeFn instances keyed by name"""
+    def __init__(self, address=None, **returns):
+        self.address = address
+        self.functions = SimpleNamespace(**{name: FakeFn(ret) for name, ret in returns.items()})
+
 class TestBlockchainInterface(unittest.TestCase):
     
-    def setUp(self):
-        # Mock Web3 and related components
-        self.mock_w3 = MagicMock()
-        self.mock_contracts = {
+    @classmethod
+    def setUpClass(cls):
+        # Build the interface once; setUp resets the per-test state
+        cls.mock_contracts = {
             'registry': MagicMock(),
             'request': MagicMock(),
             'auction': MagicMock(),
@@ -20,18 +69,31 @@ class TestBlockchainInterface(unittest.TestCase):
         }
         
         # Create a test instance with mocked components
-        with patch('blockchain_interface.Web3', return_value=self.mock_w3):
-            with patch.object(BlockchainInterface, '_load_contracts', return_value=self.mock_contracts):
-                self.interface = BlockchainInterface(async_mode=False)  # Test in synchronous mode
-                self.interface.w3 = self.mock_w3
-                self.interface.contracts = self.mock_contracts
+        with patch('blockchain_interface.Web3', return_value=make_w3_stub()):
+            with patch.object(BlockchainInterface, '_load_contracts', return_value=cls.mock_contracts):
+                cls.interface = BlockchainInterface(async_mode=False)  # Test in synchronous mode
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.interface.thread_pool.shutdown(wait=False)
+    
+    def setUp(self):
+        # Fresh Web3 stub, cleared contract call records and empty account/cache state
+        self.mock_w3 = make_w3_stub()
+        for contract in self.mock_contracts.values():
+            contract.reset_mock(return_value=True, side_effect=True)
+        
+        self.interface.w3 = self.mock_w3
+        self.interface.contracts = self.mock_contracts
+        self.interface.accounts.clear()
+        self.interface.nonce_tracker.clear()
+        self.interface.tx_nonce_map.clear()
+        self.interface.state_cache = {key: {} for key in self.interface.state_cache}
     
     def test_create_account(self):
-        # Mock account creation
-        mock_account = MagicMock()
-        mock_account.address = "0x123abc"
-        mock_account.key.hex.return_value = "0xprivatekey"
-        self.mock_w3.eth.account.create.return_value = mock_account
+        # Stub account creation
+        account = SimpleNamespace(address="0x123abc", key=SimpleNamespace(hex=lambda: "0xprivatekey"))
+        self.mock_w3.eth.account.create = lambda: account
         
         # Test account creation
         address = self.interface.create_account(1, "commuter")
@@ -43,16 +105,17 @@ class TestBlockchainInterface(unittest.TestCase):
         self.assertEqual(self.interface.accounts[1]["type"], "commuter")
     
     def test_register_commuter(self):
-        # Create mock commuter agent
-        commuter = MagicMock()
-        commuter.unique_id = 1
-        commuter.location = (10, 20)
-        commuter.income_level = "middle"
-        commuter.age = 35
-        commuter.has_disability = False
-        commuter.tech_access = True
-        commuter.health_status = "good"
-        commuter.payment_scheme = "PAYG"
+        # Create stub commuter agent
+        commuter = SimpleNamespace(
+            unique_id=1,
+            location=(10, 20),
+            income_level="middle",
+            age=35,
+            has_disability=False,
+            tech_access=True,
+            health_status="good",
+            payment_scheme="PAYG"
+        )
         
         # Setup mock account
         self.interface.accounts[1] = {
@@ -61,10 +124,7 @@ class TestBlockchainInterface(unittest.TestCase):
             "type": "commuter"
         }
         
-        # Mock transaction methods
-        self.mock_w3.eth.account.sign_transaction.return_value.rawTransaction = b'signed_tx'
-        self.mock_w3.eth.send_raw_transaction.return_value = b'tx_hash'
-        self.mock_w3.eth.wait_for_transaction_receipt.return_value = {'status': 1}
+        # Transaction methods: the stub signs, sends and confirms with status 1
         
         # Test register commuter
         success, address = self.interface.register_commuter(commuter)
@@ -99,20 +159,59 @@ class TestBlockchainInterface(unittest.TestCase):
         self.interface.state_cache['commuters'][1] = {'data': {'commuterId': 1}}
         self.interface.state_cache['commuters'][2] = {'data': {'commuterId': 2}}
         
+        # Request hashes go out in one JSON-RPC batch from the API account,
+        # and their receipts come back in one batched poll
+        sent_batches = []
+        def make_batch_request(calls):
+            sent_batches.append(calls)
+            if calls[0][0] == 'eth_getTransactionReceipt':
+                return [{'jsonrpc': '2.0', 'id': i, 'result': {'status': '0x1', 'transactionHash': params[0]}}
+                        for i, (_, params) in enumerate(calls)]
+            return [{'jsonrpc': '2.0', 'id': i, 'result': '0x%064x' % (i + 1)} for i in range(len(calls))]
+        self.mock_w3.provider.make_batch_request = make_batch_request
+        self.mock_contracts['facade'].functions.submitRequestHash.return_value.build_transaction = lambda tx: dict(tx)
+        api_account = SimpleNamespace(address="0xapi", sign_transaction=lambda tx: SimpleNamespace(rawTransaction=b'signed_tx'))
+        
         # Test batch processing
-        results = self.interface.process_requests_batch(batch)
+        with patch.object(self.interface, '_get_api_account', return_value=api_account):
+            results = self.interface.process_requests_batch(batch)
         
         # Verify results
         self.assertEqual(len(results), 2)
         self.assertTrue(all(result[0] for result in results))
+        self.assertEqual(len(sent_batches), 2)
+        self.assertEqual([method for method, _ in sent_batches[0]], ['eth_sendRawTransaction'] * 2)
+        self.assertEqual([method for method, _ in sent_batches[1]], ['eth_getTransactionReceipt'] * 2)
+    
+    def test_offer_lookup_uses_state_cache(self):
+        # On-chain offers: [providerId, price, timestamp, isActive]
+        auction = FakeContract(getOffers=[[7, 100, 0, True], [9, 90, 0, True]])
+        self.interface.contracts = {**self.mock_contracts, 'auction': auction}
+        get_offers = auction.functions.getOffers
+        
+        # A cold lookup reads the chain once; a warm one is served from state_cache
+        self.assertEqual(self.interface._find_blockchain_offer_id(42, 9), 1)
+        self.assertEqual(self.interface._find_blockchain_offer_id(42, 7), 0)
+        self.assertEqual(get_offers.calls, [((42,), {})])
+        self.assertIn(42, self.interface.state_cache['offers'])
+        
+        # Our own offer submission invalidates the entry
+        self.interface._invalidate_cached_state('offers', 42)
+        self.interface._find_blockchain_offer_id(42, 7)
+        self.assertEqual(len(get_offers.calls), 2)
+        
+        # A stale cached list missing the provider is reloaded once before giving up
+        get_offers.ret = [[7, 100, 0, True], [9, 90, 0, True], [11, 80, 0, True]]
+        self.assertEqual(self.interface._find_blockchain_offer_id(42, 11), 2)
+        self.assertEqual(len(get_offers.calls), 3)
+        self.assertIsNone(self.interface._find_blockchain_offer_id(42, 13))
+        self.assertEqual(len(get_offers.calls), 4)
     
     def test_create_nft(self):
         # Setup mock account
         self.interface.accounts[1] = {"address": "0x123abc", "private_key": "0xprivatekey", "type": "commuter"}
         
-        # Mock transaction methods
-        self.mock_w3.eth.account.sign_transaction.return_value.rawTransaction = b'signed_tx'
-        self.mock_w3.eth.send_raw_transaction.return_value = b'tx_hash'
+        # Transaction methods: the stub signs and sends
         
         # Setup mock NFT contract address
         self.mock_contracts['nft'].address = "0xnftaddress"  # Add this line
@@ -125,7 +224,7 @@ class TestBlockchainInterface(unittest.TestCase):
             'logIndex': 0
         }
         receipt = {'status': 1, 'logs': [mock_log]}
-        self.mock_w3.eth.wait_for_transaction_receipt.return_value = receipt
+        self.mock_w3.eth.wait_for_transaction_receipt = lambda tx_hash, timeout=None: receipt
         
         # Mock the events better - the key issue is in this part
         event_instance = MagicMock()
@@ -157,10 +256,7 @@ class TestBlockchainInterface(unittest.TestCase):
             'status': 'minted'
         }
         
-        # Mock transaction methods
-        self.mock_w3.eth.account.sign_transaction.return_value.rawTransaction = b'signed_tx'
-        self.mock_w3.eth.send_raw_transaction.return_value = b'tx_hash'
-        self.mock_w3.eth.wait_for_transaction_receipt.return_value = {'status': 1}
+        # Transaction methods: the stub signs, sends and confirms with status 1
         
         # Test listing NFT
         time_params = {
@@ -177,53 +273,41 @@ class TestBlockchainInterface(unittest.TestCase):
         self.mock_contracts['market'].functions.listNFTWithDynamicPricing.assert_called_once()
     
     def test_search_nft_market(self):
-        # Reset the mock to clear any previous calls
-        self.mock_contracts['market'].functions.searchListings.reset_mock()
-        
-        # Prepare the search result more explicitly
-        search_result = [
-            [123, 100, "0x123abc"],
-            [456, 200, "0x456def"]
-        ]
+        # Search runs on the marketplace's listing table; the chain only sees list/purchase calls
+        chain = SimpleNamespace(list_nft_for_sale=lambda *args: True, purchase_nft=lambda *args: True)
+        model = SimpleNamespace(schedule=SimpleNamespace(time=0))
+        marketplace = NFTMarketplace(model, chain)
         
-        # Setup a more specific mock for searchListings with parameters
-        search_listings_mock = MagicMock()
-        search_listings_mock.call.return_value = search_result
-        self.mock_contracts['market'].functions.searchListings.return_value = search_listings_mock
+        def details(origin, destination, service_time):
+            return {'origin': origin, 'destination': destination, 'service_time': service_time}
         
-        # Setup NFT cache
-        self.interface.state_cache['nfts'][123] = {
-            'route_details': '{"origin": [10, 20], "destination": [30, 40]}',
-            'start_time': int(time.time()) + 3600,
-            'duration': 1800
-        }
-        self.interface.state_cache['nfts'][456] = {
-            'route_details': '{"origin": [15, 25], "destination": [35, 45]}',
-            'start_time': int(time.time()) + 7200,
-            'duration': 1800
-        }
+        marketplace.list_nft(1, 123, details([10, 20], [30, 40], 60), {'price': 100})
+        marketplace.list_nft(2, 456, details([15, 25], [35, 45], 120), {'price': 200})
+        marketplace.list_nft(3, 789, details([90, 90], [30, 40], 60), {'price': 80})
+        marketplace.list_nft(4, 321, details([12, 18], [32, 42], 500), {'price': 90})
         
         # Test search
         search_params = {
-            'min_price': 50,
-            'max_price': 150,
-            'min_departure': int(time.time()),
-            'max_departure': int(time.time()) + 86400,
-            'origin_area': [5, 15, 20]  # x, y, radius
+            'origin_area': [[10, 20], 10],
+            'destination_area': [[30, 40], 10],
+            'time_window': [0, 200],
+            'max_price': 150
         }
         
-        results = self.interface.search_nft_market(search_params)
+        results = marketplace.search_nfts(search_params)
         
-        # Verify results
-        self.assertEqual(len(results), 2)
+        # Only 123 passes: 456 is too expensive, 789 starts too far away, 321 departs too late
+        self.assertEqual([r['nft_id'] for r in results], [123])
+        self.assertEqual(results[0]['price'], 100)
+        self.assertEqual(results[0]['owner_id'], 1)
         
-        # Verify the searchListings was called with the right parameters
-        self.mock_contracts['market'].functions.searchListings.assert_called_with(
-            self.mock_w3.toWei('50', 'ether'),
-            self.mock_w3.toWei('150', 'ether'),
-            search_params['min_departure'],
-            search_params['max_departure']
-        )
+        # Widening the price cap brings 456 back, in listing order
+        search_params['max_price'] = 250
+        self.assertEqual([r['nft_id'] for r in marketplace.search_nfts(search_params)], [123, 456])
+        
+        # Sold listings drop out of the search
+        self.assertTrue(marketplace.purchase_nft(5, 123))
+        self.assertEqual([r['nft_id'] for r in marketplace.search_nfts(search_params)], [456])
     
     def test_purchase_nft(self):
         # Setup mock account
@@ -241,10 +325,7 @@ class TestBlockchainInterface(unittest.TestCase):
             'status': 'listed'
         }
         
-        # Mock transaction methods
-        self.mock_w3.eth.account.sign_transaction.return_value.rawTransaction = b'signed_tx'
-        self.mock_w3.eth.send_raw_transaction.return_value = b'tx_hash'
-        self.mock_w3.eth.wait_for_transaction_receipt.return_value = {'status': 1}
+        # Transaction methods: the stub signs, sends and confirms with status 1
         
         # Test purchase
         success = self.interface.purchase_nft(123, 2)
@@ -287,10 +368,8 @@ class TestBlockchainInterface(unittest.TestCase):
                 'name': 'Test Bundle'
             }
             
-            # Mock transaction
-            self.mock_w3.eth.account.sign_transaction.return_value.rawTransaction = b'signed_tx'
-            self.mock_w3.eth.send_raw_transaction.return_value = b'tx_hash'
-            self.mock_w3.eth.wait_for_transaction_receipt.return_value = receipt
+            # Stub transaction receipt
+            self.mock_w3.eth.wait_for_transaction_receipt = lambda tx_hash, timeout=None: receipt
             
             # Mock the events better
             event_instance = MagicMock()
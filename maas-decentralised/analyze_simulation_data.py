@@ -4,24 +4,138 @@ Comprehensive Simulation Data Analysis Script
 Demonstrates how to query and analyze all database tables
 """
 
+import atexit
+import functools
+import multiprocessing
 import sqlite3
-import json
-from datetime import datetime
-from collections import defaultdict
+import sys
+import pandas as pd
 
+FETCH_BATCH_SIZE = 1000  # Rows per fetchmany() call
+
+# Per-run analysis queries; sqlite3 caches the prepared statement for each string
+MODE_USAGE_SQL = '''
+    SELECT mode, total_trips, total_revenue, average_price,
+           utilization_rate, peak_demand_tick, peak_demand_count,
+           SUM(total_trips) OVER () AS all_trips,
+           SUM(total_revenue) OVER () AS all_revenue,
+           COALESCE(100.0 * total_trips / NULLIF(SUM(total_trips) OVER (), 0), 0) AS market_share
+    FROM mode_usage_metrics
+    WHERE run_id = ?
+    ORDER BY total_revenue DESC
+'''
+
+BUNDLE_PERFORMANCE_SQL = '''
+    SELECT total_bundles_created, total_bundles_reserved,
+           bundle_reservation_rate, average_discount_percentage, total_discount_given,
+           popular_mode_combinations, average_segments_per_bundle,
+           total_bundle_revenue, average_bundle_price
+    FROM bundle_performance_metrics
+    WHERE run_id = ?
+'''
+
+BUNDLES_SQL = '''
+    SELECT bundle_id, final_price, discount_amount, num_segments
+    FROM bundles
+    WHERE run_id = ?
+'''
+
+GAS_METRICS_SQL = '''
+    SELECT tick, total_gas_used, total_gas_cost, average_gas_price,
+           total_transactions, successful_transactions, failed_transactions,
+           registration_txs, request_txs, offer_txs, match_txs,
+           nft_mint_txs, nft_list_txs, nft_purchase_txs
+    FROM gas_metrics
+    WHERE run_id = ?
+    ORDER BY tick
+'''
+
+REQUESTS_SQL = '''
+    SELECT 0 AS level, NULL AS status, COUNT(final_price), AVG(final_price),
+           MIN(final_price), MAX(final_price)
+    FROM requests
+    WHERE run_id = :run_id
+    UNION ALL
+    SELECT 1 AS level, CASE WHEN matched THEN 'matched' ELSE 'unmatched' END AS status,
+           COUNT(*), NULL, NULL, NULL
+    FROM requests
+    WHERE run_id = :run_id
+    GROUP BY status
+    ORDER BY level, status
+'''
+
+PROVIDERS_SQL = '''
+    SELECT agent_id, mode,
+           total_revenue, successful_matches, avg_price, utilization_rate
+    FROM providers
+    WHERE run_id = ?
+    ORDER BY total_revenue DESC
+'''
+
+COMMUTERS_SQL = '''
+    SELECT agent_id, total_spent, successful_trips, total_requests, avg_wait_time
+    FROM commuters
+    WHERE run_id = ?
+    ORDER BY total_spent DESC
+    LIMIT 10
+'''
+
+# Row layouts, bound once so each row is a single format call
+MODE_ROW = "{:<15} {:<10} ${:<14.2f} ${:<14.2f} {:<14.1f}%".format
+GAS_TICK_BLOCK = (
+    "\n⛽ Tick {}:\n"
+    "   Total Gas Used: {:,}\n"
+    "   Total Gas Cost: {:,} wei\n"
+    "   Average Gas Price: {:,} wei\n"
+    "   Total Transactions: {}\n"
+    "   Successful: {} | Failed: {}\n"
+    "   Transaction Breakdown:\n"
+    "      - Registrations: {}\n"
+    "      - Requests: {}\n"
+    "      - Offers: {}\n"
+    "      - Matches: {}\n"
+    "      - NFT Mints: {}\n"
+    "      - NFT Lists: {}\n"
+    "      - NFT Purchases: {}"
+).format
+
+@functools.lru_cache(maxsize=1)
 def connect_db():
-    """Connect to the database"""
-    return sqlite3.connect('maas_bundles.db')
+    """
+    Connect to the database, tuned for repeated read-only analysis queries.
+    The connection is opened and configured once per process and closed at exit.
+    It runs in autocommit mode; callers open explicit read transactions.
+    Only per-connection settings are applied: the database file itself (journal
+    mode, indexes) is left as the exporter wrote it.
+    """
+    conn = sqlite3.connect('maas_bundles.db', isolation_level=None)
+    conn.execute('PRAGMA mmap_size=268435456')  # 256 MB
+    conn.execute('PRAGMA cache_size=-65536')  # 64 MB
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA query_only=1')
+    atexit.register(conn.close)
+    return conn
+
+def write_lines(lines):
+    """Emit a block of report lines with a single stdout write"""
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+
+def section_lines(title):
+    """Formatted section header lines"""
+    return ["\n" + "="*100, f"📊 {title}", "="*100]
+
+def format_column(series, spec, width, na="N/A"):
+    """Format a result column as left-justified text, showing na for missing values"""
+    return series.map(spec.format, na_action='ignore').fillna(na).astype(str).str.ljust(width)
 
 def print_section(title):
     """Print a formatted section header"""
-    print("\n" + "="*100)
-    print(f"📊 {title}")
-    print("="*100)
+    write_lines(section_lines(title))
 
 def analyze_simulation_runs(conn):
     """Analyze simulation runs"""
-    print_section("SIMULATION RUNS OVERVIEW")
+    out = section_lines("SIMULATION RUNS OVERVIEW")
     
     cursor = conn.cursor()
     cursor.execute('''
@@ -33,213 +147,166 @@ def analyze_simulation_runs(conn):
     
     runs = cursor.fetchall()
     for run in runs:
-        print(f"\n🔹 Run: {run[0]}")
-        print(f"   Started: {run[1]}")
-        print(f"   Ended: {run[2]}")
-        print(f"   Steps: {run[3]}")
-        print(f"   Commuters: {run[4]}")
-        print(f"   Providers: {run[5]}")
-        print(f"   Network: {run[6]}")
-        print(f"   Status: {run[7]}")
+        out.append(f"\n🔹 Run: {run[0]}")
+        out.append(f"   Started: {run[1]}")
+        out.append(f"   Ended: {run[2]}")
+        out.append(f"   Steps: {run[3]}")
+        out.append(f"   Commuters: {run[4]}")
+        out.append(f"   Providers: {run[5]}")
+        out.append(f"   Network: {run[6]}")
+        out.append(f"   Status: {run[7]}")
+    write_lines(out)
     
     return [run[0] for run in runs]
 
-def analyze_mode_usage(conn, run_id):
+# Per-run analyzers take (cursor, run_id) and return their section's report lines
+
+def analyze_mode_usage(cursor, run_id):
     """Analyze mode usage metrics"""
-    print_section(f"MODE USAGE ANALYSIS - {run_id}")
+    out = section_lines(f"MODE USAGE ANALYSIS - {run_id}")
 
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT mode, total_trips, total_revenue, average_price,
-               utilization_rate, peak_demand_tick, peak_demand_count
-        FROM mode_usage_metrics
-        WHERE run_id = ?
-        ORDER BY total_revenue DESC
-    ''', (run_id,))
+    # Totals and market share are computed by SQLite alongside each row
+    cursor.execute(MODE_USAGE_SQL, (run_id,))
     
-    modes = cursor.fetchall()
+    modes = cursor.fetchmany()
     
     if modes:
-        total_trips = sum(m[1] for m in modes)
-        total_revenue = sum(m[2] for m in modes)
+        total_trips = modes[0][7]
+        total_revenue = modes[0][8]
         
-        print(f"\n📈 Total Trips: {total_trips}")
-        print(f"💰 Total Revenue: ${total_revenue:.2f}")
-        print(f"\n{'Mode':<15} {'Trips':<10} {'Revenue':<15} {'Avg Price':<15} {'Market Share':<15}")
-        print("-" * 70)
+        out.append(f"\n📈 Total Trips: {total_trips}")
+        out.append(f"💰 Total Revenue: ${total_revenue:.2f}")
+        out.append(f"\n{'Mode':<15} {'Trips':<10} {'Revenue':<15} {'Avg Price':<15} {'Market Share':<15}")
+        out.append("-" * 70)
         
-        for mode in modes:
-            market_share = (mode[1] / total_trips * 100) if total_trips > 0 else 0
-            print(f"{mode[0]:<15} {mode[1]:<10} ${mode[2]:<14.2f} ${mode[3]:<14.2f} {market_share:<14.1f}%")
+        while modes:
+            for mode in modes:
+                out.append(MODE_ROW(mode[0], mode[1], mode[2], mode[3], mode[9]))
+            modes = cursor.fetchmany()
     else:
-        print("\n⚠️  No mode usage data available")
+        out.append("\n⚠️  No mode usage data available")
+    return out
 
-def analyze_bundle_performance(conn, run_id):
+def analyze_bundle_performance(cursor, run_id):
     """Analyze bundle performance metrics"""
-    print_section(f"BUNDLE PERFORMANCE ANALYSIS - {run_id}")
+    out = section_lines(f"BUNDLE PERFORMANCE ANALYSIS - {run_id}")
 
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT total_bundles_created, total_bundles_reserved,
-               bundle_reservation_rate, average_discount_percentage, total_discount_given,
-               popular_mode_combinations, average_segments_per_bundle,
-               total_bundle_revenue, average_bundle_price
-        FROM bundle_performance_metrics
-        WHERE run_id = ?
-    ''', (run_id,))
+    cursor.execute(BUNDLE_PERFORMANCE_SQL, (run_id,))
 
     bundle_data = cursor.fetchone()
 
     if bundle_data:
-        print(f"\n🎫 Total Bundles Created: {bundle_data[0]}")
-        print(f"✅ Total Bundles Reserved: {bundle_data[1]}")
-        print(f"📊 Bundle Reservation Rate: {bundle_data[2]:.2f}%")
-        print(f"💵 Average Discount Percentage: {bundle_data[3]:.2f}%")
-        print(f"💰 Total Discount Given: ${bundle_data[4]:.2f}")
-        print(f"🌟 Popular Mode Combinations: {bundle_data[5]}")
-        print(f"📈 Average Segments per Bundle: {bundle_data[6]:.2f}")
-        print(f"💵 Total Bundle Revenue: ${bundle_data[7]:.2f}")
-        print(f"💵 Average Bundle Price: ${bundle_data[8]:.2f}")
+        out.append(f"\n🎫 Total Bundles Created: {bundle_data[0]}")
+        out.append(f"✅ Total Bundles Reserved: {bundle_data[1]}")
+        out.append(f"📊 Bundle Reservation Rate: {bundle_data[2]:.2f}%")
+        out.append(f"💵 Average Discount Percentage: {bundle_data[3]:.2f}%")
+        out.append(f"💰 Total Discount Given: ${bundle_data[4]:.2f}")
+        out.append(f"🌟 Popular Mode Combinations: {bundle_data[5]}")
+        out.append(f"📈 Average Segments per Bundle: {bundle_data[6]:.2f}")
+        out.append(f"💵 Total Bundle Revenue: ${bundle_data[7]:.2f}")
+        out.append(f"💵 Average Bundle Price: ${bundle_data[8]:.2f}")
         
         # Get actual bundles
-        cursor.execute('''
-            SELECT bundle_id, final_price, discount_amount, num_segments
-            FROM bundles
-            WHERE run_id = ?
-        ''', (run_id,))
+        cursor.execute(BUNDLES_SQL, (run_id,))
 
         bundles = cursor.fetchall()
         if bundles:
-            print(f"\n📦 Bundle Details:")
+            out.append(f"\n📦 Bundle Details:")
             for bundle in bundles:
-                print(f"   • Bundle {bundle[0]}: ${bundle[1]:.2f} (discount: ${bundle[2]:.2f}, segments: {bundle[3]})")
+                out.append(f"   • Bundle {bundle[0]}: ${bundle[1]:.2f} (discount: ${bundle[2]:.2f}, segments: {bundle[3]})")
     else:
-        print("\n⚠️  No bundle performance data available")
+        out.append("\n⚠️  No bundle performance data available")
+    return out
 
-def analyze_gas_metrics(conn, run_id):
+def analyze_gas_metrics(cursor, run_id):
     """Analyze gas usage metrics"""
-    print_section(f"GAS METRICS ANALYSIS - {run_id}")
+    out = section_lines(f"GAS METRICS ANALYSIS - {run_id}")
     
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT tick, total_gas_used, total_gas_cost, average_gas_price,
-               total_transactions, successful_transactions, failed_transactions,
-               registration_txs, request_txs, offer_txs, match_txs,
-               nft_mint_txs, nft_list_txs, nft_purchase_txs
-        FROM gas_metrics
-        WHERE run_id = ?
-        ORDER BY tick
-    ''', (run_id,))
+    cursor.execute(GAS_METRICS_SQL, (run_id,))
     
-    gas_data = cursor.fetchall()
+    # Stream rows from the cursor instead of materializing them with fetchall()
+    any_rows = False
+    for data in cursor:
+        any_rows = True
+        out.append(GAS_TICK_BLOCK(*data))
     
-    if gas_data:
-        for data in gas_data:
-            print(f"\n⛽ Tick {data[0]}:")
-            print(f"   Total Gas Used: {data[1]:,}")
-            print(f"   Total Gas Cost: {data[2]:,} wei")
-            print(f"   Average Gas Price: {data[3]:,} wei")
-            print(f"   Total Transactions: {data[4]}")
-            print(f"   Successful: {data[5]} | Failed: {data[6]}")
-            print(f"   Transaction Breakdown:")
-            print(f"      - Registrations: {data[7]}")
-            print(f"      - Requests: {data[8]}")
-            print(f"      - Offers: {data[9]}")
-            print(f"      - Matches: {data[10]}")
-            print(f"      - NFT Mints: {data[11]}")
-            print(f"      - NFT Lists: {data[12]}")
-            print(f"      - NFT Purchases: {data[13]}")
-    else:
-        print("\n⚠️  No gas metrics data available (blockchain stats not tracked)")
+    if not any_rows:
+        out.append("\n⚠️  No gas metrics data available (blockchain stats not tracked)")
+    return out
 
-def analyze_requests(conn, run_id):
+def analyze_requests(cursor, run_id):
     """Analyze travel requests"""
-    print_section(f"TRAVEL REQUESTS ANALYSIS - {run_id}")
+    out = section_lines(f"TRAVEL REQUESTS ANALYSIS - {run_id}")
 
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT COUNT(*) as total,
-               AVG(final_price) as avg_price,
-               MIN(final_price) as min_price,
-               MAX(final_price) as max_price
-        FROM requests
-        WHERE run_id = ? AND final_price IS NOT NULL
-    ''', (run_id,))
-
-    stats = cursor.fetchone()
-
-    if stats and stats[0] > 0:
-        print(f"\n📊 Request Statistics:")
-        print(f"   Total Matched Requests: {stats[0]}")
-        print(f"   Average Price: ${stats[1]:.2f}")
-        print(f"   Min Price: ${stats[2]:.2f}")
-        print(f"   Max Price: ${stats[3]:.2f}")
-        
-        # Get request status breakdown
-        cursor.execute('''
-            SELECT status, COUNT(*) as count
-            FROM requests
-            WHERE run_id = ?
-            GROUP BY status
-        ''', (run_id,))
+    cursor.execute(REQUESTS_SQL, {'run_id': run_id})
+
+    # First row is the run-wide rollup of matched prices, then one row per status
+    stats, *status_breakdown = cursor.fetchall()
+
+    if stats[2] > 0:
+        out.append(f"\n📊 Request Statistics:")
+        out.append(f"   Total Matched Requests: {stats[2]}")
+        out.append(f"   Average Price: ${stats[3]:.2f}")
+        out.append(f"   Min Price: ${stats[4]:.2f}")
+        out.append(f"   Max Price: ${stats[5]:.2f}")
         
-        status_breakdown = cursor.fetchall()
-        print(f"\n📋 Request Status Breakdown:")
-        for status, count in status_breakdown:
-            print(f"   {status}: {count}")
+        out.append(f"\n📋 Request Status Breakdown:")
+        for _, status, count, *_ in status_breakdown:
+            out.append(f"   {status}: {count}")
     else:
-        print("\n⚠️  No request data available")
+        out.append("\n⚠️  No request data available")
+    return out
 
-def analyze_providers(conn, run_id):
+def analyze_providers(cursor, run_id):
     """Analyze provider performance"""
-    print_section(f"PROVIDER PERFORMANCE ANALYSIS - {run_id}")
+    out = section_lines(f"PROVIDER PERFORMANCE ANALYSIS - {run_id}")
 
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT agent_id, mode,
-               total_revenue, successful_matches, avg_price, utilization_rate
-        FROM providers
-        WHERE run_id = ?
-        ORDER BY total_revenue DESC
-    ''', (run_id,))
-
-    providers = cursor.fetchall()
-
-    if providers:
-        print(f"\n{'Agent ID':<15} {'Mode':<10} {'Revenue':<15} {'Matches':<10} {'Avg Price':<15} {'Utilization':<15}")
-        print("-" * 80)
-
-        for provider in providers:
-            util_rate = f"{provider[5]:.1f}%" if provider[5] is not None else "N/A"
-            avg_price = f"${provider[4]:.2f}" if provider[4] is not None else "N/A"
-            print(f"{provider[0]:<15} {provider[1]:<10} ${provider[2]:<14.2f} {provider[3]:<10} {avg_price:<15} {util_rate:<15}")
+    providers = pd.read_sql_query(PROVIDERS_SQL, cursor.connection, params=(run_id,))
+
+    if not providers.empty:
+        out.append(f"\n{'Agent ID':<15} {'Mode':<10} {'Revenue':<15} {'Matches':<10} {'Avg Price':<15} {'Utilization':<15}")
+        out.append("-" * 80)
+
+        # Whole columns are formatted at once, then joined into rows
+        rows = (format_column(providers['agent_id'], '{}', 15)
+                + ' ' + format_column(providers['mode'], '{}', 10)
+                + ' $' + format_column(providers['total_revenue'], '{:.2f}', 14)
+                + ' ' + format_column(providers['successful_matches'], '{}', 10)
+                + ' ' + format_column(providers['avg_price'], '${:.2f}', 15)
+                + ' ' + format_column(providers['utilization_rate'], '{:.1f}%', 15))
+        out.extend(rows)
     else:
-        print("\n⚠️  No provider data available")
+        out.append("\n⚠️  No provider data available")
+    return out
 
-def analyze_commuters(conn, run_id):
+def analyze_commuters(cursor, run_id):
     """Analyze commuter behavior"""
-    print_section(f"COMMUTER BEHAVIOR ANALYSIS - {run_id}")
+    out = section_lines(f"COMMUTER BEHAVIOR ANALYSIS - {run_id}")
 
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT agent_id, total_spent, successful_trips, total_requests, avg_wait_time
-        FROM commuters
-        WHERE run_id = ?
-        ORDER BY total_spent DESC
-        LIMIT 10
-    ''', (run_id,))
-
-    commuters = cursor.fetchall()
-
-    if commuters:
-        print(f"\n{'Agent ID':<15} {'Total Spent':<15} {'Trips':<10} {'Requests':<10} {'Avg Wait':<15}")
-        print("-" * 65)
-
-        for commuter in commuters:
-            wait_time = f"{commuter[4]:.2f}s" if commuter[4] is not None else "N/A"
-            print(f"{commuter[0]:<15} ${commuter[1]:<14.2f} {commuter[2]:<10} {commuter[3]:<10} {wait_time:<15}")
+    commuters = pd.read_sql_query(COMMUTERS_SQL, cursor.connection, params=(run_id,))
+
+    if not commuters.empty:
+        out.append(f"\n{'Agent ID':<15} {'Total Spent':<15} {'Trips':<10} {'Requests':<10} {'Avg Wait':<15}")
+        out.append("-" * 65)
+
+        rows = (format_column(commuters['agent_id'], '{}', 15)
+                + ' $' + format_column(commuters['total_spent'], '{:.2f}', 14)
+                + ' ' + format_column(commuters['successful_trips'], '{}', 10)
+                + ' ' + format_column(commuters['total_requests'], '{}', 10)
+                + ' ' + format_column(commuters['avg_wait_time'], '{:.2f}s', 15))
+        out.extend(rows)
     else:
-        print("\n⚠️  No commuter data available")
+        out.append("\n⚠️  No commuter data available")
+    return out
+
+RUN_ANALYZERS = (
+    analyze_mode_usage,
+    analyze_bundle_performance,
+    analyze_gas_metrics,
+    analyze_requests,
+    analyze_providers,
+    analyze_commuters,
+)
 
 def generate_summary_report(conn):
     """Generate a comprehensive summary report"""
@@ -259,13 +326,27 @@ def generate_summary_report(conn):
     
     print(f"\n📊 Analysis for Run: {run_id}")
     
-    # Analyze all aspects
-    analyze_mode_usage(conn, run_id)
-    analyze_bundle_performance(conn, run_id)
-    analyze_gas_metrics(conn, run_id)
-    analyze_requests(conn, run_id)
-    analyze_providers(conn, run_id)
-    analyze_commuters(conn, run_id)
+    # Analyzers are independent, so each runs in its own worker process with its
+    # own connection (readers don't block each other); map keeps section order.
+    # Workers are spawned, not forked: an SQLite connection must not cross fork()
+    with multiprocessing.get_context('spawn').Pool(len(RUN_ANALYZERS)) as pool:
+        sections = pool.map(_run_analyzer, [(analyzer, run_id) for analyzer in RUN_ANALYZERS])
+
+    for lines in sections:
+        write_lines(lines)
+
+def _run_analyzer(job):
+    """Pool worker: run one analyzer on this process's connection and return its lines"""
+    analyzer, run_id = job
+    conn = connect_db()
+    cursor = conn.cursor()
+    cursor.arraysize = FETCH_BATCH_SIZE
+    # One read snapshot for all of the analyzer's queries
+    cursor.execute('BEGIN DEFERRED')
+    try:
+        return analyzer(cursor, run_id)
+    finally:
+        conn.execute('COMMIT')
 
 def main():
     """Main analysis function"""
@@ -273,31 +354,28 @@ def main():
     print("🔬 MAAS DECENTRALIZED SIMULATION - COMPREHENSIVE DATA ANALYSIS")
     print("="*100)
     
+    # Shared per-process connection; closed by the atexit hook in connect_db
     conn = connect_db()
     
-    try:
-        # Analyze all runs
-        run_ids = analyze_simulation_runs(conn)
-        
-        if run_ids:
-            # Generate detailed report for latest run
-            generate_summary_report(conn)
-            
-            print("\n" + "="*100)
-            print("✅ ANALYSIS COMPLETE")
-            print("="*100)
-            print("\n💡 Tips:")
-            print("   • Run more simulations to collect more data")
-            print("   • Use SQL queries to create custom analyses")
-            print("   • Export data to CSV for visualization in Excel/Python")
-            print("   • Check blockchain tables for transaction data")
-            print("\n")
-        else:
-            print("\n⚠️  No simulation runs found in database")
-            print("   Run a simulation first: python abm/agents/run_decentralized_model.py --export-db")
+    # Analyze all runs
+    run_ids = analyze_simulation_runs(conn)
     
-    finally:
-        conn.close()
+    if run_ids:
+        # Generate detailed report for latest run
+        generate_summary_report(conn)
+        
+        print("\n" + "="*100)
+        print("✅ ANALYSIS COMPLETE")
+        print("="*100)
+        print("\n💡 Tips:")
+        print("   • Run more simulations to collect more data")
+        print("   • Use SQL queries to create custom analyses")
+        print("   • Export data to CSV for visualization in Excel/Python")
+        print("   • Check blockchain tables for transaction data")
+        print("\n")
+    else:
+        print("\n⚠️  No simulation runs found in database")
+        print("   Run a simulation first: python abm/agents/run_decentralized_model.py --export-db")
 
 if __name__ == "__main__":
     main()
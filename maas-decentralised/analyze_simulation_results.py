@@ -48,11 +48,11 @@ def analyze_blockchain_transactions():
     try:
         # Initialize blockchain interface
         blockchain = BlockchainInterface(async_mode=False)
-        print(f"✅ Blockchain connected: {blockchain.w3.is_connected()}")
-        print(f"📊 Latest block: {blockchain.w3.eth.block_number}")
         
-        # Get comprehensive statistics
-        stats = blockchain.get_blockchain_summary()
+        # Get comprehensive statistics and node status in one round trip
+        stats = blockchain.batch_summary()
+        print(f"✅ Blockchain connected: {stats.get('blockchain_connected')}")
+        print(f"📊 Latest block: {stats.get('block_number')}")
         
         print("\n📈 BLOCKCHAIN STATISTICS:")
         print(f"   • Total transactions: {stats.get('total_transactions', 0)}")
@@ -7,6 +7,7 @@ Bridges React frontend with Python simulation engine
 import os
 import sys
 import json
+import functools
 import threading
 import subprocess
 import time
@@ -84,7 +85,7 @@ def get_system_status():
     blockchain_connected = False
     if blockchain_interface:
         try:
-            blockchain_connected = blockchain_interface.w3.is_connected()
+            blockchain_connected = blockchain_interface.node_status()['connected']
         except:
             blockchain_connected = False
 
@@ -326,7 +327,32 @@ def run_real_simulation(total_steps, commuters, providers, no_plots=False, expor
 @app.route('/api/analytics/metrics', methods=['GET'])
 def get_simulation_metrics():
     """Get simulation metrics and analytics."""
+    global _kpi_cache
     adv = latest_results.get('advanced_metrics') if isinstance(latest_results, dict) else None
+    if adv:
+        finished_at = latest_results.get('finished_at')
+        if finished_at in _kpi_cache:
+            kpis = _kpi_cache[finished_at]
+        else:
+            kpis = _simulation_kpis(adv)
+            _kpi_cache = {finished_at: kpis}
+        if kpis is not None:
+            return jsonify({ **kpis, 'advanced': adv })
+    # Fallback placeholders
+    return jsonify({
+        'total_agents': 0,
+        'active_requests': 0,
+        'completed_matches': 0,
+        'blockchain_transactions': 0,
+        'success_rate': 0,
+        'avg_response_time': 0
+    })
+
+# KPIs of the latest run, keyed by its finished_at: {finished_at: kpis}
+_kpi_cache = {}
+
+def _simulation_kpis(adv):
+    """KPIs derived from a run's advanced metrics, or None if they can't be computed."""
     if adv:
         try:
             total_requests = int(adv.get('total_requests', 0))
@@ -367,19 +393,11 @@ def get_simulation_metrics():
                 'success_rate': round(success_rate, 2),
                 'avg_response_time': avg_response_time
             }
-            return jsonify({ **kpis, 'advanced': adv })
+            return kpis
         except Exception as e:
             print(f"Error calculating metrics: {e}")
             pass
-    # Fallback placeholders
-    return jsonify({
-        'total_agents': 0,
-        'active_requests': 0,
-        'completed_matches': 0,
-        'blockchain_transactions': 0,
-        'success_rate': 0,
-        'avg_response_time': 0
-    })
+    return None
 
 @app.route('/api/results/log', methods=['GET'])
 def get_results_log():
@@ -443,10 +461,12 @@ def get_blockchain_status():
         return jsonify({'error': 'Blockchain not initialized'}), 500
 
     try:
-        connected = blockchain_interface.w3.is_connected()
+        # Batched and cached for a couple of seconds by the interface
+        status = blockchain_interface.node_status()
+        connected = status['connected']
         if connected:
-            latest_block = blockchain_interface.w3.eth.block_number
-            network_id = blockchain_interface.w3.net.version
+            latest_block = status['block_number']
+            network_id = status['net_version']
         else:
             latest_block = 0
             network_id = 'unknown'
@@ -464,14 +484,18 @@ def get_blockchain_status():
 def get_contract_addresses():
     """Get deployed contract addresses"""
     try:
-        with open('deployment-info.json', 'r') as f:
-            contracts = json.load(f)
-        return jsonify(contracts)
+        return jsonify(_load_contract_addresses(os.stat('deployment-info.json').st_mtime))
     except FileNotFoundError:
         return jsonify({'error': 'Contracts not deployed'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@functools.lru_cache(maxsize=1)
+def _load_contract_addresses(mtime):
+    """Read deployment-info.json; keyed on its mtime so a redeploy is picked up"""
+    with open('deployment-info.json', 'r') as f:
+        return json.load(f)
+
 @app.route('/api/blockchain/transactions/recent', methods=['GET'])
 def get_recent_transactions():
     """Get recent blockchain transactions"""
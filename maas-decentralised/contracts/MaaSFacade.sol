@@ -39,6 +39,14 @@ contract MaaSFacade {
         registry.registerCommuter(commuterId, account);
     }
 
+    /// @notice Register many commuters in one transaction (ids[i] -> accounts[i])
+    function multiRegisterCommuter(uint256[] calldata commuterIds, address[] calldata accounts) external onlyOwner {
+        require(commuterIds.length == accounts.length, "length");
+        for (uint256 i = 0; i < commuterIds.length; i++) {
+            registry.registerCommuter(commuterIds[i], accounts[i]);
+        }
+    }
+
     function registerAsProvider(uint256 providerId, address account, uint8 mode) external onlyOwner {
         registry.registerProvider(providerId, account, mode);
     }
@@ -30,8 +30,7 @@ try:
     
     # Test event monitoring (just check it's running)
     print("\n3. Checking event monitoring...")
-    print(f"   ✅ Event thread running: {blockchain.event_thread.is_alive()}")
-    print(f"   ✅ Cleanup thread running: {blockchain.cleanup_thread.is_alive()}")
+    print(f"   ✅ Monitor thread running: {blockchain.monitor_thread.is_alive()}")
     print(f"   ✅ Event subscriptions: {len(blockchain.event_subscriptions)}")
     
     # Test async transaction submission (if contracts are available)